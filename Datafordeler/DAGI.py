@@ -6,18 +6,19 @@ With QGIS : 34000
 """
 
 from qgis.core import (
-    QgsProcessing,
-    QgsProcessingAlgorithm,
-    QgsProcessingMultiStepFeedback,
+    QgsProcessingParameterBoolean,
     QgsProcessingParameterString,
     QgsProcessingParameterEnum,
     QgsProcessingParameterFeatureSink,
     QgsSettings
 )
-import processing
 
+from .pipeline import DatafordelerAlgorithm
 
-class DAGI(QgsProcessingAlgorithm):
+
+class DAGI(DatafordelerAlgorithm):
+
+    REGISTER = 'DAGI'
 
     ENTITIES = [
         'Sogneinddeling', 'Samlepostnummer', 'Retskreds', 'Regionsinddeling',
@@ -49,7 +50,8 @@ class DAGI(QgsProcessingAlgorithm):
                 'entity',
                 'Entity',
                 options=self.ENTITIES,
-                allowMultiple=False
+                allowMultiple=True,
+                optional=True
             )
         )
 
@@ -62,6 +64,14 @@ class DAGI(QgsProcessingAlgorithm):
             )
         )
 
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                'usecache',
+                'Reuse cached download when unchanged',
+                defaultValue=True
+            )
+        )
+
         self.addParameter(
             QgsProcessingParameterFeatureSink(
                 'Output',
@@ -69,86 +79,7 @@ class DAGI(QgsProcessingAlgorithm):
             )
         )
 
-    # -------------------------
-    # MAIN PROCESSING
-    # -------------------------
-    def processAlgorithm(self, parameters, context, model_feedback):
-
-        feedback = QgsProcessingMultiStepFeedback(3, model_feedback)
-
-        # Build URL safely
-        entity = self.ENTITIES[parameters['entity']]
-        dtype = self.TYPES[parameters['type']]
-        apikey = parameters['apikey']
-
-        url = (
-            f"https://api.datafordeler.dk/FileDownloads/GetFile"
-            f"?Register=DAGI"
-            f"&type={dtype}"
-            f"&LatestTotalForEntity={entity}"
-            f"&format=gpkg"
-            f"&apiKey={apikey}"
-        )
-
-        feedback.pushInfo(f"Requesting: {url}")
-
-        # STEP 1 – Download
-        alg_params = {
-            'DATA': '',
-            'METHOD': 0,  # GET
-            'URL': url,
-            'OUTPUT': QgsProcessing.TEMPORARY_OUTPUT
-        }
-
-        outputs = {}
-        outputs['Download'] = processing.run(
-            'native:filedownloader',
-            alg_params,
-            context=context,
-            feedback=feedback,
-            is_child_algorithm=True
-        )
-
-        if feedback.isCanceled():
-            return {}
-
-        feedback.setCurrentStep(1)
-
-        # STEP 2 – Unzip
-        alg_params = {
-            'DIST': '',
-            'Zipfile': outputs['Download']['OUTPUT']
-        }
-
-        outputs['Unzip'] = processing.run(
-            'KORTxyz:Unzipper',
-            alg_params,
-            context=context,
-            feedback=feedback,
-            is_child_algorithm=True
-        )
-
-        if feedback.isCanceled():
-            return {}
-
-        feedback.setCurrentStep(2)
-
-        # STEP 3 – Load GPKG into output sink
-        alg_params = {
-            'INPUT': outputs['Unzip']['FIRSTFILE'],
-            'NAME': entity,
-            'OUTPUT': parameters['Output']
-        }
-
-        outputs['OutputLayer'] = processing.run(
-            'native:loadlayer',
-            alg_params,
-            context=context,
-            feedback=feedback,
-            is_child_algorithm=True
-        )
-
-        return {'Output': outputs['OutputLayer']['OUTPUT']}
+        self.add_batch_parameters()
 
     # -------------------------
     # METADATA
@@ -159,11 +90,5 @@ class DAGI(QgsProcessingAlgorithm):
     def displayName(self):
         return 'Download DAGI'
 
-    def group(self):
-        return 'Datafordeler'
-
-    def groupId(self):
-        return 'Datafordeler'
-
     def createInstance(self):
         return DAGI()
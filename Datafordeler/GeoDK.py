@@ -5,23 +5,30 @@ Group : ETL
 With QGIS : 34000
 """
 
+import sqlite3
+
 from qgis.core import (
-    QgsProcessing,
-    QgsProcessingAlgorithm,
-    QgsProcessingMultiStepFeedback,
+    QgsFeatureRequest,
+    QgsProcessingException,
+    QgsProcessingParameterBoolean,
     QgsProcessingParameterString,
     QgsProcessingParameterEnum,
     QgsProcessingParameterFeatureSink,
     QgsProcessingParameterExtent, 
-    QgsSettings
+    QgsProcessingUtils,
+    QgsSettings,
+    QgsVectorFileWriter
 )
 
-from qgis.core import QgsRectangle, QgsGeometry
+from qgis.core import QgsGeometry, QgsVectorLayer
+
+from ..ETL.gpkg_index import bbox_filter, geometry_table
+from .pipeline import DatafordelerAlgorithm
 
-import processing
 
+class GeoDK(DatafordelerAlgorithm):
 
-class GeoDK(QgsProcessingAlgorithm):
+    REGISTER = 'GEODKV'
 
     ENTITIES = [
         'Afvandingsgroeft','AnlaegDiverse','BadeBaadebro','Bassin','Begravelsesomraade',
@@ -39,6 +46,7 @@ class GeoDK(QgsProcessingAlgorithm):
     ]
 
     TYPES = ['current', 'bitemporal', 'temporal']
+    SPATIAL_INDEX = True
 
     # -------------------------
     # INIT PARAMETERS
@@ -59,7 +67,9 @@ class GeoDK(QgsProcessingAlgorithm):
             QgsProcessingParameterEnum(
                 'entity',
                 'Entity',
-                options=self.ENTITIES
+                options=self.ENTITIES,
+                allowMultiple=True,
+                optional=True
             )
         )
 
@@ -71,6 +81,14 @@ class GeoDK(QgsProcessingAlgorithm):
             )
         )
 
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                'usecache',
+                'Reuse cached download when unchanged',
+                defaultValue=True
+            )
+        )
+
         self.addParameter(
             QgsProcessingParameterFeatureSink(
                 'Output',
@@ -85,134 +103,142 @@ class GeoDK(QgsProcessingAlgorithm):
                     optional=True
                 )
         )
-    # -------------------------
-    # MAIN PROCESSING
-    # -------------------------
-    def processAlgorithm(self, parameters, context, model_feedback):
-        feedback = QgsProcessingMultiStepFeedback(3, model_feedback)
-        outputs = {}
-
-        # Resolve selected values
-        entity = self.ENTITIES[parameters['entity']]
-        dtype = self.TYPES[parameters['type']]
-        apikey = parameters['apikey']
-
-        # Build URL safely
-        url = (
-            f"https://api.datafordeler.dk/FileDownloads/GetFile?"
-            f"Register=GEODKV"
-            f"&type={dtype}"
-            f"&LatestTotalForEntity={entity}"
-            f"&format=gpkg"
-            f"&apiKey={apikey}"
-        )
 
-        feedback.pushInfo(f"Calling URL: {url}")
-
-        # -------------------------
-        # STEP 1 — Download
-        # -------------------------
-        alg_params = {
-            'DATA': '',
-            'METHOD': 0,  # GET
-            'URL': url,
-            'OUTPUT': QgsProcessing.TEMPORARY_OUTPUT
-        }
-
-        outputs['Download'] = processing.run(
-            'native:filedownloader',
-            alg_params,
-            context=context,
-            feedback=feedback,
-            is_child_algorithm=True
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                'CLIP_EXACT',
+                'Keep only features that intersect the clip extent, not just their bounding boxes',
+                defaultValue=True
+            )
         )
 
-        if feedback.isCanceled():
-            return {}
-        feedback.setCurrentStep(1)
+        self.add_batch_parameters()
 
-        # -------------------------
-        # STEP 2 — Unzip
-        # -------------------------
-        alg_params = {
-            'DIST': '',
-            'Zipfile': outputs['Download']['OUTPUT']
-        }
-
-        outputs['Unzip'] = processing.run(
-            'KORTxyz:Unzipper',
-            alg_params,
-            context=context,
-            feedback=feedback,
-            is_child_algorithm=True
+    # -------------------------
+    # CLIP
+    # -------------------------
+    def clips_extent(self, parameters):
+        return bool(parameters.get('CLIP_EXTENT'))
+
+    def clip_layer(self, gpkg_path, entity, parameters, context):
+        """
+        Open the entity's table narrowed to the clip extent, or return None
+        when no extent is set.
+
+        Returns (layer, extent in the layer's CRS, indexed). With the
+        GeoPackage's R-tree the layer is a subset that SQLite answers from
+        the index, so rows outside the extent are never read; without one
+        the layer is the whole table.
+        """
+        if not self.clips_extent(parameters):
+            return None
+
+        try:
+            table = geometry_table(gpkg_path)
+        except sqlite3.DatabaseError as e:
+            raise QgsProcessingException(f"Failed to read GeoPackage: {gpkg_path} ({e})")
+        if table is None:
+            raise QgsProcessingException(f"No feature table in {gpkg_path}")
+        name, column, pk, indexed = table
+
+        uri = f"{gpkg_path}|layername={name}"
+        layer = QgsVectorLayer(uri, entity, "ogr")
+        if not layer.isValid():
+            raise QgsProcessingException(f"Failed to open layer: {uri}")
+
+        extent = self.parameterAsExtent(parameters, 'CLIP_EXTENT', context, layer.crs())
+        if indexed:
+            bbox = bbox_filter(
+                name, column, pk,
+                extent.xMinimum(), extent.yMinimum(), extent.xMaximum(), extent.yMaximum()
+            )
+            layer = QgsVectorLayer(f"{uri}|subset={bbox}", entity, "ogr")
+            if not layer.isValid():
+                raise QgsProcessingException(f"Failed to filter {uri} on its R-tree")
+
+        return layer, extent, indexed
+
+    def clip_filter(self, clip, parameters, context):
+        """
+        The request and per-feature test that keep the clipped features:
+        the exact intersection test only when CLIP_EXACT is set, and a
+        bounding-box filter only when the R-tree has not already applied it.
+        """
+        layer, extent, indexed = clip
+
+        accept = None
+        if self.parameterAsBoolean(parameters, 'CLIP_EXACT', context):
+            engine = QgsGeometry.createGeometryEngine(QgsGeometry.fromRect(extent).constGet())
+            engine.prepareGeometry()
+
+            def accept(feature):
+                return feature.hasGeometry() and engine.intersects(feature.geometry().constGet())
+
+        # Without an index OGR still filters on the bounding boxes while it
+        # scans, which beats copying the table first
+        request = QgsFeatureRequest()
+        if not indexed:
+            request.setFilterRect(extent)
+
+        return request, accept
+
+    def clip_to_sink(self, clip, parameters, context, feedback):
+        """Stream the clipped features into the Output sink; return its id."""
+        layer, extent, indexed = clip
+        request, accept = self.clip_filter(clip, parameters, context)
+
+        total = layer.featureCount()
+        feedback.pushInfo(
+            f"{total} candidate features from the R-tree" if indexed
+            else "No R-tree in the GeoPackage, scanning the table"
         )
 
-        if feedback.isCanceled():
-            return {}
-        feedback.setCurrentStep(2)
+        dest_id, written = self.write_to_sink(layer, parameters, context, feedback, request, accept, total)
+        feedback.pushInfo(f"Wrote {written} features inside the clip extent")
 
-       
-        # -------------------------
-        # STEP 3 — Create spatial index inside the GPKG file
-        # -------------------------
-        alg_params = {
-            'INPUT': outputs['Unzip']['FIRSTFILE']
-        }
-
-        outputs['SpatialIndex'] = processing.run(
-            'native:createspatialindex',
-            alg_params,
-            context=context,
-            feedback=feedback,
-            is_child_algorithm=True
+        return dest_id
+
+    # -------------------------
+    # LOAD
+    # -------------------------
+    def layer_source(self, gpkg_path, entity, parameters, context, feedback):
+        clip = self.clip_layer(gpkg_path, entity, parameters, context)
+        if clip is None:
+            return super().layer_source(gpkg_path, entity, parameters, context, feedback)
+
+        # Batch mode has no Output sink, so the clipped features go to a
+        # temporary GeoPackage through the same batched filter; a subset on
+        # the cached file would let edits reach the cache
+        layer = clip[0]
+        request, accept = self.clip_filter(clip, parameters, context)
+        path = QgsProcessingUtils.generateTempFilename(f"{entity}.gpkg")
+        options = QgsVectorFileWriter.SaveVectorOptions()
+        options.driverName = 'GPKG'
+        options.layerName = entity
+        writer = QgsVectorFileWriter.create(
+            path, layer.fields(), layer.wkbType(), layer.crs(), context.transformContext(), options
         )
+        if writer.hasError() != QgsVectorFileWriter.NoError:
+            raise QgsProcessingException(f"Failed to create {path}: {writer.errorMessage()}")
 
+        written = self.write_features(writer, layer, feedback, request, accept)
+        # Deleting the writer closes the file
+        del writer
         if feedback.isCanceled():
-            return {}
-        feedback.setCurrentStep(3)
+            return None
+        feedback.pushInfo(f"{entity}: {written} features inside the clip extent")
 
-        # -------------------------
-        # STEP 4 — Clip Extent
-        # -------------------------
-        clip_extent = parameters['CLIP_EXTENT']
-
-        if clip_extent:
-
-            clip_params = {
-                'INPUT': outputs['SpatialIndex']['OUTPUT'],
-                'EXTENT': clip_extent,
-                'OUTPUT': QgsProcessing.TEMPORARY_OUTPUT
-            }
-            clipped = processing.run(
-                'native:extractbyextent',
-                clip_params,
-                context=context,
-                feedback=feedback,
-                is_child_algorithm=True
-            )
+        return path
 
-            result_layer = clipped['OUTPUT']
-        else:
-            result_layer = outputs['Unzip']['FIRSTFILE']
+    def load(self, gpkg_path, entity, parameters, context, feedback):
+        clip = self.clip_layer(gpkg_path, entity, parameters, context)
+        if clip is not None:
+            return {'Output': self.clip_to_sink(clip, parameters, context, feedback)}
 
         # -------------------------
-        # STEP 5 — Load layer into QGIS
+        # Load layer into QGIS
         # -------------------------
-        alg_params = {
-            'INPUT': result_layer,
-            'NAME': entity,
-            'OUTPUT': parameters['Output']
-        }
-
-        outputs['Load'] = processing.run(
-            'native:loadlayer',
-            alg_params,
-            context=context,
-            feedback=feedback,
-            is_child_algorithm=True
-        )
-
-        return result_layer
+        return super().load(gpkg_path, entity, parameters, context, feedback)
 
     # -------------------------
     # METADATA
@@ -223,11 +249,5 @@ class GeoDK(QgsProcessingAlgorithm):
     def displayName(self):
         return 'Download GeoDanmark'
 
-    def group(self):
-        return 'Datafordeler'
-
-    def groupId(self):
-        return 'Datafordeler'
-
     def createInstance(self):
         return GeoDK()
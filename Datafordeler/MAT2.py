@@ -5,76 +5,105 @@ Group : ETL
 With QGIS : 34000
 """
 
+import os
+import re
+import shutil
+
+from osgeo import gdal
 from qgis.core import ( 
     QgsProcessing,
-    QgsProcessingAlgorithm,
-    QgsProcessingMultiStepFeedback,
+    QgsProcessingContext,
+    QgsProcessingException,
+    QgsProcessingOutputLayerDefinition,
+    QgsProcessingParameterBoolean,
     QgsProcessingParameterString,
     QgsProcessingParameterEnum,
     QgsProcessingParameterFeatureSink,
-    QgsSettings
+    QgsSettings,
+    QgsVectorFileWriter,
+    QgsVectorLayer
 )
-import processing
 
+from ..ETL.ftp_utils import PART_SUFFIX
+from .pipeline import DatafordelerAlgorithm
+
+# Sink strings like "ogr:dbname=..." or "postgres:..." name a provider, not a file
+PROVIDER_URI = re.compile(r'^\w{2,}:')
 
-class MAT2(QgsProcessingAlgorithm):
-    Entity = ['BygningPaaFremmedGrundFlade','Centroide','BygningPaaFremmedGrundPunkt','Ejerlav','Ejerlejlighed','Ejerlejlighedslod','Jordstykke','Jordstykke_sekundaerForretning','JordstykkeTemaflade','Lodflade','MatrikelKommune','MatrikelRegion','Matrikelskel','MatrikelSogn','MatrikulaerSag','Nullinje','OptagetVej','SamletFastEjendom','Skelpunkt','Temalinje']
+
+class MAT2(DatafordelerAlgorithm):
+    REGISTER = 'MAT'
+    ENTITIES = ['BygningPaaFremmedGrundFlade','Centroide','BygningPaaFremmedGrundPunkt','Ejerlav','Ejerlejlighed','Ejerlejlighedslod','Jordstykke','Jordstykke_sekundaerForretning','JordstykkeTemaflade','Lodflade','MatrikelKommune','MatrikelRegion','Matrikelskel','MatrikelSogn','MatrikulaerSag','Nullinje','OptagetVej','SamletFastEjendom','Skelpunkt','Temalinje']
     
     def initAlgorithm(self, config=None):
         settings = QgsSettings()
         df_api_key = settings.value("kortxyz/df_api_key", "")
 
         self.addParameter(QgsProcessingParameterString('apikey', 'apikey', defaultValue=df_api_key, multiLine=False))
-        self.addParameter(QgsProcessingParameterEnum('entity','Entity', options=self.Entity, allowMultiple=False, usesStaticStrings=True))
+        self.addParameter(QgsProcessingParameterEnum('entity','Entity', options=self.ENTITIES, allowMultiple=True, usesStaticStrings=True, optional=True))
         self.addParameter(QgsProcessingParameterEnum('type','Type', options=['current','bitemporal','temporal'], allowMultiple=False, usesStaticStrings=True))
+        self.addParameter(QgsProcessingParameterBoolean('usecache', 'Reuse cached download when unchanged', defaultValue=True))
         self.addParameter(QgsProcessingParameterFeatureSink('Output','Output', createByDefault=True, supportsAppend=True, defaultValue=None))
+        self.add_batch_parameters()
+
+    def destination(self, parameters, context):
+        """The Output sink as written by the user, before QGIS resolves temporary outputs."""
+        value = parameters['Output']
+        if isinstance(value, QgsProcessingOutputLayerDefinition):
+            if value.useRemapping():
+                return None
+            value = value.sink.valueAsString(context.expressionContext())[0]
+        return str(value or '')
+
+    def hand_over(self, source, entity, parameters, context):
+        """Make source the Output layer, loaded on completion like a sink's layer would be."""
+        value = parameters['Output']
+        if isinstance(value, QgsProcessingOutputLayerDefinition) and value.destinationProject is not None:
+            context.addLayerToLoadOnCompletion(
+                source,
+                QgsProcessingContext.LayerDetails(value.destinationName or entity, value.destinationProject, 'Output')
+            )
+        return {'Output': source}
+
+    def load(self, gpkg_path, entity, parameters, context, feedback):
+        destination = self.destination(parameters, context)
+
+        # Temporary output: the GeoPackage is the layer, copied out of the
+        # extraction cache so that edits to it stay out of the cache
+        if destination == QgsProcessing.TEMPORARY_OUTPUT or (destination or '').startswith('memory:'):
+            output = self.handed_out(gpkg_path, feedback)
+            feedback.pushInfo(f"Using {output} as the output layer")
+            return self.hand_over(output, entity, parameters, context)
 
-    def processAlgorithm(self, parameters, context, model_feedback):
-        # Use a multi-step feedback, so that individual child algorithm progress reports are adjusted for the
-        # overall progress through the model
-        feedback = QgsProcessingMultiStepFeedback(2, model_feedback)
-        results = {}
-        outputs = {}
-        url = (
-            "https://api.datafordeler.dk/FileDownloads/GetFile?"
-            "Register=MAT"
-            "&type=" + parameters["type"] +
-            "&LatestTotalForEntity=" + parameters["entity"] +
-            "&format=gpkg"
-            "&apiKey=" + parameters["apikey"]
-        )
-
-        # Download
-        alg_params = {
-           'DATA':'',
-           'METHOD': 0,  # GET
-           'URL':url,
-           'OUTPUT': QgsProcessing.TEMPORARY_OUTPUT
-        }
-        outputs['Download'] = processing.run('native:filedownloader', alg_params, context=context, feedback=feedback, is_child_algorithm=True)
-
-        feedback.setCurrentStep(1)
-        if feedback.isCanceled():
-            return {}
-
-        # Unzip
-        alg_params = {
-           'DIST':'',
-           'Zipfile': outputs['Download']['OUTPUT']
-        }
-        outputs['Unzip'] = processing.run('KORTxyz:Unzipper', alg_params, context=context, feedback=feedback, is_child_algorithm=True)
-
-            
-        # Extract by expression
-        alg_params = {
-            'EXPRESSION': '1=1',
-            'INPUT': outputs['Unzip']['FIRSTFILE'],
-            'OUTPUT': parameters['Output']
-        }
-        
-        outputs['ExtractByExpression'] = processing.run('native:extractbyexpression', alg_params, context=context, feedback=feedback, is_child_algorithm=True)
-
-        return {'Output':outputs['ExtractByExpression']['OUTPUT']}
+        driver = None
+        if destination and not PROVIDER_URI.match(destination):
+            ext = os.path.splitext(destination)[1][1:].lower()
+            driver = QgsVectorFileWriter.driverForExtension(ext) if ext else None
+
+        # GeoPackage output: a file copy, index and all
+        if driver == 'GPKG':
+            feedback.pushInfo(f"Copying {gpkg_path} to {destination}")
+            shutil.copyfile(gpkg_path, destination + PART_SUFFIX)
+            os.replace(destination + PART_SUFFIX, destination)
+            return self.hand_over(destination, entity, parameters, context)
+
+        # Other file formats: one OGR translation, no per-feature Python
+        if driver:
+            feedback.pushInfo(f"Converting to {driver}: {destination}")
+            if os.path.exists(destination):
+                gdal.GetDriverByName(driver).Delete(destination)
+            if gdal.VectorTranslate(destination, gpkg_path, format=driver) is None:
+                raise QgsProcessingException(f"Failed to write {destination}: {gdal.GetLastErrorMsg()}")
+            return self.hand_over(destination, entity, parameters, context)
+
+        # Database tables and appends go through the sink
+        layer = QgsVectorLayer(gpkg_path, entity, "ogr")
+        if not layer.isValid():
+            raise QgsProcessingException(f"Failed to open layer: {gpkg_path}")
+        dest_id, written = self.write_to_sink(layer, parameters, context, feedback)
+        feedback.pushInfo(f"Wrote {written} features")
+
+        return {'Output': dest_id}
 
     def name(self):
         return'DownloadDatafordelerMatriklen'
@@ -82,11 +111,5 @@ class MAT2(QgsProcessingAlgorithm):
     def displayName(self):
         return'Download Matriklen'
 
-    def group(self):
-        return'Datafordeler'
-
-    def groupId(self):
-        return'Datafordeler'
-
     def createInstance(self):
         return MAT2()
@@ -0,0 +1,181 @@
+"""
+Download Datafordeler - Register snapshot
+Name : DatafordelerRegisterSnapshot
+Group : ETL
+With QGIS : 34000
+"""
+
+import sqlite3
+
+from qgis.core import (
+    QgsProcessingException,
+    QgsProcessingOutputVariant,
+    QgsProcessingParameterBoolean,
+    QgsProcessingParameterEnum,
+    QgsProcessingParameterFileDestination,
+    QgsProcessingParameterNumber,
+    QgsProcessingParameterString,
+    QgsSettings
+)
+
+from ..ETL.gpkg_merge import GpkgMerger
+from .pipeline import DatafordelerAlgorithm
+from .DAGI import DAGI
+from .GeoDK import GeoDK
+from .MAT2 import MAT2
+
+
+class RegisterSnapshot(DatafordelerAlgorithm):
+
+    SOURCES = [DAGI, GeoDK, MAT2]
+    REGISTER_NAMES = ['DAGI', 'GeoDanmark', 'Matriklen']
+
+    OUT_TABLES = 'TABLES'
+
+    # -------------------------
+    # INIT PARAMETERS
+    # -------------------------
+    def initAlgorithm(self, config=None):
+        settings = QgsSettings()
+        df_api_key = settings.value("kortxyz/df_api_key", "")
+
+        self.addParameter(
+            QgsProcessingParameterString(
+                'apikey',
+                'Datafordeler API key',
+                defaultValue=df_api_key
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                'register',
+                'Register',
+                options=self.REGISTER_NAMES
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                'type',
+                'Dataset type',
+                options=self.TYPES
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                'usecache',
+                'Reuse cached download when unchanged',
+                defaultValue=True
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                'workers',
+                'Entities fetched at the same time',
+                type=QgsProcessingParameterNumber.Integer,
+                defaultValue=3,
+                minValue=1,
+                maxValue=16
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterFileDestination(
+                'Output',
+                'Snapshot GeoPackage',
+                fileFilter='GeoPackage (*.gpkg)'
+            )
+        )
+
+        self.addOutput(QgsProcessingOutputVariant(self.OUT_TABLES, 'Tables in the snapshot'))
+        self.addOutput(QgsProcessingOutputVariant(self.OUT_STATUS, 'Per-entity status'))
+
+    # -------------------------
+    # MAIN PROCESSING
+    # -------------------------
+    def processAlgorithm(self, parameters, context, feedback):
+        source = self.SOURCES[self.parameterAsEnum(parameters, 'register', context)]
+        self.REGISTER = source.REGISTER
+        self.ENTITIES = source.ENTITIES
+        self.SPATIAL_INDEX = source.SPATIAL_INDEX
+
+        dtype = self.TYPES[self.parameterAsEnum(parameters, 'type', context)]
+        use_cache = self.parameterAsBoolean(parameters, 'usecache', context)
+        workers = self.parameterAsInt(parameters, 'workers', context)
+        target = self.parameterAsFileOutput(parameters, 'Output', context)
+
+        feedback.pushInfo(
+            f"Snapshot of {len(self.ENTITIES)} {self.REGISTER} entities ({dtype}) into {target}"
+        )
+
+        # Entities are written one at a time on this thread while the
+        # others are still downloading
+        merger = GpkgMerger(target)
+        statuses = {}
+
+        try:
+            ready = self.fetch_entities(self.ENTITIES, dtype, use_cache, workers, parameters, feedback)
+            for done, (entity, gpkg_path, error) in enumerate(ready, 1):
+                feedback.setProgress(100 * done / len(self.ENTITIES))
+                if error is None and gpkg_path is None:
+                    statuses[entity] = {'status': 'canceled', 'error': None}
+                    continue
+                if error is None:
+                    try:
+                        tables = merger.add(gpkg_path)
+                        statuses[entity] = {'status': 'ok', 'error': None, 'tables': tables}
+                        feedback.pushInfo(f"{entity}: wrote {', '.join(tables)}")
+                        continue
+                    except (sqlite3.Error, ValueError) as e:
+                        error = str(e)
+                statuses[entity] = {'status': 'failed', 'error': error}
+                feedback.reportError(f"{entity}: {error}")
+
+            if feedback.isCanceled():
+                merger.abort()
+                return {}
+
+            failed = [e for e, s in statuses.items() if s['status'] != 'ok']
+            if failed:
+                # A partial snapshot must not replace a complete one; the
+                # downloads are cached, so a rerun only fetches what failed
+                merger.abort()
+                raise QgsProcessingException(
+                    f"Snapshot not written, {len(failed)} entities failed: {', '.join(failed)}"
+                )
+
+            feedback.pushInfo("Building indexes")
+            merger.close()
+        except BaseException:
+            merger.abort()
+            raise
+
+        feedback.pushInfo(f"Snapshot complete: {len(merger.tables)} tables in {target}")
+
+        return {
+            'Output': target,
+            self.OUT_TABLES: merger.tables,
+            self.OUT_STATUS: statuses
+        }
+
+    # -------------------------
+    # METADATA
+    # -------------------------
+    def name(self):
+        return 'DatafordelerRegisterSnapshot'
+
+    def displayName(self):
+        return 'Register snapshot'
+
+    def shortHelpString(self):
+        return (
+            "Download every entity of a register and write them as separate "
+            "tables into one GeoPackage. The file is built next to the target "
+            "and replaces it only when every entity made it in."
+        )
+
+    def createInstance(self):
+        return RegisterSnapshot()
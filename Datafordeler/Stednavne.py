@@ -6,59 +6,33 @@ With QGIS : 34000
 """
 
 from qgis.core import ( 
-    QgsProcessing,
-    QgsProcessingAlgorithm,
-    QgsProcessingMultiStepFeedback,
+    QgsProcessingParameterBoolean,
     QgsProcessingParameterString,
     QgsProcessingParameterEnum,
     QgsProcessingParameterFeatureSink,
 )
 
-import processing
+from .pipeline import DatafordelerAlgorithm
 
 
-class Stednavne(QgsProcessingAlgorithm):
-    Entity = ['Adgangspunkt','AndenTopografiFlade','AndenTopografiPunkt','Bebyggelse','Begravelsesplads','Bygning','Campingplads','FaergeruteLinje','FaergerutePunkt','Farvand','Fortidsminde','Friluftsbad','Havnebassin','Idraetsanlaeg','Jernbane','Landskabsform','Lufthavn','Naturareal','Navigationsanlaeg','Restriktionsareal','Rute','Sevaerdighed','Soe','Standsningssted','Stednavn','Terraenkontur','UbearbejdetNavnFlade','UbearbejdetNavnLinje','UbearbejdetNavnPunkt','UrentFarvand','Vandloeb','Vej'];
+class Stednavne(DatafordelerAlgorithm):
+    REGISTER = 'DS'
+    ENTITIES = ['Adgangspunkt','AndenTopografiFlade','AndenTopografiPunkt','Bebyggelse','Begravelsesplads','Bygning','Campingplads','FaergeruteLinje','FaergerutePunkt','Farvand','Fortidsminde','Friluftsbad','Havnebassin','Idraetsanlaeg','Jernbane','Landskabsform','Lufthavn','Naturareal','Navigationsanlaeg','Restriktionsareal','Rute','Sevaerdighed','Soe','Standsningssted','Stednavn','Terraenkontur','UbearbejdetNavnFlade','UbearbejdetNavnLinje','UbearbejdetNavnPunkt','UrentFarvand','Vandloeb','Vej'];
     
     def initAlgorithm(self, config=None):
         self.addParameter(QgsProcessingParameterString('username', 'Username', multiLine=False))
         self.addParameter(QgsProcessingParameterString('password', 'Password', multiLine=False))
-        self.addParameter(QgsProcessingParameterEnum('entity', 'Entity', options=self.Entity, allowMultiple=False, usesStaticStrings=True))
+        self.addParameter(QgsProcessingParameterEnum('entity', 'Entity', options=self.ENTITIES, allowMultiple=False, usesStaticStrings=True))
         self.addParameter(QgsProcessingParameterEnum('type', 'Type', options=['current','bitemporal','temporal'], allowMultiple=False, usesStaticStrings=True))
+        self.addParameter(QgsProcessingParameterBoolean('usecache', 'Reuse cached download when unchanged', defaultValue=True))
         self.addParameter(QgsProcessingParameterFeatureSink('Output', 'Output', createByDefault=True, supportsAppend=True, defaultValue=None))
 
-    def processAlgorithm(self, parameters, context, model_feedback):
-        # Use a multi-step feedback, so that individual child algorithm progress reports are adjusted for the
-        # overall progress through the model
-        feedback = QgsProcessingMultiStepFeedback(2, model_feedback)
-        results = {}
-        outputs = {}
+    def credentials(self, parameters):
+        # Sent in the URL only; they are not part of the cache key
+        return '&username=' + parameters["username"] + '&password=' + parameters["password"]
 
-        # Download
-        alg_params = {
-            'DATA': '',
-            'METHOD': 0,  # GET
-            'URL': 'https://api.datafordeler.dk/FileDownloads/GetFile?Register=DS&type=' +  parameters["type"]  + '&LatestTotalForEntity='+ parameters["entity"] +'&format=gpkg&username=' +  parameters["username"]  + '&password=' + parameters["password"] ,
-            'OUTPUT': QgsProcessing.TEMPORARY_OUTPUT
-        }
-        outputs['Download'] = processing.run('native:filedownloader', alg_params, context=context, feedback=feedback, is_child_algorithm=True)
-
-        feedback.setCurrentStep(1)
-        if feedback.isCanceled():
-            return {}
-
-        # Unzip
-        alg_params = {
-            'DIST': '',
-            'Zipfile': outputs['Download']['OUTPUT'],
-            'FIRSTFILE': parameters['Output']
-        }
-        
-        outputs['Unzip'] = processing.run('script:Unzipper', alg_params, context=context, feedback=feedback, is_child_algorithm=True)
-
-        results['Output'] = outputs['Unzip']['FIRSTFILE']
-        
-        return results
+    def load(self, gpkg_path, entity, parameters, context, feedback):
+        return {'Output': self.handed_out(gpkg_path, feedback)}
 
     def name(self):
         return 'DownloadDatafordelerStednavne'
@@ -66,11 +40,5 @@ class Stednavne(QgsProcessingAlgorithm):
     def displayName(self):
         return 'Download Stednavne'
 
-    def group(self):
-        return 'Datafordeler'
-
-    def groupId(self):
-        return 'Datafordeler'
-
     def createInstance(self):
         return Stednavne()
@@ -0,0 +1,205 @@
+"""
+Persistent cache of Datafordeler file downloads
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from functools import partial
+
+from qgis.core import QgsProcessingException, QgsProcessingUtils, QgsSettings
+
+from ..ETL.checksum import ChecksumMismatch
+from ..ETL.extract_cache import evict_lru
+from ..ETL.ftp_utils import TransferCanceled
+from ..ETL.http_utils import HTTP_ERRORS, SEGMENTS, HTTPStatusError, http_download, open_url
+
+CACHE_FOLDER = os.path.join(tempfile.gettempdir(), "kortxyz", "datafordeler")
+DEFAULT_MAX_MB = 20480
+META_NAME = "meta.json"
+IN_PROGRESS_GRACE = 3600
+# Answers meaning the key was refused or the dataset is gone, which a stale
+# copy would hide
+REFUSED_STATUS = {401, 403, 404, 410}
+
+
+def _unreachable(error):
+    """A connection error, timeout or server failure; 501 is a method the server lacks."""
+    return not isinstance(error, HTTPStatusError) or (error.status >= 500 and error.status != 501)
+
+
+def cache_key(register, entity, dtype, fmt):
+    """Identity of a download; credentials in the URL are deliberately not part of it."""
+    return hashlib.sha256(f"{register}|{entity}|{dtype}|{fmt}".encode("utf-8")).hexdigest()[:32]
+
+
+class DownloadCache:
+    """
+    Downloaded files kept in one folder per (register, entity, type, format).
+
+    A cached file is revalidated with a conditional HEAD (If-None-Match /
+    If-Modified-Since), or a conditional GET where HEAD is refused. Servers
+    that ignore the condition are compared on ETag, Last-Modified or,
+    failing both, Content-Length against the cached size. Least recently
+    used entries are evicted past a size cap.
+    """
+
+    def __init__(self, folder=CACHE_FOLDER):
+        self.folder = folder
+        self._lock = threading.Lock()
+
+    def entry(self, key):
+        return os.path.join(self.folder, key)
+
+    # -------------------------------------------------------------------
+    # Metadata
+    # -------------------------------------------------------------------
+    def _read_meta(self, key):
+        try:
+            with open(os.path.join(self.entry(key), META_NAME), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_meta(self, key, meta):
+        path = os.path.join(self.entry(key), META_NAME)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=1, sort_keys=True)
+        os.replace(path + ".tmp", path)
+
+    def is_current(self, url, meta, method="HEAD"):
+        """
+        True when the server says the cached copy is still the latest. A GET
+        body is never read; only the status and headers are looked at.
+        """
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+
+        with open_url(url, method, headers) as (resp, _):
+            if method == "HEAD" or resp.status == 304:
+                resp.read()
+            if resp.status == 304:
+                return True
+            length = resp.getheader("Content-Length")
+            remote = {
+                "etag": resp.getheader("ETag"),
+                "last_modified": resp.getheader("Last-Modified"),
+                "size": int(length) if length and length.isdigit() else None,
+            }
+
+        if remote["etag"] and meta.get("etag"):
+            return remote["etag"] == meta["etag"]
+        if remote["last_modified"] and meta.get("last_modified"):
+            return remote["last_modified"] == meta["last_modified"] and remote["size"] in (None, meta["size"])
+        return remote["size"] is not None and remote["size"] == meta["size"]
+
+    # -------------------------------------------------------------------
+    # Cache API
+    # -------------------------------------------------------------------
+    def fetch(self, url, register, entity, dtype, fmt="gpkg", max_bytes=DEFAULT_MAX_MB * 1024 * 1024,
+              feedback=None, download=http_download):
+        """
+        Return a local path to the latest file for the key, downloading only
+        when there is no cached copy or the server has a newer one.
+
+        download(url, local_path, feedback) must write the file and return
+        its validators (etag, last_modified, size), like http_download.
+        """
+        key = cache_key(register, entity, dtype, fmt)
+        folder = self.entry(key)
+        local_path = os.path.join(folder, f"{register}_{entity}_{dtype}_{fmt}.zip")
+        meta = self._read_meta(key)
+
+        if meta and os.path.isfile(local_path) and os.path.getsize(local_path) == meta["size"]:
+            try:
+                try:
+                    current = self.is_current(url, meta)
+                except HTTPStatusError as e:
+                    if e.status in REFUSED_STATUS or _unreachable(e):
+                        raise
+                    # HEAD is not allowed here (405, 501, ...): ask with GET
+                    current = self.is_current(url, meta, "GET")
+            except HTTP_ERRORS as e:
+                if isinstance(e, HTTPStatusError) and e.status in REFUSED_STATUS:
+                    raise
+                if _unreachable(e):
+                    # Offline or the server is down: a cached copy beats no data
+                    if feedback:
+                        feedback.reportError(f"Could not revalidate cached download ({e}), using cached copy")
+                    current = True
+                else:
+                    # No answer to go by: download again
+                    current = False
+
+            if current:
+                if feedback:
+                    feedback.pushInfo(f"Using cached download: {local_path}")
+                self._touch(key, meta)
+                return local_path
+
+        os.makedirs(folder, exist_ok=True)
+        validators = download(url, local_path, feedback)
+        meta = {
+            "register": register, "entity": entity, "type": dtype, "format": fmt,
+            "etag": validators.get("etag"),
+            "last_modified": validators.get("last_modified"),
+            "size": os.path.getsize(local_path),
+            "digest": validators.get("digest"),
+        }
+        self._touch(key, meta)
+        self.evict(max_bytes, keep=key)
+        return local_path
+
+    def _touch(self, key, meta):
+        with self._lock:
+            meta["last_used"] = time.time()
+            self._write_meta(key, meta)
+
+    def evict(self, max_bytes, keep=None):
+        """Delete least recently used entries until the cache fits in max_bytes."""
+        def usage(key):
+            meta = self._read_meta(key)
+            if meta is None and time.time() - os.path.getmtime(self.entry(key)) < IN_PROGRESS_GRACE:
+                # No metadata yet: another run may still be downloading into it
+                return None
+            meta = meta or {}
+            return meta.get("last_used", 0), meta.get("size", 0)
+
+        return evict_lru(self.folder, usage, max_bytes, {keep})
+
+
+DOWNLOAD_CACHE = DownloadCache()
+
+
+def fetch_file(url, register, entity, dtype, fmt="gpkg", use_cache=True, feedback=None, consumer=None):
+    """
+    Download step shared by the Datafordeler algorithms.
+
+    Returns the local path, or None when the user canceled. The cache cap
+    and the number of parallel Range segments are read from the
+    "kortxyz/df_cache_max_mb" and "kortxyz/df_http_segments" settings.
+    consumer is handed to http_download to read the file while it arrives.
+    """
+    settings = QgsSettings()
+    segments = settings.value("kortxyz/df_http_segments", SEGMENTS, type=int)
+    download = partial(http_download, segments=segments, consumer=consumer)
+
+    try:
+        if use_cache:
+            max_mb = settings.value("kortxyz/df_cache_max_mb", DEFAULT_MAX_MB, type=int)
+            return DOWNLOAD_CACHE.fetch(
+                url, register, entity, dtype, fmt, max_mb * 1024 * 1024, feedback, download
+            )
+        local_path = os.path.join(QgsProcessingUtils.tempFolder(), f"{register}_{entity}_{dtype}_{fmt}.zip")
+        download(url, local_path, feedback)
+        return local_path
+    except TransferCanceled:
+        return None
+    except (ChecksumMismatch, *HTTP_ERRORS) as e:
+        raise QgsProcessingException(f"Download failed: {e}")
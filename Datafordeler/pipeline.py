@@ -0,0 +1,456 @@
+"""
+Shared download -> unzip -> load pipeline for the Datafordeler algorithms
+"""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from qgis.core import (
+    QgsFeatureRequest,
+    QgsFeatureSink,
+    QgsProcessingAlgorithm,
+    QgsProcessingContext,
+    QgsProcessingException,
+    QgsProcessingMultiStepFeedback,
+    QgsProcessingOutputMultipleLayers,
+    QgsProcessingOutputVariant,
+    QgsProcessingParameterBoolean,
+    QgsProcessingParameterNumber,
+    QgsProcessingUtils,
+)
+import processing
+
+from ..ETL.extract_cache import EXTRACTION_CACHE, DEFAULT_MAX_MB, archive_fingerprint
+from ..ETL.ftp_utils import TransferCanceled
+from ..ETL.gpkg_index import ensure_rtrees
+from ..ETL.unzipper import StreamExtractor, extract_parallel, list_members, member_target
+from .download_cache import fetch_file
+
+BASE_URL = "https://api.datafordeler.dk/FileDownloads/GetFile"
+
+# Features handed to a sink at a time
+SINK_BATCH = 5000
+
+# Unpacking moves files into the extraction cache and evicts from it, so
+# concurrent entities take turns; the streamed members only need a rename.
+_UNPACK_LOCK = threading.Lock()
+
+
+class EntityFeedback:
+    """
+    Feedback for one entity of a batch: messages are prefixed with the
+    entity and progress bars are left to the batch, which counts entities.
+    """
+
+    def __init__(self, feedback, entity):
+        self.feedback = feedback
+        self.entity = entity
+
+    def isCanceled(self):
+        return self.feedback.isCanceled()
+
+    def pushInfo(self, text):
+        self.feedback.pushInfo(f"{self.entity}: {text}")
+
+    def reportError(self, text, fatalError=False):
+        self.feedback.reportError(f"{self.entity}: {text}", fatalError)
+
+    def setProgress(self, progress):
+        pass
+
+    def setProgressText(self, text):
+        self.feedback.setProgressText(f"{self.entity}: {text}")
+
+
+class DatafordelerAlgorithm(QgsProcessingAlgorithm):
+    """
+    Base class of the Datafordeler file download algorithms.
+
+    Subclasses set REGISTER and ENTITIES, declare their parameters and
+    override load() when the GeoPackage needs more than loading. Those
+    that call add_batch_parameters() can fetch several entities at once,
+    see process_entities(). The archive is inflated while it downloads,
+    so the GeoPackage is ready as soon as the last byte lands; archives
+    served from the download cache, and members that cannot be streamed,
+    are extracted afterwards. All extractions land in the extraction
+    cache, keyed by archive. With SPATIAL_INDEX the GeoPackage gets its
+    R-trees once, in the cached file, and every later run reuses them; an
+    uncached GeoPackage is indexed only when clips_extent() says the run
+    filters on its R-tree.
+    """
+
+    REGISTER = None
+    ENTITIES = []
+    TYPES = ['current', 'bitemporal', 'temporal']
+    FORMAT = 'gpkg'
+    WORKERS = 4
+    SPATIAL_INDEX = False
+
+    OUT_LAYERS = 'LAYERS'
+    OUT_STATUS = 'STATUS'
+
+    # -------------------------
+    # PARAMETERS
+    # -------------------------
+    def add_batch_parameters(self):
+        """Parameters and outputs of the multi-entity mode; 'entity' should allow multiple."""
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                'allentities',
+                'Fetch all entities',
+                defaultValue=False
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                'workers',
+                'Entities fetched at the same time',
+                type=QgsProcessingParameterNumber.Integer,
+                defaultValue=3,
+                minValue=1,
+                maxValue=16
+            )
+        )
+
+        self.addOutput(QgsProcessingOutputMultipleLayers(self.OUT_LAYERS, 'Entity layers'))
+        self.addOutput(QgsProcessingOutputVariant(self.OUT_STATUS, 'Per-entity status'))
+
+    def enum_values(self, parameters, name, options, context):
+        """Chosen options as strings, for both index and static-string enums."""
+        if self.parameterDefinition(name).usesStaticStrings():
+            return list(self.parameterAsEnumStrings(parameters, name, context))
+        return [options[i] for i in self.parameterAsEnums(parameters, name, context)]
+
+    def selected_entities(self, parameters, context):
+        if self.parameterDefinition('allentities') and self.parameterAsBoolean(parameters, 'allentities', context):
+            return list(self.ENTITIES)
+        entities = self.enum_values(parameters, 'entity', self.ENTITIES, context)
+        if not entities:
+            raise QgsProcessingException("Choose at least one entity, or fetch all entities.")
+        return entities
+
+    # -------------------------
+    # REQUEST
+    # -------------------------
+    def credentials(self, parameters):
+        return f"&apiKey={parameters['apikey']}"
+
+    def download_url(self, parameters, entity, dtype):
+        return (
+            f"{BASE_URL}?Register={self.REGISTER}"
+            f"&type={dtype}"
+            f"&LatestTotalForEntity={entity}"
+            f"&format={self.FORMAT}"
+            + self.credentials(parameters)
+        )
+
+    # -------------------------
+    # DOWNLOAD + UNZIP
+    # -------------------------
+    def fetch_gpkg(self, url, entity, dtype, use_cache, parameters, feedback):
+        """Download and unzip one entity; return its GeoPackage path, or None if canceled."""
+        root = os.path.dirname(EXTRACTION_CACHE.folder) if use_cache else QgsProcessingUtils.tempFolder()
+        os.makedirs(root, exist_ok=True)
+        staging = tempfile.mkdtemp(prefix="stream-", dir=root)
+        streamer = StreamExtractor(staging)
+        try:
+            zip_path = fetch_file(
+                url, self.REGISTER, entity, dtype, self.FORMAT, use_cache, feedback, streamer.feed
+            )
+            if zip_path is None:
+                return None
+            unpacked = self.unpack(zip_path, streamer, feedback, use_cache)
+        finally:
+            streamer.close()
+            shutil.rmtree(staging, ignore_errors=True)
+
+        if unpacked is None:
+            return None
+        gpkg_path, fingerprint, member = unpacked
+        # An index built in a temp copy is thrown away with it, so it only
+        # pays when the cache keeps it or this run's clip reads it
+        wanted = fingerprint is not None or self.clips_extent(parameters)
+        if self.SPATIAL_INDEX and wanted and not feedback.isCanceled():
+            self.spatial_index(gpkg_path, fingerprint, member, feedback)
+        return gpkg_path
+
+    def unpack(self, zip_path, streamer, feedback, use_cache=True):
+        """
+        Move streamed members into the extraction cache and extract what is
+        missing; return (GeoPackage path, archive fingerprint, member name).
+
+        The entry is pinned, since its GeoPackage is handed out as a layer.
+        Without use_cache the archive goes to a folder of its own in the
+        processing temp folder and the fingerprint is None.
+        """
+        if not use_cache:
+            return self._unpack(zip_path, streamer, feedback, use_cache)
+        with _UNPACK_LOCK:
+            return self._unpack(zip_path, streamer, feedback, use_cache)
+
+    def _unpack(self, zip_path, streamer, feedback, use_cache):
+        try:
+            members = list_members(zip_path)
+        except (OSError, zipfile.BadZipFile) as e:
+            raise QgsProcessingException(f"Failed to read zip file: {zip_path} ({e})")
+        if not members:
+            raise QgsProcessingException(f"Zip file contains no files: {zip_path}")
+
+        if use_cache:
+            fingerprint = archive_fingerprint(zip_path, members)
+            dest_folder = EXTRACTION_CACHE.entry(fingerprint)
+        else:
+            fingerprint = None
+            dest_folder = tempfile.mkdtemp(prefix="unzip-", dir=QgsProcessingUtils.tempFolder())
+        paths = [member_target(dest_folder, m.filename) for m in members]
+        todo = EXTRACTION_CACHE.missing(fingerprint, members, paths) if use_cache else members
+
+        if streamer.error is not None:
+            feedback.pushInfo(f"Unzipping while downloading stopped: {streamer.error}")
+
+        rest = []
+        for member in todo:
+            crc, size, streamed_path = streamer.extracted.get(member.filename, (None, None, None))
+            if (crc, size) != (member.CRC, member.file_size):
+                rest.append(member)
+                continue
+            target = member_target(dest_folder, member.filename)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(streamed_path, target)
+
+        if len(rest) < len(todo):
+            feedback.pushInfo(f"Unzipped {len(todo) - len(rest)} files while downloading")
+        if len(todo) < len(members):
+            feedback.pushInfo(f"Reusing {len(members) - len(todo)} cached files from {dest_folder}")
+
+        if rest:
+            feedback.pushInfo(f"Extracting {len(rest)} files with {self.WORKERS} threads")
+            try:
+                extract_parallel(zip_path, rest, dest_folder, self.WORKERS, feedback=feedback)
+            except TransferCanceled:
+                return None
+            except (OSError, zipfile.BadZipFile, zlib.error) as e:
+                raise QgsProcessingException(f"Failed to unzip file: {zip_path} ({e})")
+
+        if use_cache:
+            EXTRACTION_CACHE.record(fingerprint, todo, [member_target(dest_folder, m.filename) for m in todo])
+            EXTRACTION_CACHE.pin(fingerprint)
+            EXTRACTION_CACHE.evict(DEFAULT_MAX_MB * 1024 * 1024, keep=fingerprint)
+
+        gpkgs = [(p, m) for p, m in zip(paths, members) if p.lower().endswith(".gpkg")]
+        path, member = (gpkgs or list(zip(paths, members)))[0]
+        return path, fingerprint, member.filename
+
+    def clips_extent(self, parameters):
+        """Whether the run narrows the layers to an extent; GeoDK's clip does."""
+        return False
+
+    def spatial_index(self, gpkg_path, fingerprint, member, feedback):
+        """
+        Build the R-trees the GeoPackage lacks. The cache adopts the indexed
+        file, so the index lives as long as the extraction does.
+        """
+        if not gpkg_path.lower().endswith(".gpkg"):
+            return
+        try:
+            tables = ensure_rtrees(gpkg_path)
+        except (sqlite3.DatabaseError, RuntimeError) as e:
+            feedback.reportError(f"Spatial index not built: {e}")
+            return
+        if tables and fingerprint is not None:
+            EXTRACTION_CACHE.adopt(fingerprint, member, gpkg_path)
+            feedback.pushInfo(f"Built spatial index of {', '.join(tables)}, kept for later runs")
+        elif tables:
+            feedback.pushInfo(f"Built spatial index of {', '.join(tables)}")
+
+    # -------------------------
+    # LOAD
+    # -------------------------
+    def handed_out(self, gpkg_path, feedback):
+        """
+        The GeoPackage to give the user as a layer: a copy in the processing
+        temp folder when it lives in the extraction cache, so that editing
+        the layer cannot change what later runs take from the cache.
+        """
+        if not EXTRACTION_CACHE.owns(gpkg_path):
+            return gpkg_path
+        copy = os.path.join(tempfile.mkdtemp(dir=QgsProcessingUtils.tempFolder()), os.path.basename(gpkg_path))
+        feedback.pushInfo(f"Copying {gpkg_path} to {copy}")
+        shutil.copyfile(gpkg_path, copy)
+        return copy
+
+    def layer_source(self, gpkg_path, entity, parameters, context, feedback):
+        """Layer to load for an entity in a batch; by default the GeoPackage itself."""
+        return self.handed_out(gpkg_path, feedback)
+
+    def load(self, gpkg_path, entity, parameters, context, feedback):
+        """Hand the GeoPackage to the output; by default it is loaded as a layer."""
+        alg_params = {
+            'INPUT': self.handed_out(gpkg_path, feedback),
+            'NAME': entity,
+            'OUTPUT': parameters['Output']
+        }
+
+        outputs = processing.run(
+            'native:loadlayer',
+            alg_params,
+            context=context,
+            feedback=feedback,
+            is_child_algorithm=True
+        )
+
+        return {'Output': outputs['OUTPUT']}
+
+    def write_to_sink(self, layer, parameters, context, feedback, request=None, accept=None, total=None):
+        """
+        Stream a layer's features into the Output sink in batches, without
+        expressions; accept can drop features. Returns (sink id, written).
+        """
+        sink, dest_id = self.parameterAsSink(
+            parameters, 'Output', context, layer.fields(), layer.wkbType(), layer.crs()
+        )
+        if sink is None:
+            raise QgsProcessingException(self.invalidSinkError(parameters, 'Output'))
+
+        return dest_id, self.write_features(sink, layer, feedback, request, accept, total)
+
+    def write_features(self, sink, layer, feedback, request=None, accept=None, total=None):
+        """Add a layer's features to any feature sink in batches; return the number written."""
+        if total is None:
+            total = layer.featureCount()
+
+        batch = []
+        written = 0
+        for i, feature in enumerate(layer.getFeatures(request or QgsFeatureRequest())):
+            if feedback.isCanceled():
+                break
+            if accept is not None and not accept(feature):
+                continue
+            batch.append(feature)
+            if len(batch) >= SINK_BATCH:
+                sink.addFeatures(batch, QgsFeatureSink.FastInsert)
+                written += len(batch)
+                batch = []
+                if total > 0:
+                    feedback.setProgress(100 * i / total)
+
+        sink.addFeatures(batch, QgsFeatureSink.FastInsert)
+        written += len(batch)
+
+        return written
+
+    # -------------------------
+    # MAIN PROCESSING
+    # -------------------------
+    def processAlgorithm(self, parameters, context, model_feedback):
+        entities = self.selected_entities(parameters, context)
+        dtype = self.enum_values(parameters, 'type', self.TYPES, context)[0]
+        use_cache = self.parameterAsBoolean(parameters, 'usecache', context)
+
+        if len(entities) > 1:
+            return self.process_entities(entities, dtype, use_cache, parameters, context, model_feedback)
+
+        feedback = QgsProcessingMultiStepFeedback(2, model_feedback)
+        entity = entities[0]
+
+        # The URL carries credentials, so it is not logged
+        feedback.pushInfo(f"Requesting {self.REGISTER} {entity} ({dtype})")
+
+        # STEP 1 – Download and unzip, overlapped
+        url = self.download_url(parameters, entity, dtype)
+        gpkg_path = self.fetch_gpkg(url, entity, dtype, use_cache, parameters, feedback)
+
+        if gpkg_path is None or feedback.isCanceled():
+            return {}
+
+        feedback.setCurrentStep(1)
+
+        # STEP 2 – Load
+        return self.load(gpkg_path, entity, parameters, context, feedback)
+
+    def fetch_entities(self, entities, dtype, use_cache, workers, parameters, feedback):
+        """
+        Download and unzip entities on up to `workers` threads and yield
+        (entity, gpkg_path, error) on this thread as each one is ready.
+
+        gpkg_path is None for a failed or canceled entity; error is the
+        failure message. Work done per entity by the caller overlaps with
+        the downloads still running.
+        """
+        def fetch(entity):
+            if feedback.isCanceled():
+                return None
+            url = self.download_url(parameters, entity, dtype)
+            return self.fetch_gpkg(url, entity, dtype, use_cache, parameters, EntityFeedback(feedback, entity))
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            futures = {pool.submit(fetch, entity): entity for entity in entities}
+            try:
+                for future in as_completed(futures):
+                    try:
+                        gpkg_path, error = future.result(), None
+                    except (QgsProcessingException, OSError) as e:
+                        gpkg_path, error = None, str(e)
+                    yield futures[future], gpkg_path, error
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+
+    def process_entities(self, entities, dtype, use_cache, parameters, context, feedback):
+        """
+        Fetch several entities through fetch_entities(), one layer per entity.
+
+        Each entity is loaded on this thread as soon as it is ready, while
+        the others keep downloading; child algorithms and the context are
+        not thread-safe. A failed entity is reported and the batch carries on.
+        """
+        workers = self.parameterAsInt(parameters, 'workers', context) or 1
+        feedback.pushInfo(f"Fetching {len(entities)} {self.REGISTER} entities ({dtype}), {workers} at a time")
+
+        layers = []
+        statuses = {}
+
+        ready = self.fetch_entities(entities, dtype, use_cache, workers, parameters, feedback)
+        for done, (entity, gpkg_path, error) in enumerate(ready, 1):
+            feedback.setProgress(100 * done / len(entities))
+            try:
+                if error is not None:
+                    raise QgsProcessingException(error)
+                source = None
+                if gpkg_path is not None and not feedback.isCanceled():
+                    source = self.layer_source(gpkg_path, entity, parameters, context, feedback)
+                if source is None:
+                    statuses[entity] = {'status': 'canceled', 'error': None}
+                    continue
+
+                context.addLayerToLoadOnCompletion(
+                    source,
+                    QgsProcessingContext.LayerDetails(entity, context.project(), self.OUT_LAYERS)
+                )
+                layers.append(source)
+                statuses[entity] = {'status': 'ok', 'error': None, 'path': gpkg_path}
+            except (QgsProcessingException, OSError) as e:
+                statuses[entity] = {'status': 'failed', 'error': str(e)}
+                feedback.reportError(f"{entity}: {e}")
+
+        failed = [e for e, s in statuses.items() if s['status'] == 'failed']
+        feedback.pushInfo(f"Loaded {len(layers)} of {len(entities)} entities, {len(failed)} failed")
+
+        return {self.OUT_LAYERS: layers, self.OUT_STATUS: statuses}
+
+    # -------------------------
+    # METADATA
+    # -------------------------
+    def group(self):
+        return 'Datafordeler'
+
+    def groupId(self):
+        return 'Datafordeler'
@@ -0,0 +1,67 @@
+"""
+Incremental checksums for downloads
+"""
+
+import hashlib
+import re
+
+ALGORITHMS = ["md5", "sha256"]
+
+_HEX = re.compile(r"\b([0-9a-fA-F]{32}|[0-9a-fA-F]{64})\b")
+
+
+class ChecksumMismatch(ValueError):
+    """Raised when a downloaded file does not match its expected digest."""
+
+
+def new_hasher(name):
+    return hashlib.new(name) if name else None
+
+
+def hashing(write, hasher):
+    """Wrap a write callback so every block also feeds the hasher."""
+    if hasher is None:
+        return write
+
+    def callback(block):
+        hasher.update(block)
+        write(block)
+    return callback
+
+
+def hash_file(path, hasher, length=None, blocksize=1024 * 1024):
+    """Feed the first `length` bytes (all if None) of a local file to the hasher."""
+    with open(path, "rb") as f:
+        remaining = length
+        while remaining is None or remaining > 0:
+            block = f.read(blocksize if remaining is None else min(blocksize, remaining))
+            if not block:
+                break
+            hasher.update(block)
+            if remaining is not None:
+                remaining -= len(block)
+    return hasher
+
+
+def parse_checksum(text, filename=None):
+    """
+    Pull a hex digest out of a .md5/.sha256 file or a pasted value.
+
+    Accepts a bare digest or `md5sum`-style lines ("<digest>  <name>");
+    with several lines the one naming `filename` wins.
+    """
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    if filename:
+        named = [line for line in lines if line.rstrip("*").endswith(filename)]
+        lines = named or lines
+
+    for line in lines:
+        match = _HEX.search(line)
+        if match:
+            return match.group(1).lower()
+    return None
+
+
+def verify(name, digest, expected, label):
+    if expected and digest != expected.lower():
+        raise ChecksumMismatch(f"{name} mismatch for {label}: got {digest}, expected {expected}")
@@ -0,0 +1,175 @@
+"""
+Content-addressed cache of archive extractions
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+CACHE_FOLDER = os.path.join(tempfile.gettempdir(), "kortxyz", "unzip")
+DEFAULT_MAX_MB = 10240
+MANIFEST_NAME = ".extracted.json"
+
+
+def archive_fingerprint(zip_path, members):
+    """
+    Cheap identity of an archive: its size and mtime plus the name, CRC and
+    size of every member from the central directory. No member is read.
+    """
+    st = os.stat(zip_path)
+    h = hashlib.sha256(f"{st.st_size}:{st.st_mtime_ns}".encode())
+    for m in members:
+        h.update(f"\0{m.filename}:{m.CRC:08x}:{m.file_size}".encode("utf-8"))
+    return h.hexdigest()[:32]
+
+
+def evict_lru(folder, usage, max_bytes, spared=()):
+    """
+    Delete the least recently used entry folders under folder until they
+    fit in max_bytes; return the names deleted.
+
+    usage(name) gives (last_used, size) of an entry, or None to leave it
+    out. Entries named in spared are kept whatever the cap.
+    """
+    if not os.path.isdir(folder):
+        return []
+
+    entries = []
+    for name in os.listdir(folder):
+        if not os.path.isdir(os.path.join(folder, name)):
+            continue
+        used = usage(name)
+        if used is not None:
+            entries.append((*used, name))
+
+    total = sum(size for _, size, _ in entries)
+    evicted = []
+    for _, size, name in sorted(entries):
+        if total <= max_bytes:
+            break
+        if name in spared:
+            continue
+        shutil.rmtree(os.path.join(folder, name), ignore_errors=True)
+        total -= size
+        evicted.append(name)
+    return evicted
+
+
+class ExtractionCache:
+    """
+    Extractions kept in one folder per archive fingerprint.
+
+    Each folder has a manifest of the members known to be completely
+    extracted (name -> size, and the modification time of the file) and
+    a last-used time, so a later run only extracts what is missing or was
+    changed since, and the least recently used folders can be evicted
+    when the cache grows past its cap. Members changed in place on
+    purpose, such as a GeoPackage given a spatial index, are adopted with
+    their new size and time and kept as they are. Entries pinned in this
+    session, because their files were handed out as layers, are never
+    evicted.
+    """
+
+    def __init__(self, folder=CACHE_FOLDER):
+        self.folder = folder
+        self._lock = threading.Lock()
+        self._pinned = set()
+
+    def entry(self, fingerprint):
+        return os.path.join(self.folder, fingerprint)
+
+    # -------------------------------------------------------------------
+    # Manifests
+    # -------------------------------------------------------------------
+    def _read_manifest(self, fingerprint):
+        try:
+            with open(os.path.join(self.entry(fingerprint), MANIFEST_NAME), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {"members": {}, "last_used": 0}
+
+    def _write_manifest(self, fingerprint, manifest):
+        path = os.path.join(self.entry(fingerprint), MANIFEST_NAME)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1, sort_keys=True)
+        os.replace(path + ".tmp", path)
+
+    # -------------------------------------------------------------------
+    # Cache API
+    # -------------------------------------------------------------------
+    def missing(self, fingerprint, members, paths):
+        """
+        Members not recorded as extracted, or whose file is gone, has the
+        wrong size or was modified since it was recorded.
+        """
+        manifest = self._read_manifest(fingerprint)
+        recorded = manifest["members"]
+        adopted = manifest.get("adopted", {})
+        mtimes = manifest.get("mtimes", {})
+
+        def intact(m, path):
+            try:
+                st = os.stat(path)
+            except OSError:
+                return False
+            return (
+                recorded.get(m.filename) == m.file_size
+                and st.st_size == adopted.get(m.filename, m.file_size)
+                and st.st_mtime_ns == mtimes.get(m.filename)
+            )
+
+        return [m for m, path in zip(members, paths) if not intact(m, path)]
+
+    def record(self, fingerprint, members, paths):
+        """Mark members, extracted to paths, as complete and the entry as just used."""
+        with self._lock:
+            manifest = self._read_manifest(fingerprint)
+            manifest["members"].update({m.filename: m.file_size for m in members})
+            mtimes = manifest.setdefault("mtimes", {})
+            adopted = manifest.get("adopted", {})
+            for m, path in zip(members, paths):
+                mtimes[m.filename] = os.stat(path).st_mtime_ns
+                adopted.pop(m.filename, None)
+            manifest["last_used"] = time.time()
+            self._write_manifest(fingerprint, manifest)
+
+    def adopt(self, fingerprint, name, path):
+        """Keep an extracted member that was changed in place, at its current size and time."""
+        with self._lock:
+            manifest = self._read_manifest(fingerprint)
+            if name not in manifest["members"]:
+                return
+            st = os.stat(path)
+            manifest.setdefault("adopted", {})[name] = st.st_size
+            manifest.setdefault("mtimes", {})[name] = st.st_mtime_ns
+            self._write_manifest(fingerprint, manifest)
+
+    def owns(self, path):
+        """Whether path lies inside the cache folder."""
+        folder = os.path.abspath(self.folder)
+        try:
+            return os.path.commonpath([folder, os.path.abspath(path)]) == folder
+        except ValueError:
+            return False
+
+    def pin(self, fingerprint):
+        """Keep an entry for the rest of the session, whatever the cap."""
+        with self._lock:
+            self._pinned.add(fingerprint)
+
+    def evict(self, max_bytes, keep=None):
+        """Delete least recently used entries until the cache fits in max_bytes."""
+        def usage(fingerprint):
+            manifest = self._read_manifest(fingerprint)
+            sizes = dict(manifest["members"], **manifest.get("adopted", {}))
+            return manifest["last_used"], sum(sizes.values())
+
+        return evict_lru(self.folder, usage, max_bytes, self._pinned | {keep})
+
+
+EXTRACTION_CACHE = ExtractionCache()
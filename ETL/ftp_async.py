@@ -0,0 +1,259 @@
+"""
+Asyncio FTP/FTPS transfer engine for many concurrent small transfers
+"""
+
+import asyncio
+import os
+import re
+import ssl
+from ftplib import error_perm, error_proto, error_reply, error_temp, all_errors
+from io import BytesIO
+
+from .checksum import ChecksumMismatch, new_hasher, parse_checksum, verify
+from .ftp_utils import BLOCKSIZE, PART_SUFFIX, TransferCanceled, TransferMonitor
+
+_PASV = re.compile(r"(\d+),(\d+),(\d+),(\d+),(\d+),(\d+)")
+
+
+def _tls_context():
+    # Same trust model as ftplib's FTP_TLS default context
+    context = ssl.create_default_context()
+    context.check_hostname = False
+    context.verify_mode = ssl.CERT_NONE
+    return context
+
+
+class AsyncFTP:
+    """
+    Minimal FTP client on asyncio streams.
+
+    scheme "ftps" is implicit TLS, "ftpes" is explicit TLS (AUTH TLS) and
+    "ftp" is plain. Passive mode only; like ImplicitFTP_TLS with
+    ignore_PASV_host the address in the PASV reply is replaced by the
+    control connection host. asyncio cannot resume a TLS session on the
+    data channel, so servers that enforce session reuse will refuse it.
+    """
+
+    def __init__(self, scheme, host, port, ignore_PASV_host=True, context=None):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.ignore_PASV_host = ignore_PASV_host
+        self.context = context or (_tls_context() if scheme in ("ftps", "ftpes") else None)
+        self.reader = None
+        self.writer = None
+
+    # -------------------------------------------------------------------
+    # Control connection
+    # -------------------------------------------------------------------
+    async def _response(self):
+        line = (await self.reader.readline()).decode("latin-1")
+        if not line:
+            raise EOFError("Connection closed by server")
+        lines = [line]
+        if line[3:4] == "-":
+            code = line[:3]
+            while not (line[:3] == code and line[3:4] == " "):
+                line = (await self.reader.readline()).decode("latin-1")
+                if not line:
+                    raise EOFError("Connection closed by server")
+                lines.append(line)
+        resp = "".join(lines).rstrip("\r\n")
+
+        c = resp[:1]
+        if c in ("1", "2", "3"):
+            return resp
+        if c == "4":
+            raise error_temp(resp)
+        if c == "5":
+            raise error_perm(resp)
+        raise error_proto(resp)
+
+    async def command(self, line, expect="2"):
+        self.writer.write(line.encode("latin-1") + b"\r\n")
+        await self.writer.drain()
+        resp = await self._response()
+        if not resp.startswith(tuple(expect)):
+            raise error_reply(resp)
+        return resp
+
+    async def connect(self, user, passwd):
+        self.reader, self.writer = await asyncio.open_connection(
+            self.host, self.port,
+            ssl=self.context if self.scheme == "ftps" else None,
+            server_hostname=self.host if self.scheme == "ftps" else None
+        )
+        await self._response()
+
+        if self.scheme == "ftpes":
+            await self.command("AUTH TLS", expect="23")
+            await self.writer.start_tls(self.context, server_hostname=self.host)
+
+        resp = await self.command(f"USER {user}", expect="23")
+        if resp.startswith("3"):
+            await self.command(f"PASS {passwd}", expect="23")
+
+        if self.context is not None:
+            await self.command("PBSZ 0")
+            await self.command("PROT P")
+        await self.command("TYPE I")
+
+    async def close(self):
+        if self.writer is None:
+            return
+        try:
+            self.writer.write(b"QUIT\r\n")
+            await self.writer.drain()
+        except (OSError, ssl.SSLError):
+            pass
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except (OSError, ssl.SSLError):
+            pass
+        self.writer = None
+
+    # -------------------------------------------------------------------
+    # Transfers
+    # -------------------------------------------------------------------
+    async def _open_data(self):
+        resp = await self.command("PASV")
+        numbers = _PASV.search(resp)
+        if not numbers:
+            raise error_proto(resp)
+        parts = numbers.groups()
+        host = self.host if self.ignore_PASV_host else ".".join(parts[:4])
+        port = (int(parts[4]) << 8) + int(parts[5])
+        return await asyncio.open_connection(host, port)
+
+    async def retrieve(self, path, write, blocksize=BLOCKSIZE):
+        """RETR path, passing every block to write()."""
+        reader, writer = await self._open_data()
+        try:
+            await self.command(f"RETR {path}", expect="1")
+            # Like ftplib's ntransfercmd: servers only start TLS on the data
+            # channel once the command is accepted
+            if self.context is not None:
+                await writer.start_tls(self.context, server_hostname=self.host)
+            while True:
+                block = await reader.read(blocksize)
+                if not block:
+                    break
+                write(block)
+        finally:
+            writer.close()
+        await self._response()
+
+
+# -------------------------------------------------------------------
+# Batch download on one event loop
+# -------------------------------------------------------------------
+async def _fetch_checksum(session, remote_path, name):
+    buf = BytesIO()
+    try:
+        await session.retrieve(f"{remote_path}.{name}", buf.write)
+    except all_errors:
+        return None
+    return parse_checksum(buf.getvalue().decode("ascii", "replace"), os.path.basename(remote_path))
+
+
+async def _download_file(session, remote_path, local_path, blocksize, monitor, hash_name):
+    hasher = new_hasher(hash_name)
+    part_path = local_path + PART_SUFFIX
+
+    def write(block):
+        monitor.update(len(block))
+        if hasher:
+            hasher.update(block)
+        f.write(block)
+
+    os.makedirs(os.path.dirname(local_path), exist_ok=True)
+    try:
+        with open(part_path, "wb") as f:
+            await session.retrieve(remote_path, write, blocksize)
+    except BaseException:
+        os.remove(part_path)
+        raise
+    os.replace(part_path, local_path)
+
+    if not hasher:
+        return None
+    digest = hasher.hexdigest()
+    try:
+        verify(hash_name, digest, await _fetch_checksum(session, remote_path, hash_name), remote_path)
+    except ChecksumMismatch:
+        os.remove(local_path)
+        raise
+    return digest
+
+
+async def _download_all(scheme, host, port, user, passwd, jobs, concurrency,
+                        blocksize, feedback, hash_name):
+    monitor = TransferMonitor(feedback)
+    context = _tls_context() if scheme in ("ftps", "ftpes") else None
+    queue = asyncio.Queue()
+    for i, job in enumerate(jobs):
+        queue.put_nowait((i, job))
+
+    statuses = [None] * len(jobs)
+    finished = 0
+
+    async def worker():
+        nonlocal finished
+        session = None
+        while not queue.empty():
+            i, (remote_path, local_path) = queue.get_nowait()
+            status, error, digest = "ok", None, None
+            try:
+                if feedback and feedback.isCanceled():
+                    raise TransferCanceled()
+                if session is None:
+                    session = AsyncFTP(scheme, host, port, context=context)
+                    await session.connect(user, passwd)
+                digest = await _download_file(session, remote_path, local_path, blocksize, monitor, hash_name)
+            except TransferCanceled:
+                status = "canceled"
+            except (ChecksumMismatch, *all_errors) as e:
+                status, error = "failed", str(e)
+                if feedback:
+                    feedback.reportError(f"{remote_path}: {e}")
+
+            # The session state is unknown after a failed or aborted transfer
+            if status != "ok" and session is not None:
+                await session.close()
+                session = None
+
+            statuses[i] = {
+                "remote": remote_path,
+                "local": local_path,
+                "status": status,
+                "error": error,
+                "digest": digest
+            }
+            finished += 1
+            if feedback:
+                feedback.setProgress(100 * finished / len(jobs))
+
+        if session is not None:
+            await session.close()
+
+    await asyncio.gather(*(worker() for _ in range(max(1, min(concurrency, len(jobs))))))
+
+    if feedback:
+        feedback.pushInfo(f"Transferred {monitor.summary()}")
+
+    return statuses
+
+
+def download_many_async(scheme, host, port, user, passwd, jobs, concurrency=64,
+                        blocksize=BLOCKSIZE, feedback=None, hash_name=None):
+    """
+    Asyncio counterpart of ftp_utils.download_many.
+
+    Runs every session on one event loop in the calling thread, so
+    hundreds of concurrent small transfers do not need hundreds of
+    threads. Returns the same per-file status dicts.
+    """
+    return asyncio.run(_download_all(
+        scheme, host, port, user, passwd, jobs, concurrency, blocksize, feedback, hash_name
+    ))
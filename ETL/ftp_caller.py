@@ -6,62 +6,53 @@ With QGIS : 34000
 """
 
 import os
-import ssl
-from urllib.parse import urlparse
-from ftplib import FTP_TLS, FTP, all_errors
+import posixpath
+import tempfile
+from functools import partial
+from ftplib import all_errors
 
 from qgis.core import (
     QgsProcessingAlgorithm,
+    QgsProcessingException,
     QgsProcessingParameterBoolean,
+    QgsProcessingParameterEnum,
+    QgsProcessingParameterNumber,
     QgsProcessingParameterString,
     QgsProcessingParameterFileDestination,
     QgsProcessingOutputVariant,
     QgsProcessingUtils,
     QgsMessageLog,
-    QgsVectorLayer,
-    QgsProviderRegistry,
-    QgsProject,
     QgsProcessingContext
 )
 
-LOG_TAG = "FTPcaller"
-
+from .ftp_utils import (
+    ImplicitFTP_TLS,
+    parse_ftp_url,
+    default_port,
+    ftp_url,
+    remote_size,
+    supports_rest,
+    abort_transfer,
+    has_glob,
+    expand_remote,
+    local_paths,
+    download_many,
+    download_segmented,
+    download_resumable,
+    TransferMonitor,
+    TransferCanceled,
+    fetch_remote_checksum
+)
+from .checksum import ALGORITHMS, ChecksumMismatch, new_hasher, hashing, verify
+from .ftp_pool import FTP_POOL
+from .ftp_async import download_many_async
+from .listing_cache import LISTING_CACHE, DB_PATH, DEFAULT_TTL, listing_key
+from .gpkg_loader import load_gpkg_layers
 
-# -------------------------------------------------------------------
-# Custom implicit FTPS class
-# -------------------------------------------------------------------
-class ImplicitFTP_TLS(FTP_TLS):
-    """FTP_TLS subclass supporting implicit FTPS."""
-
-    def __init__(self, *args, ignore_PASV_host=False, **kwargs):
-        self.ignore_PASV_host = ignore_PASV_host
-        super().__init__(*args, **kwargs)
-        self._sock = None
-
-    @property
-    def sock(self):
-        return self._sock
-
-    @sock.setter
-    def sock(self, value):
-        if value and not isinstance(value, ssl.SSLSocket):
-            value = self.context.wrap_socket(value)
-        self._sock = value
-
-    def ntransfercmd(self, cmd, rest=None):
-        conn, size = FTP.ntransfercmd(self, cmd, rest)
-        conn = self.sock.context.wrap_socket(
-            conn,
-            server_hostname=self.host,
-            session=getattr(self.sock, "session", None)
-        )
-        return conn, size
+LOG_TAG = "FTPcaller"
 
-    def makepasv(self):
-        host, port = super().makepasv()
-        if self.ignore_PASV_host:
-            return self.host, port
-        return host, port
+# Resumable downloads need a folder that outlives the processing session
+RESUME_FOLDER = os.path.join(tempfile.gettempdir(), "kortxyz", "ftp")
 
 
 # -------------------------------------------------------------------
@@ -73,16 +64,35 @@ class FTPcaller(QgsProcessingAlgorithm):
     PARAM_USER = "USER"
     PARAM_PASS = "PASSWD"
     PARAM_LOAD = "LOAD"
+    PARAM_LAZY = "LAZY"
+    PARAM_SEGMENTS = "SEGMENTS"
+    PARAM_RESUME = "RESUME"
+    PARAM_RETRIES = "RETRIES"
+    PARAM_PATHS = "PATHS"
+    PARAM_WORKERS = "WORKERS"
+    PARAM_ENGINE = "ENGINE"
+    PARAM_BLOCKSIZE = "BLOCKSIZE"
+    PARAM_HASH = "HASH"
+    PARAM_CHECKSUM = "CHECKSUM"
+    PARAM_LISTING_TTL = "LISTING_TTL"
+    PARAM_LISTING_PERSIST = "LISTING_PERSIST"
+    PARAM_LISTING_REFRESH = "LISTING_REFRESH"
 
     OUT_LIST = "LIST"
     OUT_FILEPATH = "FILEPATH"
     OUT_FILE = "FILE"
+    OUT_FILES = "FILES"
+    OUT_STATUS = "STATUS"
+    OUT_DIGEST = "DIGEST"
+
+    HASH_OPTIONS = ["None", "MD5", "SHA-256"]
+    ENGINE_OPTIONS = ["ftplib (one thread per connection)", "asyncio (single thread)"]
 
     def initAlgorithm(self, config=None):
 
         self.addParameter(QgsProcessingParameterString(
             name=self.PARAM_HOST,
-            description="FTP/FTPS host URL"
+            description="FTP/FTPS host URL (the file name may be a glob, e.g. *.zip)"
         ))
 
         self.addParameter(QgsProcessingParameterString(
@@ -116,6 +126,118 @@ class FTPcaller(QgsProcessingAlgorithm):
             description="Load layers into project"
         ))
 
+        self.addParameter(QgsProcessingParameterBoolean(
+            name=self.PARAM_LAZY,
+            description="Defer feature counts when loading layers (lazy)",
+            defaultValue=False
+        ))
+
+        self.addParameter(QgsProcessingParameterNumber(
+            name=self.PARAM_SEGMENTS,
+            description="Parallel segments (1 = single stream)",
+            type=QgsProcessingParameterNumber.Integer,
+            defaultValue=1,
+            minValue=1,
+            maxValue=32
+        ))
+
+        self.addParameter(QgsProcessingParameterBoolean(
+            name=self.PARAM_RESUME,
+            description="Resume interrupted downloads",
+            defaultValue=False
+        ))
+
+        self.addParameter(QgsProcessingParameterNumber(
+            name=self.PARAM_RETRIES,
+            description="Retries on transfer errors (resume mode)",
+            type=QgsProcessingParameterNumber.Integer,
+            defaultValue=3,
+            minValue=0
+        ))
+
+        # Batch mode
+        self.addParameter(QgsProcessingParameterString(
+            name=self.PARAM_PATHS,
+            description="Additional remote paths or globs (one per line)",
+            multiLine=True,
+            optional=True
+        ))
+
+        self.addParameter(QgsProcessingParameterNumber(
+            name=self.PARAM_WORKERS,
+            description="Concurrent connections (batch mode)",
+            type=QgsProcessingParameterNumber.Integer,
+            defaultValue=4,
+            minValue=1,
+            maxValue=512
+        ))
+
+        self.addParameter(QgsProcessingParameterEnum(
+            name=self.PARAM_ENGINE,
+            description="Transfer engine (batch mode)",
+            options=self.ENGINE_OPTIONS,
+            defaultValue=0
+        ))
+
+        self.addParameter(QgsProcessingParameterNumber(
+            name=self.PARAM_BLOCKSIZE,
+            description="Transfer block size (KiB)",
+            type=QgsProcessingParameterNumber.Integer,
+            defaultValue=256,
+            minValue=8,
+            maxValue=16384
+        ))
+
+        # Integrity check
+        self.addParameter(QgsProcessingParameterEnum(
+            name=self.PARAM_HASH,
+            description="Checksum computed while downloading",
+            options=self.HASH_OPTIONS,
+            defaultValue=0
+        ))
+
+        self.addParameter(QgsProcessingParameterString(
+            name=self.PARAM_CHECKSUM,
+            description="Expected checksum (default: .md5/.sha256 file next to the remote file)",
+            optional=True
+        ))
+
+        # Directory listing cache
+        self.addParameter(QgsProcessingParameterNumber(
+            name=self.PARAM_LISTING_TTL,
+            description="Reuse directory listings for (seconds, 0 = always list)",
+            type=QgsProcessingParameterNumber.Integer,
+            defaultValue=DEFAULT_TTL,
+            minValue=0
+        ))
+
+        self.addParameter(QgsProcessingParameterBoolean(
+            name=self.PARAM_LISTING_PERSIST,
+            description="Keep listing cache on disk between sessions",
+            defaultValue=False
+        ))
+
+        self.addParameter(QgsProcessingParameterBoolean(
+            name=self.PARAM_LISTING_REFRESH,
+            description="Refresh cached listings for this server",
+            defaultValue=False
+        ))
+
+        self.addOutput(QgsProcessingOutputVariant(
+            self.OUT_DIGEST,
+            "Checksum of the downloaded file"
+        ))
+
+        self.addOutput(QgsProcessingOutputVariant(
+            self.OUT_FILES,
+            "Downloaded file paths (batch mode)"
+        ))
+
+        self.addOutput(QgsProcessingOutputVariant(
+            self.OUT_STATUS,
+            "Per-file status (batch mode)"
+        ))
+
     # -------------------------------------------------------------------
     # Main logic
     # -------------------------------------------------------------------
@@ -125,33 +247,109 @@ class FTPcaller(QgsProcessingAlgorithm):
         user = self.parameterAsString(parameters, self.PARAM_USER, context)
         passwd = self.parameterAsString(parameters, self.PARAM_PASS, context)
         load_layers = self.parameterAsBoolean(parameters, self.PARAM_LOAD, context)
+        lazy_load = self.parameterAsBoolean(parameters, self.PARAM_LAZY, context)
         output_file = self.parameterAsFileOutput(parameters, self.OUT_FILE, context)
+        segments = self.parameterAsInt(parameters, self.PARAM_SEGMENTS, context)
+        resume = self.parameterAsBoolean(parameters, self.PARAM_RESUME, context)
+        retries = self.parameterAsInt(parameters, self.PARAM_RETRIES, context)
+        extra_paths = self.parameterAsString(parameters, self.PARAM_PATHS, context)
+        workers = self.parameterAsInt(parameters, self.PARAM_WORKERS, context)
+        use_async = self.parameterAsEnum(parameters, self.PARAM_ENGINE, context) == 1
+        blocksize = self.parameterAsInt(parameters, self.PARAM_BLOCKSIZE, context) * 1024
+        hash_index = self.parameterAsEnum(parameters, self.PARAM_HASH, context)
+        hash_name = ALGORITHMS[hash_index - 1] if hash_index else None
+        expected = self.parameterAsString(parameters, self.PARAM_CHECKSUM, context).strip()
+        listing_ttl = self.parameterAsInt(parameters, self.PARAM_LISTING_TTL, context)
+        listing_db = DB_PATH if self.parameterAsBoolean(parameters, self.PARAM_LISTING_PERSIST, context) else None
+        listing_refresh = self.parameterAsBoolean(parameters, self.PARAM_LISTING_REFRESH, context)
 
         feedback.pushInfo(f"Connecting to: {host_str}")
         QgsMessageLog.logMessage(f"Connecting to {host_str}", LOG_TAG)
 
-        parsed = urlparse(host_str)
-        scheme = parsed.scheme or "ftp"
-        host = parsed.netloc
-        path = parsed.path
-        port = 990 if scheme == "ftps" else 21
-
-        ftp = ImplicitFTP_TLS(ignore_PASV_host=True) if scheme == "ftps" else FTP()
-
-        ftp.connect(host=host, port=port)
-        ftp.login(user=user, passwd=passwd)
-        ftp.voidcmd("TYPE I")
+        scheme, host, port, path = parse_ftp_url(host_str)
+
+        server = listing_key(scheme, host, port, user)
+        if listing_refresh:
+            LISTING_CACHE.invalidate(server, db_path=listing_db)
+        lister = LISTING_CACHE.lister(server, listing_ttl, listing_db)
+
+        # A glob or extra paths switch to batch mode. Every path travels over
+        # this server's connections, so URLs must name this server.
+        patterns = []
+        for line in extra_paths.splitlines():
+            line = line.strip()
+            if "://" in line:
+                line_scheme, line_host, line_port, line_path = parse_ftp_url(line)
+                if (line_scheme, (line_host or "").lower(), line_port) != (scheme, (host or "").lower(), port):
+                    raise QgsProcessingException(
+                        f"{line} is not on {host_str}; run one download per server"
+                    )
+                line = line_path
+            if line:
+                patterns.append(line)
+        if patterns or has_glob(path):
+            return self.downloadBatch(
+                [path] + patterns if path.strip("/") else patterns,
+                (scheme, host, port, user, passwd), workers, blocksize, hash_name, lister,
+                use_async, feedback
+            )
+
+        connect = partial(FTP_POOL.acquire, scheme, host, port, user, passwd)
+        ftp = connect()
 
         results = {}
+        reusable = True
 
         try:
             filename = os.path.basename(path)
-            temp_path = os.path.join(QgsProcessingUtils.tempFolder(), filename)
+            if resume:
+                # Servers on other ports of the same host keep their partial files apart
+                site = host if port == default_port(scheme) else f"{host}_{port}"
+                folder = os.path.join(RESUME_FOLDER, site)
+                os.makedirs(folder, exist_ok=True)
+                temp_path = os.path.join(folder, filename)
+            else:
+                temp_path = os.path.join(QgsProcessingUtils.tempFolder(), filename)
 
             feedback.pushInfo(f"Downloading to: {temp_path}")
 
-            with open(temp_path, "wb") as f:
-                ftp.retrbinary(f"RETR {path}", f.write)
+            size = remote_size(ftp, path)
+            monitor = TransferMonitor(feedback, size)
+            hasher = new_hasher(hash_name)
+
+            digest = None
+            if resume and segments > 1:
+                # The journal tracks one stream; parallel ranges could not be continued
+                feedback.reportError("Resume downloads in a single stream, ignoring the segment count")
+            if segments > 1 and not resume and size and supports_rest(ftp):
+                feedback.pushInfo(f"Segmented download: {segments} connections, {size} bytes")
+                digest = download_segmented(
+                    connect, path, size, temp_path, segments, blocksize, monitor, hash_name
+                )
+            elif resume:
+                _, digest = download_resumable(
+                    connect, path, temp_path, retries=retries, blocksize=blocksize,
+                    feedback=feedback, release=FTP_POOL.release, hash_name=hash_name
+                )
+            else:
+                if segments > 1:
+                    feedback.pushInfo("Server does not support SIZE/REST, using a single stream")
+                with open(temp_path, "wb") as f:
+                    ftp.retrbinary(f"RETR {path}", monitor.wrap(hashing(f.write, hasher)), blocksize)
+                if hasher:
+                    digest = hasher.hexdigest()
+
+            if hash_name:
+                if not expected:
+                    expected = fetch_remote_checksum(ftp, path, hash_name)
+                try:
+                    verify(hash_name, digest, expected, path)
+                except ChecksumMismatch as e:
+                    os.remove(temp_path)
+                    raise QgsProcessingException(str(e))
+
+                feedback.pushInfo(f"{hash_name}: {digest}" + (" (verified)" if expected else ""))
+                results[self.OUT_DIGEST] = digest
 
             results[self.OUT_FILEPATH] = temp_path
             results[self.OUT_FILE] = temp_path
@@ -159,20 +357,32 @@ class FTPcaller(QgsProcessingAlgorithm):
             # Store for postProcess
             if load_layers:
                 context.setAdditionalTempOutput("gpkg_load_target", temp_path)
+                context.setAdditionalTempOutput("gpkg_load_lazy", lazy_load)
 
-            feedback.pushInfo("Download complete")
+            if not resume:
+                feedback.pushInfo(f"Download complete: {monitor.summary()}")
+            else:
+                feedback.pushInfo("Download complete")
             QgsMessageLog.logMessage(f"Downloaded: {temp_path}", LOG_TAG)
 
+        except TransferCanceled:
+            reusable = False
+            abort_transfer(ftp)
+            feedback.pushInfo("Download canceled")
+            if not resume and os.path.exists(temp_path):
+                os.remove(temp_path)
+
         except all_errors as e:
+            reusable = False
             msg = f"FTP error: {e}"
             feedback.reportError(msg)
             QgsMessageLog.logMessage(msg, LOG_TAG)
 
             # Fallback: list directory
             try:
-                listing = ftp.nlst(path)
                 results[self.OUT_LIST] = [
-                    f"{scheme}://{host}/{item}" for item in listing
+                    ftp_url(scheme, host, port, posixpath.join(path, name))
+                    for name, _ in lister(ftp, path)
                 ]
             except all_errors as e2:
                 errmsg = f"Directory listing failed: {e2}"
@@ -181,10 +391,46 @@ class FTPcaller(QgsProcessingAlgorithm):
                 results[self.OUT_LIST] = []
 
         finally:
-            ftp.close()
+            FTP_POOL.release(ftp, reusable)
 
         return results
 
+    def downloadBatch(self, patterns, key, workers, blocksize, hash_name, lister, use_async, feedback):
+
+        try:
+            with FTP_POOL.connection(*key) as ftp:
+                # A file named twice is fetched once
+                remote_paths = list(dict.fromkeys(expand_remote(ftp, patterns, lister)))
+        except all_errors as e:
+            msg = f"FTP error: {e}"
+            feedback.reportError(msg)
+            QgsMessageLog.logMessage(msg, LOG_TAG)
+            return {self.OUT_FILES: [], self.OUT_STATUS: []}
+
+        jobs = list(zip(remote_paths, local_paths(remote_paths, QgsProcessingUtils.tempFolder())))
+
+        feedback.pushInfo(
+            f"Batch download: {len(jobs)} files, {workers} connections"
+            + (" (asyncio)" if use_async else "")
+        )
+
+        if use_async:
+            statuses = download_many_async(
+                *key, jobs,
+                concurrency=workers, blocksize=blocksize, feedback=feedback, hash_name=hash_name
+            )
+        else:
+            statuses = download_many(
+                partial(FTP_POOL.connection, *key), jobs,
+                workers=workers, blocksize=blocksize, feedback=feedback, hash_name=hash_name
+            )
+
+        files = [s["local"] for s in statuses if s["status"] == "ok"]
+        feedback.pushInfo(f"Downloaded {len(files)} of {len(jobs)} files")
+        QgsMessageLog.logMessage(f"Batch downloaded {len(files)} of {len(jobs)} files", LOG_TAG)
+
+        return {self.OUT_FILES: files, self.OUT_STATUS: statuses}
+
     # -------------------------------------------------------------------
     # Load layers from GeoPackage
     # -------------------------------------------------------------------
@@ -196,20 +442,8 @@ class FTPcaller(QgsProcessingAlgorithm):
 
         feedback.pushInfo(f"Loading layers from: {gpkg_path}")
 
-        md = QgsProviderRegistry.instance().providerMetadata("ogr")
-        conn = md.createConnection(gpkg_path, {})
-
-        root = QgsProject.instance().layerTreeRoot()
-
-        for tbl in conn.tables("", conn.TableFlags()):
-            name = tbl.tableName()
-            uri = f"{gpkg_path}|layername={name}"
-            layer = QgsVectorLayer(uri, name, "ogr")
-
-            if layer.isValid():
-                QgsProject.instance().addMapLayer(layer, False)
-                root.addLayer(layer)
-                feedback.pushInfo(f"Loaded layer: {name}")
+        lazy = bool(context.additionalTempOutput("gpkg_load_lazy"))
+        load_gpkg_layers(gpkg_path, lazy=lazy, feedback=feedback)
 
         return {}
 
@@ -229,7 +463,11 @@ class FTPcaller(QgsProcessingAlgorithm):
         return "ETL"
 
     def shortHelpString(self):
-        return "Call an FTP/FTPS server from QGIS 3.40+ and optionally load downloaded layers."
+        return (
+            "Call an FTP/FTPS server from QGIS 3.40+ and optionally load downloaded layers.\n\n"
+            "Use a glob in the file name (ftps://host/dir/*.zip) or list additional paths "
+            "to download several files at once over concurrent connections."
+        )
 
     def createInstance(self):
         return FTPcaller()
@@ -0,0 +1,215 @@
+"""
+Mirror a remote FTP/FTPS folder incrementally
+Name : FTPmirror
+Group : ETL
+With QGIS : 34000
+"""
+
+import json
+import os
+import posixpath
+from functools import partial
+from ftplib import all_errors
+
+from qgis.core import (
+    QgsProcessingAlgorithm,
+    QgsProcessingException,
+    QgsProcessingParameterNumber,
+    QgsProcessingParameterString,
+    QgsProcessingParameterFolderDestination,
+    QgsProcessingOutputVariant,
+    QgsMessageLog,
+    QgsProcessingContext
+)
+
+from .ftp_utils import parse_ftp_url, probe_remote, walk_remote, download_many
+from .ftp_pool import FTP_POOL
+
+LOG_TAG = "FTPmirror"
+
+MANIFEST_NAME = ".ftpmirror.json"
+
+
+# -------------------------------------------------------------------
+# Manifest helpers
+# -------------------------------------------------------------------
+def read_manifest(folder):
+    try:
+        with open(os.path.join(folder, MANIFEST_NAME), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_manifest(folder, manifest):
+    path = os.path.join(folder, MANIFEST_NAME)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(path + ".tmp", path)
+
+
+def is_changed(entry, facts, local_path):
+    """
+    A file is fetched when it is new, missing locally or differs in
+    size/modify, and always when the listing gave neither (NLST).
+    """
+    if entry is None or not os.path.exists(local_path):
+        return True
+    if facts["size"] is None and facts["modify"] is None:
+        return True
+    return entry.get("size") != facts["size"] or entry.get("modify") != facts["modify"]
+
+
+# -------------------------------------------------------------------
+# Processing Algorithm
+# -------------------------------------------------------------------
+class FTPmirror(QgsProcessingAlgorithm):
+
+    PARAM_HOST = "HOST"
+    PARAM_USER = "USER"
+    PARAM_PASS = "PASSWD"
+    PARAM_WORKERS = "WORKERS"
+    PARAM_DEST = "DEST"
+
+    OUT_DOWNLOADED = "DOWNLOADED"
+    OUT_SKIPPED = "SKIPPED"
+    OUT_FAILED = "FAILED"
+
+    def initAlgorithm(self, config=None):
+
+        self.addParameter(QgsProcessingParameterString(
+            name=self.PARAM_HOST,
+            description="FTP/FTPS folder URL"
+        ))
+
+        self.addParameter(QgsProcessingParameterString(
+            name=self.PARAM_USER,
+            description="Username"
+        ))
+
+        self.addParameter(QgsProcessingParameterString(
+            name=self.PARAM_PASS,
+            description="Password"
+        ))
+
+        self.addParameter(QgsProcessingParameterNumber(
+            name=self.PARAM_WORKERS,
+            description="Concurrent connections",
+            type=QgsProcessingParameterNumber.Integer,
+            defaultValue=4,
+            minValue=1,
+            maxValue=32
+        ))
+
+        self.addParameter(QgsProcessingParameterFolderDestination(
+            name=self.PARAM_DEST,
+            description="Local mirror folder"
+        ))
+
+        self.addOutput(QgsProcessingOutputVariant(
+            self.OUT_DOWNLOADED,
+            "Downloaded files"
+        ))
+
+        self.addOutput(QgsProcessingOutputVariant(
+            self.OUT_SKIPPED,
+            "Unchanged files"
+        ))
+
+        self.addOutput(QgsProcessingOutputVariant(
+            self.OUT_FAILED,
+            "Failed files"
+        ))
+
+    # -------------------------------------------------------------------
+    # Main logic
+    # -------------------------------------------------------------------
+    def processAlgorithm(self, parameters, context: QgsProcessingContext, feedback):
+
+        host_str = self.parameterAsString(parameters, self.PARAM_HOST, context)
+        user = self.parameterAsString(parameters, self.PARAM_USER, context)
+        passwd = self.parameterAsString(parameters, self.PARAM_PASS, context)
+        workers = self.parameterAsInt(parameters, self.PARAM_WORKERS, context)
+        dest = self.parameterAsString(parameters, self.PARAM_DEST, context)
+
+        os.makedirs(dest, exist_ok=True)
+
+        scheme, host, port, root = parse_ftp_url(host_str)
+        root = root or "/"
+        key = (scheme, host, port, user, passwd)
+
+        feedback.pushInfo(f"Walking: {host_str}")
+        QgsMessageLog.logMessage(f"Mirroring {host_str} to {dest}", LOG_TAG)
+
+        try:
+            with FTP_POOL.connection(*key) as ftp:
+                # Change detection needs size and modify for every file, so
+                # servers without MLSD are probed per entry
+                remote = list(walk_remote(ftp, root, probe_remote))
+        except all_errors as e:
+            raise QgsProcessingException(f"Remote listing failed: {e}")
+
+        manifest = read_manifest(dest)
+        pending, skipped = [], []
+
+        for remote_path, facts in remote:
+            rel = posixpath.relpath(remote_path, root)
+            local_path = os.path.join(dest, *rel.split("/"))
+            if is_changed(manifest.get(rel), facts, local_path):
+                pending.append((rel, remote_path, local_path, facts))
+            else:
+                skipped.append(local_path)
+
+        feedback.pushInfo(
+            f"{len(remote)} remote files, {len(pending)} new or changed, {len(skipped)} unchanged"
+        )
+
+        statuses = download_many(
+            partial(FTP_POOL.connection, *key),
+            [(remote_path, local_path) for _, remote_path, local_path, _ in pending],
+            workers=workers,
+            feedback=feedback
+        )
+
+        downloaded, failed = [], []
+        for (rel, _, _, facts), status in zip(pending, statuses):
+            if status["status"] == "ok":
+                manifest[rel] = {"size": facts["size"], "modify": facts["modify"]}
+                downloaded.append(status["local"])
+            elif status["status"] == "failed":
+                failed.append(status["remote"])
+
+        write_manifest(dest, manifest)
+
+        feedback.pushInfo(f"Mirror complete: {len(downloaded)} downloaded, {len(failed)} failed")
+
+        return {
+            self.PARAM_DEST: dest,
+            self.OUT_DOWNLOADED: downloaded,
+            self.OUT_SKIPPED: skipped,
+            self.OUT_FAILED: failed
+        }
+
+    # -------------------------------------------------------------------
+    # Metadata
+    # -------------------------------------------------------------------
+    def name(self):
+        return "FTPmirror"
+
+    def displayName(self):
+        return "FTPmirror"
+
+    def group(self):
+        return "ETL"
+
+    def groupId(self):
+        return "ETL"
+
+    def shortHelpString(self):
+        return (
+            "Mirror a remote FTP/FTPS folder into a local folder. Only files that are "
+            "new or changed (size or modification time) since the last run are downloaded."
+        )
+
+    def createInstance(self):
+        return FTPmirror()
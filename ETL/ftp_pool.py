@@ -0,0 +1,127 @@
+"""
+Process-wide pool of logged-in FTP/FTPS sessions
+"""
+
+import ssl
+import threading
+import time
+from contextlib import contextmanager
+from ftplib import all_errors
+
+from .ftp_utils import open_ftp
+
+IDLE_TIMEOUT = 60.0
+HEALTH_CHECK_AFTER = 5.0
+MAX_IDLE_PER_KEY = 8
+
+
+class FTPPool:
+    """
+    Keeps idle sessions keyed by (scheme, host, port, user).
+
+    Sessions idle longer than idle_timeout are dropped, and sessions idle
+    longer than HEALTH_CHECK_AFTER are probed with NOOP before they are
+    handed out. FTPS sessions to the same key share one SSL context so new
+    control connections can resume the last TLS session.
+    """
+
+    def __init__(self, idle_timeout=IDLE_TIMEOUT, max_idle_per_key=MAX_IDLE_PER_KEY):
+        self.idle_timeout = idle_timeout
+        self.max_idle_per_key = max_idle_per_key
+        self._idle = {}
+        self._tls = {}
+        self._lock = threading.Lock()
+
+    # -------------------------------------------------------------------
+    # Opening sessions
+    # -------------------------------------------------------------------
+    def open(self, scheme, host, port, user, passwd):
+        """Open a new session, resuming the key's TLS session for FTPS."""
+        key = (scheme, host, port, user)
+        context = session = None
+
+        if scheme in ("ftps", "ftpes"):
+            with self._lock:
+                if key not in self._tls:
+                    context = ssl.create_default_context()
+                    context.check_hostname = False
+                    context.verify_mode = ssl.CERT_NONE
+                    self._tls[key] = [context, None]
+                context, session = self._tls[key]
+
+        ftp = open_ftp(scheme, host, port, user, passwd, context=context, session=session)
+        ftp.pool_key = key
+
+        new_session = getattr(ftp.sock, "session", None)
+        if new_session is not None:
+            with self._lock:
+                self._tls[key][1] = new_session
+
+        return ftp
+
+    def acquire(self, scheme, host, port, user, passwd):
+        """Return an idle healthy session for the key, or open a new one."""
+        key = (scheme, host, port, user)
+
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                if not idle:
+                    break
+                ftp, last_used = idle.pop()
+
+            idle_for = time.monotonic() - last_used
+            if idle_for > self.idle_timeout:
+                ftp.close()
+                continue
+            if idle_for > HEALTH_CHECK_AFTER:
+                try:
+                    ftp.voidcmd("NOOP")
+                except all_errors:
+                    ftp.close()
+                    continue
+            return ftp
+
+        return self.open(scheme, host, port, user, passwd)
+
+    def release(self, ftp, reusable=True):
+        """Give a session back. Sessions in an unknown state are closed."""
+        key = getattr(ftp, "pool_key", None)
+        if not reusable or key is None or ftp.sock is None:
+            ftp.close()
+            return
+
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle_per_key:
+                idle.append((ftp, time.monotonic()))
+                return
+
+        ftp.close()
+
+    @contextmanager
+    def connection(self, scheme, host, port, user, passwd):
+        """Borrow a session for a with-block; it is dropped if the block raises."""
+        ftp = self.acquire(scheme, host, port, user, passwd)
+        try:
+            yield ftp
+        except BaseException:
+            self.release(ftp, reusable=False)
+            raise
+        self.release(ftp)
+
+    def clear(self):
+        """Close every idle session."""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+            self._tls = {}
+
+        for sessions in idle.values():
+            for ftp, _ in sessions:
+                try:
+                    ftp.quit()
+                except all_errors:
+                    ftp.close()
+
+
+FTP_POOL = FTPPool()
@@ -0,0 +1,189 @@
+"""
+Upload files to an FTP/FTPS server
+Name : FTPuploader
+Group : ETL
+With QGIS : 34000
+"""
+
+import os
+import posixpath
+from functools import partial
+from ftplib import all_errors
+
+from qgis.core import (
+    QgsProcessingAlgorithm,
+    QgsProcessingException,
+    QgsProcessingParameterBoolean,
+    QgsProcessingParameterFile,
+    QgsProcessingParameterNumber,
+    QgsProcessingParameterString,
+    QgsProcessingOutputVariant,
+    QgsMessageLog,
+    QgsProcessingContext
+)
+
+from .ftp_utils import parse_ftp_url, upload_many
+from .ftp_pool import FTP_POOL
+from .listing_cache import LISTING_CACHE, DB_PATH, listing_key
+
+LOG_TAG = "FTPuploader"
+
+
+# -------------------------------------------------------------------
+# Processing Algorithm
+# -------------------------------------------------------------------
+class FTPuploader(QgsProcessingAlgorithm):
+
+    PARAM_HOST = "HOST"
+    PARAM_USER = "USER"
+    PARAM_PASS = "PASSWD"
+    PARAM_SOURCE = "SOURCE"
+    PARAM_FOLDER = "FOLDER"
+    PARAM_WORKERS = "WORKERS"
+    PARAM_RESUME = "RESUME"
+
+    OUT_UPLOADED = "UPLOADED"
+    OUT_FAILED = "FAILED"
+    OUT_STATUS = "STATUS"
+
+    def initAlgorithm(self, config=None):
+
+        self.addParameter(QgsProcessingParameterString(
+            name=self.PARAM_HOST,
+            description="FTP/FTPS target folder URL"
+        ))
+
+        self.addParameter(QgsProcessingParameterString(
+            name=self.PARAM_USER,
+            description="Username"
+        ))
+
+        self.addParameter(QgsProcessingParameterString(
+            name=self.PARAM_PASS,
+            description="Password"
+        ))
+
+        self.addParameter(QgsProcessingParameterFile(
+            name=self.PARAM_SOURCE,
+            description="File to upload",
+            behavior=QgsProcessingParameterFile.File,
+            optional=True
+        ))
+
+        self.addParameter(QgsProcessingParameterFile(
+            name=self.PARAM_FOLDER,
+            description="Folder to upload (recursively)",
+            behavior=QgsProcessingParameterFile.Folder,
+            optional=True
+        ))
+
+        self.addParameter(QgsProcessingParameterNumber(
+            name=self.PARAM_WORKERS,
+            description="Concurrent connections",
+            type=QgsProcessingParameterNumber.Integer,
+            defaultValue=4,
+            minValue=1,
+            maxValue=32
+        ))
+
+        self.addParameter(QgsProcessingParameterBoolean(
+            name=self.PARAM_RESUME,
+            description="Resume interrupted uploads",
+            defaultValue=True
+        ))
+
+        self.addOutput(QgsProcessingOutputVariant(
+            self.OUT_UPLOADED,
+            "Uploaded remote paths"
+        ))
+
+        self.addOutput(QgsProcessingOutputVariant(
+            self.OUT_FAILED,
+            "Failed local files"
+        ))
+
+        self.addOutput(QgsProcessingOutputVariant(
+            self.OUT_STATUS,
+            "Per-file status"
+        ))
+
+    # -------------------------------------------------------------------
+    # Main logic
+    # -------------------------------------------------------------------
+    def processAlgorithm(self, parameters, context: QgsProcessingContext, feedback):
+
+        host_str = self.parameterAsString(parameters, self.PARAM_HOST, context)
+        user = self.parameterAsString(parameters, self.PARAM_USER, context)
+        passwd = self.parameterAsString(parameters, self.PARAM_PASS, context)
+        source = self.parameterAsFile(parameters, self.PARAM_SOURCE, context)
+        folder = self.parameterAsFile(parameters, self.PARAM_FOLDER, context)
+        workers = self.parameterAsInt(parameters, self.PARAM_WORKERS, context)
+        resume = self.parameterAsBoolean(parameters, self.PARAM_RESUME, context)
+
+        scheme, host, port, root = parse_ftp_url(host_str)
+        root = root or "/"
+        key = (scheme, host, port, user, passwd)
+
+        jobs = []
+        if source:
+            jobs.append((source, posixpath.join(root, os.path.basename(source))))
+        if folder:
+            for dirpath, _, names in os.walk(folder):
+                for name in sorted(names):
+                    local_path = os.path.join(dirpath, name)
+                    rel = os.path.relpath(local_path, folder).replace(os.sep, "/")
+                    jobs.append((local_path, posixpath.join(root, rel)))
+
+        if not jobs:
+            raise QgsProcessingException("Nothing to upload: give a file or a folder.")
+
+        feedback.pushInfo(f"Uploading {len(jobs)} files to {host_str} over {workers} connections")
+        QgsMessageLog.logMessage(f"Uploading {len(jobs)} files to {host_str}", LOG_TAG)
+
+        try:
+            statuses = upload_many(
+                partial(FTP_POOL.connection, *key), jobs,
+                workers=workers, feedback=feedback, resume=resume
+            )
+        except all_errors as e:
+            raise QgsProcessingException(f"FTP error: {e}")
+
+        # Cached listings of this server no longer match what is on it
+        LISTING_CACHE.invalidate(listing_key(scheme, host, port, user), db_path=DB_PATH)
+
+        uploaded = [s["remote"] for s in statuses if s["status"] == "ok"]
+        failed = [s["local"] for s in statuses if s["status"] == "failed"]
+
+        feedback.pushInfo(f"Upload complete: {len(uploaded)} uploaded, {len(failed)} failed")
+        QgsMessageLog.logMessage(f"Uploaded {len(uploaded)} of {len(jobs)} files", LOG_TAG)
+
+        return {
+            self.OUT_UPLOADED: uploaded,
+            self.OUT_FAILED: failed,
+            self.OUT_STATUS: statuses
+        }
+
+    # -------------------------------------------------------------------
+    # Metadata
+    # -------------------------------------------------------------------
+    def name(self):
+        return "FTPuploader"
+
+    def displayName(self):
+        return "FTPuploader"
+
+    def group(self):
+        return "ETL"
+
+    def groupId(self):
+        return "ETL"
+
+    def shortHelpString(self):
+        return (
+            "Upload a file or a whole folder to an FTP/FTPS server over concurrent "
+            "connections. Each file is written to a temporary .part name and renamed "
+            "when complete; interrupted uploads are resumed."
+        )
+
+    def createInstance(self):
+        return FTPuploader()
@@ -0,0 +1,905 @@
+"""
+Shared FTP/FTPS helpers for the ETL algorithms
+"""
+
+import fnmatch
+import json
+import os
+import posixpath
+import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from ftplib import FTP_TLS, FTP, all_errors, error_perm
+from io import BytesIO
+from urllib.parse import urlparse
+
+from .checksum import ChecksumMismatch, new_hasher, hashing, hash_file, parse_checksum, verify
+
+BLOCKSIZE = 64 * 1024
+PART_SUFFIX = ".part"
+JOURNAL_SUFFIX = ".part.json"
+
+
+# -------------------------------------------------------------------
+# Custom implicit FTPS class
+# -------------------------------------------------------------------
+class ImplicitFTP_TLS(FTP_TLS):
+    """FTP_TLS subclass supporting implicit FTPS."""
+
+    def __init__(self, *args, ignore_PASV_host=False, session=None, **kwargs):
+        self.ignore_PASV_host = ignore_PASV_host
+        self.tls_session = session
+        super().__init__(*args, **kwargs)
+        self._sock = None
+
+    @property
+    def sock(self):
+        return self._sock
+
+    @sock.setter
+    def sock(self, value):
+        if value and not isinstance(value, ssl.SSLSocket):
+            value = self.context.wrap_socket(value, session=self.tls_session)
+        self._sock = value
+
+    def ntransfercmd(self, cmd, rest=None):
+        conn, size = FTP.ntransfercmd(self, cmd, rest)
+        conn = self.sock.context.wrap_socket(
+            conn,
+            server_hostname=self.host,
+            session=getattr(self.sock, "session", None)
+        )
+        return conn, size
+
+    def makepasv(self):
+        host, port = super().makepasv()
+        if self.ignore_PASV_host:
+            return self.host, port
+        return host, port
+
+
+class ExplicitFTP_TLS(FTP_TLS):
+    """FTP_TLS subclass whose connections resume TLS sessions, for explicit FTPS."""
+
+    def __init__(self, *args, session=None, **kwargs):
+        self.tls_session = session
+        super().__init__(*args, **kwargs)
+
+    def auth(self):
+        if isinstance(self.sock, ssl.SSLSocket):
+            raise ValueError("Already using TLS")
+        resp = self.voidcmd("AUTH TLS")
+        self.sock = self.context.wrap_socket(self.sock, server_hostname=self.host, session=self.tls_session)
+        self.file = self.sock.makefile(mode="r", encoding=self.encoding)
+        return resp
+
+    def ntransfercmd(self, cmd, rest=None):
+        conn, size = FTP.ntransfercmd(self, cmd, rest)
+        if self._prot_p:
+            conn = self.context.wrap_socket(
+                conn,
+                server_hostname=self.host,
+                session=getattr(self.sock, "session", None)
+            )
+        return conn, size
+
+
+# -------------------------------------------------------------------
+# Connection helpers
+# -------------------------------------------------------------------
+def parse_ftp_url(url):
+    """
+    Split an ftp://, ftps:// (implicit TLS) or ftpes:// (explicit TLS) URL
+    into (scheme, host, port, path).
+    """
+    parsed = urlparse(url)
+    scheme = parsed.scheme or "ftp"
+    port = parsed.port or default_port(scheme)
+    return scheme, parsed.hostname, port, parsed.path
+
+
+def default_port(scheme):
+    return 990 if scheme == "ftps" else 21
+
+
+def ftp_url(scheme, host, port, path):
+    """Join parse_ftp_url's parts back into a URL, naming the port only when it is not the default."""
+    netloc = f"[{host}]" if ":" in host else host
+    if port != default_port(scheme):
+        netloc += f":{port}"
+    return f"{scheme}://{netloc}{path}"
+
+
+def open_ftp(scheme, host, port, user, passwd, context=None, session=None):
+    """Connect, log in and switch to binary mode."""
+    if scheme == "ftps":
+        ftp = ImplicitFTP_TLS(ignore_PASV_host=True, context=context, session=session)
+    elif scheme == "ftpes":
+        ftp = ExplicitFTP_TLS(context=context, session=session)
+    else:
+        ftp = FTP()
+
+    ftp.connect(host=host, port=port)
+    ftp.login(user=user, passwd=passwd)
+    if scheme == "ftpes":
+        ftp.prot_p()
+    ftp.voidcmd("TYPE I")
+    return ftp
+
+
+def close_ftp(ftp, reusable=True):
+    """Default release callback: sessions are not kept between uses."""
+    ftp.close()
+
+
+def remote_size(ftp, path):
+    """Return the remote file size, or None if the server will not tell."""
+    try:
+        return ftp.size(path)
+    except all_errors:
+        return None
+
+
+def remote_mdtm(ftp, path):
+    """Return the MDTM timestamp string of a remote file, or None."""
+    try:
+        return ftp.sendcmd(f"MDTM {path}")[4:].strip()
+    except all_errors:
+        return None
+
+
+def supports_rest(ftp):
+    """Check whether the server accepts REST for stream mode transfers."""
+    try:
+        if "REST STREAM" in ftp.sendcmd("FEAT").upper():
+            return True
+    except all_errors:
+        pass
+
+    try:
+        ftp.sendcmd("REST 0")
+        return True
+    except all_errors:
+        return False
+
+
+# -------------------------------------------------------------------
+# Progress and cancellation
+# -------------------------------------------------------------------
+class TransferCanceled(Exception):
+    """Raised from inside a transfer when the user cancels."""
+
+
+class TransferMonitor:
+    """
+    Counts transferred bytes for one or more concurrent transfers.
+
+    update() is called for every block. It raises TransferCanceled as soon
+    as the feedback is canceled and, at most once per interval, reports
+    progress (when the total is known), throughput and ETA.
+    """
+
+    def __init__(self, feedback=None, total=None, done=0, interval=1.0):
+        self.feedback = feedback
+        self.total = total
+        self.done = done
+        self.interval = interval
+        self._start_done = done
+        self._started = self._reported = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wrap(self, write):
+        """Wrap a write callback for retrbinary."""
+        def callback(block):
+            self.update(len(block))
+            write(block)
+        return callback
+
+    def update(self, nbytes):
+        if self.feedback is not None and self.feedback.isCanceled():
+            raise TransferCanceled()
+
+        with self._lock:
+            self.done += nbytes
+            now = time.monotonic()
+            if now - self._reported < self.interval:
+                return
+            self._reported = now
+
+        self.report()
+
+    def rate(self):
+        elapsed = time.monotonic() - self._started
+        return (self.done - self._start_done) / elapsed if elapsed > 0 else 0.0
+
+    def summary(self):
+        rate = self.rate()
+        text = f"{self.done / 1e6:.1f} MB"
+        if self.total:
+            text += f" of {self.total / 1e6:.1f} MB"
+        text += f" at {rate / 1e6:.1f} MB/s"
+        if self.total and rate > 0:
+            eta = int((self.total - self.done) / rate)
+            text += f", ETA {eta // 3600}:{eta // 60 % 60:02d}:{eta % 60:02d}"
+        return text
+
+    def report(self):
+        if self.feedback is None:
+            return
+        if self.total:
+            self.feedback.setProgress(100 * self.done / self.total)
+        self.feedback.setProgressText(self.summary())
+
+
+def cancelable_sleep(delay, feedback=None):
+    """Sleep for delay seconds, waking up to raise TransferCanceled on cancel."""
+    end = time.monotonic() + delay
+    while time.monotonic() < end:
+        if feedback is not None and feedback.isCanceled():
+            raise TransferCanceled()
+        time.sleep(max(0.0, min(0.2, end - time.monotonic())))
+
+
+def abort_transfer(ftp):
+    """Send ABOR after a canceled transfer; the session is not reused afterwards."""
+    try:
+        ftp.abort()
+    except all_errors:
+        pass
+
+
+def fetch_remote_checksum(ftp, remote_path, name):
+    """Read a `<file>.md5`/`<file>.sha256` sibling from the server, or None."""
+    buf = BytesIO()
+    try:
+        ftp.retrbinary(f"RETR {remote_path}.{name}", buf.write)
+    except all_errors:
+        return None
+    return parse_checksum(buf.getvalue().decode("ascii", "replace"), posixpath.basename(remote_path))
+
+
+# -------------------------------------------------------------------
+# Remote listings
+# -------------------------------------------------------------------
+def _is_remote_dir(ftp, path):
+    cwd = ftp.pwd()
+    try:
+        ftp.cwd(path)
+        return True
+    except all_errors:
+        return False
+    finally:
+        ftp.cwd(cwd)
+
+
+def probe_facts(ftp, path):
+    """Facts of one remote entry from SIZE and MDTM, with CWD telling folders apart."""
+    size = remote_size(ftp, path)
+    if size is None and _is_remote_dir(ftp, path):
+        return {"type": "dir", "size": None, "modify": None}
+    return {"type": "file", "size": size, "modify": remote_mdtm(ftp, path)}
+
+
+def _known(ftp, full, facts):
+    return probe_facts(ftp, full) if facts["type"] == "unknown" else facts
+
+
+def list_remote(ftp, path):
+    """
+    List a remote directory as [(name, facts)] with type, size and modify.
+
+    Uses MLSD when the server has it. The NLST fallback is one round trip
+    too, so it gives names only: size and modify are None and the type is
+    "unknown" unless the server marks a folder with a trailing slash.
+    """
+    try:
+        entries = [
+            (name, {
+                "type": facts.get("type", "file").lower(),
+                "size": int(facts["size"]) if "size" in facts else None,
+                "modify": facts.get("modify")
+            })
+            for name, facts in ftp.mlsd(path, facts=["type", "size", "modify"])
+            if facts.get("type", "").lower() not in ("cdir", "pdir")
+        ]
+        # Listings switch the session to ASCII, SIZE and REST need binary
+        ftp.voidcmd("TYPE I")
+        return entries
+    except all_errors:
+        pass
+
+    entries = []
+    names = ftp.nlst(path)
+    ftp.voidcmd("TYPE I")
+
+    for item in names:
+        name = posixpath.basename(item.rstrip("/"))
+        if name in (".", ".."):
+            continue
+        kind = "dir" if item.endswith("/") else "unknown"
+        entries.append((name, {"type": kind, "size": None, "modify": None}))
+    return entries
+
+
+def probe_remote(ftp, path):
+    """
+    list_remote with full facts for every entry: where only NLST answers,
+    each entry costs SIZE plus MDTM or CWD, a round trip per file.
+    """
+    return [
+        (name, _known(ftp, posixpath.join(path, name), facts))
+        for name, facts in list_remote(ftp, path)
+    ]
+
+
+def walk_remote(ftp, path, lister=list_remote):
+    """Yield (remote_path, facts) for every file below path."""
+    for name, facts in lister(ftp, path):
+        full = posixpath.join(path, name)
+        facts = _known(ftp, full, facts)
+        if facts["type"] == "dir":
+            yield from walk_remote(ftp, full, lister)
+        elif facts["type"] == "file":
+            yield full, facts
+
+
+def has_glob(path):
+    return any(c in posixpath.basename(path) for c in "*?[")
+
+
+def expand_remote(ftp, patterns, lister=list_remote):
+    """
+    Expand glob patterns in the last path component to matching remote
+    files. Entries of unknown type are probed only when their name matches.
+    """
+    paths = []
+    for pattern in patterns:
+        if not has_glob(pattern):
+            paths.append(pattern)
+            continue
+        folder, mask = posixpath.split(pattern)
+        for name, facts in lister(ftp, folder or "/"):
+            full = posixpath.join(folder, name)
+            if fnmatch.fnmatchcase(name, mask) and _known(ftp, full, facts)["type"] == "file":
+                paths.append(full)
+    return paths
+
+
+def local_paths(remote_paths, folder):
+    """
+    Map remote files to paths under a local folder, keeping each one's
+    path below the deepest folder they all share, so files of the same
+    name in different folders do not overwrite each other.
+    """
+    paths = [posixpath.normpath(posixpath.join("/", p)) for p in remote_paths]
+    if not paths:
+        return []
+    root = posixpath.commonpath([posixpath.dirname(p) for p in paths])
+    return [os.path.join(folder, *posixpath.relpath(p, root).split("/")) for p in paths]
+
+
+# -------------------------------------------------------------------
+# Batch download
+# -------------------------------------------------------------------
+def download_file(ftp, remote_path, local_path, blocksize=BLOCKSIZE, monitor=None, hasher=None):
+    """RETR into a .part file and move it into place once complete."""
+    part_path = local_path + PART_SUFFIX
+    try:
+        with open(part_path, "wb") as f:
+            write = hashing(f.write, hasher)
+            ftp.retrbinary(f"RETR {remote_path}", monitor.wrap(write) if monitor else write, blocksize)
+    except TransferCanceled:
+        abort_transfer(ftp)
+        os.remove(part_path)
+        raise
+    except all_errors:
+        os.remove(part_path)
+        raise
+    os.replace(part_path, local_path)
+
+
+def download_many(connection, jobs, workers=4, blocksize=BLOCKSIZE, feedback=None, hash_name=None):
+    """
+    Download [(remote_path, local_path)] jobs over up to `workers` sessions.
+
+    connection() must return a context manager yielding a logged-in session.
+    Returns one status dict per job, in job order; failures are reported
+    per file and do not stop the others. With hash_name each file is
+    hashed while it arrives and checked against a checksum sibling on the
+    server when there is one.
+    """
+    monitor = TransferMonitor(feedback)
+
+    def fetch(remote_path, local_path):
+        if feedback and feedback.isCanceled():
+            return "canceled", None
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        hasher = new_hasher(hash_name)
+        expected = None
+        with connection() as ftp:
+            download_file(ftp, remote_path, local_path, blocksize, monitor, hasher)
+            if hasher:
+                expected = fetch_remote_checksum(ftp, remote_path, hash_name)
+        if not hasher:
+            return "ok", None
+        try:
+            verify(hash_name, hasher.hexdigest(), expected, remote_path)
+        except ChecksumMismatch:
+            os.remove(local_path)
+            raise
+        return "ok", hasher.hexdigest()
+
+    statuses = [None] * len(jobs)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {
+            pool.submit(fetch, remote_path, local_path): i
+            for i, (remote_path, local_path) in enumerate(jobs)
+        }
+        for done, future in enumerate(as_completed(futures), 1):
+            i = futures[future]
+            remote_path, local_path = jobs[i]
+            error = digest = None
+            try:
+                status, digest = future.result()
+            except TransferCanceled:
+                status = "canceled"
+            except (ChecksumMismatch, *all_errors) as e:
+                status, error = "failed", str(e)
+                if feedback:
+                    feedback.reportError(f"{remote_path}: {e}")
+
+            statuses[i] = {
+                "remote": remote_path,
+                "local": local_path,
+                "status": status,
+                "error": error,
+                "digest": digest
+            }
+            if feedback:
+                feedback.setProgress(100 * done / len(jobs))
+
+    if feedback:
+        feedback.pushInfo(f"Transferred {monitor.summary()}")
+
+    return statuses
+
+
+# -------------------------------------------------------------------
+# Segmented download
+# -------------------------------------------------------------------
+def split_ranges(size, segments):
+    """Split size bytes into at most `segments` (offset, length) ranges."""
+    step = max(1, -(-size // segments))
+    return [(start, min(step, size - start)) for start in range(0, size, step)]
+
+
+def contiguous_prefix(ranges):
+    """Bytes from the start of the file that are on disk, given [offset, length, done] ranges."""
+    ready = 0
+    for offset, length, done in ranges:
+        ready = offset + done
+        if done < length:
+            break
+    return ready
+
+
+class TailReader:
+    """
+    Reads the contiguous prefix of a growing .part file in order, on a
+    thread of its own while the ranges are still arriving, and feeds it to
+    a hasher and a consumer.
+
+    An exception from the consumer is kept in `error` and stops feeding
+    the consumer; the hasher still gets every byte. `fed` is the number
+    of bytes read so far.
+    """
+
+    def __init__(self, part_path, consumer=None, hasher=None, blocksize=BLOCKSIZE):
+        self.part_path = part_path
+        self.consumer = consumer
+        self.hasher = hasher
+        self.blocksize = blocksize
+        self.error = None
+        self.fed = 0
+        self._ready = 0
+        self._closed = False
+        self._aborted = False
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def advance(self, ready):
+        with self._cond:
+            if ready > self._ready:
+                self._ready = ready
+                self._cond.notify()
+
+    def abandon(self, reason):
+        """Stop feeding for good, e.g. when bytes already fed are rewritten."""
+        with self._cond:
+            if self.error is None:
+                self.error = reason
+            self._aborted = True
+            self._cond.notify()
+
+    def close(self, abort=False):
+        """Wait until everything ready has been fed, or stop at once with abort."""
+        with self._cond:
+            self._closed = True
+            self._aborted = self._aborted or abort
+            self._cond.notify()
+        self._thread.join()
+
+    def _feed(self, block):
+        if self.hasher is not None:
+            self.hasher.update(block)
+        if self.consumer is not None:
+            try:
+                self.consumer(block)
+            except Exception as e:
+                self.error = e
+                self.consumer = None
+
+    def _run(self):
+        try:
+            # Unbuffered: a buffered reader reads ahead into ranges that are
+            # still preallocated zeros and would hand those out later
+            with open(self.part_path, "rb", buffering=0) as f:
+                while self.consumer is not None or self.hasher is not None:
+                    with self._cond:
+                        while self.fed >= self._ready and not self._closed and not self._aborted:
+                            self._cond.wait()
+                        if self._aborted or self.fed >= self._ready:
+                            return
+                        end = self._ready
+                    f.seek(self.fed)
+                    block = f.read(min(self.blocksize, end - self.fed))
+                    if not block:
+                        return
+                    self.fed += len(block)
+                    self._feed(block)
+        except OSError as e:
+            with self._cond:
+                if self.error is None:
+                    self.error = e
+
+
+def download_range(connect, path, offset, length, local_path, blocksize=BLOCKSIZE, monitor=None,
+                   progress=None):
+    """
+    Fetch one byte range on its own connection and write it in place;
+    progress(n) is called once each block is on disk.
+    """
+    ftp = connect()
+    remaining = length
+
+    try:
+        conn = ftp.transfercmd(f"RETR {path}", rest=offset)
+        try:
+            with open(local_path, "r+b") as f:
+                f.seek(offset)
+                while remaining:
+                    data = conn.recv(min(blocksize, remaining))
+                    if not data:
+                        break
+                    if monitor:
+                        monitor.update(len(data))
+                    f.write(data)
+                    remaining -= len(data)
+                    if progress is not None:
+                        f.flush()
+                        progress(len(data))
+        finally:
+            conn.close()
+    finally:
+        # The data connection is dropped mid-transfer for all but the last
+        # segment, so the control connection is not reused.
+        ftp.close()
+
+    if remaining:
+        raise EOFError(f"Segment at offset {offset} ended {remaining} bytes short")
+
+
+def download_segmented(connect, path, size, local_path, segments, blocksize=BLOCKSIZE,
+                       monitor=None, hash_name=None):
+    """
+    Download path over `segments` parallel connections into one file.
+
+    With hash_name the file is hashed in order while the segments arrive,
+    as far as the bytes on disk are contiguous; returns the digest, or None.
+    The preallocated file is removed when the download fails, so no
+    full-size file of zeros is left behind. It cannot be resumed; use
+    download_resumable() for that.
+    """
+    with open(local_path, "wb") as f:
+        f.truncate(size)
+
+    ranges = [[offset, length, 0] for offset, length in split_ranges(size, segments)]
+    tail = TailReader(local_path, hasher=new_hasher(hash_name), blocksize=blocksize) if hash_name else None
+
+    def progress_of(segment):
+        if tail is None:
+            return None
+
+        def progress(n):
+            segment[2] += n
+            tail.advance(contiguous_prefix(ranges))
+        return progress
+
+    try:
+        with ThreadPoolExecutor(max_workers=len(ranges)) as pool:
+            futures = [
+                pool.submit(
+                    download_range, connect, path, segment[0], segment[1], local_path, blocksize, monitor,
+                    progress_of(segment)
+                )
+                for segment in ranges
+            ]
+            for future in futures:
+                future.result()
+    except BaseException:
+        if tail is not None:
+            tail.close(abort=True)
+        try:
+            os.remove(local_path)
+        except OSError:
+            pass
+        raise
+
+    if tail is None:
+        return None
+    tail.close()
+    if tail.fed != size:
+        # The in-order read failed; fall back to one pass over the file
+        return hash_file(local_path, new_hasher(hash_name)).hexdigest()
+    return tail.hasher.hexdigest()
+
+
+# -------------------------------------------------------------------
+# Resumable download
+# -------------------------------------------------------------------
+def _read_journal(journal_path):
+    try:
+        with open(journal_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_journal(journal_path, state):
+    with open(journal_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+
+
+def download_resumable(connect, path, local_path, retries=3, backoff=2.0,
+                       blocksize=BLOCKSIZE, feedback=None, release=close_ftp, hash_name=None):
+    """
+    Download path to local_path through a .part file and a sidecar journal.
+
+    A .part file left by an earlier run is continued with REST when the
+    journal shows the same remote file (path, SIZE and MDTM). Failed
+    attempts are retried with exponential backoff, each one resuming
+    from the bytes already on disk. On cancel the journal is kept so the
+    next run picks up where this one stopped.
+
+    Returns (local_path, digest). With hash_name the digest is computed
+    while the bytes arrive; bytes kept from an earlier attempt or run are
+    read back from the .part file once.
+    """
+    part_path = local_path + PART_SUFFIX
+    journal_path = local_path + JOURNAL_SUFFIX
+    attempt = 0
+
+    while True:
+        ftp = None
+        state = None
+        try:
+            ftp = connect()
+            state = {
+                "remote": path,
+                "size": remote_size(ftp, path),
+                "mdtm": remote_mdtm(ftp, path),
+                "bytes_done": 0
+            }
+
+            previous = _read_journal(journal_path)
+            done = 0
+            if (previous and os.path.exists(part_path)
+                    and all(previous.get(k) == state[k] for k in ("remote", "size", "mdtm"))):
+                done = os.path.getsize(part_path)
+
+            if state["size"] is not None and done > state["size"]:
+                done = 0
+            if done and not supports_rest(ftp):
+                done = 0
+
+            state["bytes_done"] = done
+            _write_journal(journal_path, state)
+
+            if done and feedback:
+                feedback.pushInfo(f"Resuming {path} at byte {done}")
+
+            monitor = TransferMonitor(feedback, state["size"], done)
+            hasher = new_hasher(hash_name)
+            if hasher and done:
+                hash_file(part_path, hasher, done)
+
+            if not done or state["size"] is None or done < state["size"]:
+                with open(part_path, "ab" if done else "wb") as f:
+                    write = monitor.wrap(hashing(f.write, hasher))
+                    ftp.retrbinary(f"RETR {path}", write, blocksize, rest=done or None)
+
+            os.replace(part_path, local_path)
+            os.remove(journal_path)
+            release(ftp)
+            return local_path, hasher.hexdigest() if hasher else None
+
+        except TransferCanceled:
+            abort_transfer(ftp)
+            release(ftp, reusable=False)
+            state["bytes_done"] = os.path.getsize(part_path)
+            _write_journal(journal_path, state)
+            raise
+
+        except all_errors as e:
+            if ftp is not None:
+                release(ftp, reusable=False)
+            if state and os.path.exists(part_path):
+                state["bytes_done"] = os.path.getsize(part_path)
+                _write_journal(journal_path, state)
+
+            attempt += 1
+            if attempt > retries:
+                raise
+
+            delay = backoff * 2 ** (attempt - 1)
+            if feedback:
+                feedback.pushInfo(f"Transfer failed ({e}), retry {attempt}/{retries} in {delay:.0f}s")
+            cancelable_sleep(delay, feedback)
+
+
+# -------------------------------------------------------------------
+# Upload
+# -------------------------------------------------------------------
+def make_remote_dirs(ftp, path):
+    """MKD every component of an absolute remote folder; existing ones are skipped."""
+    current = ""
+    for part in path.strip("/").split("/"):
+        if not part:
+            continue
+        current += "/" + part
+        try:
+            ftp.mkd(current)
+        except error_perm:
+            # Already there (or not allowed, which STOR will report)
+            pass
+
+
+def _read_remote_journal(ftp, journal_path):
+    buf = BytesIO()
+    try:
+        ftp.retrbinary(f"RETR {journal_path}", buf.write)
+    except all_errors:
+        return None
+    try:
+        return json.loads(buf.getvalue().decode("utf-8"))
+    except ValueError:
+        return None
+
+
+def _write_remote_journal(ftp, journal_path, state):
+    ftp.storbinary(f"STOR {journal_path}", BytesIO(json.dumps(state).encode("utf-8")))
+
+
+def upload_file(ftp, local_path, remote_path, blocksize=BLOCKSIZE, monitor=None, resume=True):
+    """
+    Upload to remote_path + ".part" and rename it into place when complete.
+
+    With resume a temp file left by an earlier attempt is continued: with
+    REST + STOR when the server supports it, otherwise with APPE. Only a
+    temp file whose sidecar journal names the same local file (size and
+    modification time) is continued; any other is uploaded again from the
+    start. The final name only ever holds a complete file.
+    """
+    temp_path = remote_path + PART_SUFFIX
+    journal_path = remote_path + JOURNAL_SUFFIX
+    stat = os.stat(local_path)
+    size = stat.st_size
+    state = {"size": size, "mtime": stat.st_mtime_ns}
+
+    done = 0
+    if resume:
+        if _read_remote_journal(ftp, journal_path) == state:
+            done = remote_size(ftp, temp_path) or 0
+            if done > size:
+                done = 0
+        if not done:
+            _write_remote_journal(ftp, journal_path, state)
+    if monitor and done:
+        monitor.update(done)
+
+    callback = (lambda block: monitor.update(len(block))) if monitor else None
+    with open(local_path, "rb") as f:
+        f.seek(done)
+        if not done:
+            ftp.storbinary(f"STOR {temp_path}", f, blocksize, callback)
+        elif supports_rest(ftp):
+            ftp.storbinary(f"STOR {temp_path}", f, blocksize, callback, rest=done)
+        else:
+            ftp.storbinary(f"APPE {temp_path}", f, blocksize, callback)
+
+    uploaded = remote_size(ftp, temp_path)
+    if uploaded is not None and uploaded != size:
+        raise EOFError(f"{remote_path}: uploaded {uploaded} of {size} bytes")
+
+    # Replace in one step where the server allows it; only when RNTO is
+    # refused is the old file deleted, leaving a short window without it
+    try:
+        ftp.rename(temp_path, remote_path)
+    except error_perm:
+        try:
+            ftp.delete(remote_path)
+        except error_perm:
+            pass
+        ftp.rename(temp_path, remote_path)
+
+    if resume:
+        try:
+            ftp.delete(journal_path)
+        except error_perm:
+            pass
+
+
+def upload_many(connection, jobs, workers=4, blocksize=BLOCKSIZE, feedback=None, resume=True):
+    """
+    Upload [(local_path, remote_path)] jobs over up to `workers` sessions.
+
+    connection() must return a context manager yielding a logged-in session.
+    Remote folders are created first on one session. Returns one status
+    dict per job, in job order; failures do not stop the others.
+    """
+    monitor = TransferMonitor(feedback, sum(os.path.getsize(local) for local, _ in jobs))
+
+    with connection() as ftp:
+        for folder in sorted({posixpath.dirname(remote) for _, remote in jobs}):
+            make_remote_dirs(ftp, folder)
+
+    def send(local_path, remote_path):
+        if feedback and feedback.isCanceled():
+            raise TransferCanceled()
+        with connection() as ftp:
+            upload_file(ftp, local_path, remote_path, blocksize, monitor, resume)
+
+    statuses = [None] * len(jobs)
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {
+            pool.submit(send, local_path, remote_path): i
+            for i, (local_path, remote_path) in enumerate(jobs)
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            local_path, remote_path = jobs[i]
+            status, error = "ok", None
+            try:
+                future.result()
+            except TransferCanceled:
+                status = "canceled"
+            except all_errors as e:
+                status, error = "failed", str(e)
+                if feedback:
+                    feedback.reportError(f"{local_path}: {e}")
+
+            statuses[i] = {
+                "local": local_path,
+                "remote": remote_path,
+                "status": status,
+                "error": error
+            }
+
+    if feedback:
+        feedback.pushInfo(f"Transferred {monitor.summary()}")
+
+    return statuses
@@ -0,0 +1,96 @@
+"""
+Build and use the R-tree spatial indexes of GeoPackages
+"""
+
+import sqlite3
+
+from osgeo import gdal
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _literal(value):
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _connect(gpkg_path):
+    return sqlite3.connect(f"file:{gpkg_path}?mode=ro", uri=True)
+
+
+def rtree_name(table, column):
+    return f"rtree_{table}_{column}"
+
+
+def geometry_tables(gpkg_path):
+    """
+    Return (table, geometry column, primary key, has R-tree) of every
+    feature table.
+
+    Raises sqlite3.DatabaseError if the file is not a GeoPackage.
+    """
+    db = _connect(gpkg_path)
+    try:
+        tables = []
+        for table, column in db.execute(
+            "SELECT table_name, column_name FROM gpkg_geometry_columns ORDER BY table_name"
+        ).fetchall():
+            pk = [info[1] for info in db.execute(f"PRAGMA table_info({_quote(table)})") if info[5]]
+            indexed = db.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?",
+                (rtree_name(table, column),)
+            ).fetchone() is not None
+            tables.append((table, column, pk[0] if len(pk) == 1 else "fid", indexed))
+    finally:
+        db.close()
+    return tables
+
+
+def geometry_table(gpkg_path, table=None):
+    """The geometry_tables() entry of one table, the first one when no table is given, or None."""
+    for info in geometry_tables(gpkg_path):
+        if table is None or info[0].lower() == table.lower():
+            return info
+    return None
+
+
+def ensure_rtrees(gpkg_path):
+    """
+    Give every feature table without one its GeoPackage R-tree; return
+    the tables indexed now.
+
+    GDAL fills the tree and adds the triggers that keep it in step with
+    later edits, so OGR and SQLite readers alike use it from then on.
+    Raises RuntimeError if the file cannot be opened for update.
+    """
+    todo = [(table, column) for table, column, _, indexed in geometry_tables(gpkg_path) if not indexed]
+    if not todo:
+        return []
+
+    ds = gdal.OpenEx(gpkg_path, gdal.OF_VECTOR | gdal.OF_UPDATE)
+    if ds is None:
+        raise RuntimeError(gdal.GetLastErrorMsg() or f"Cannot open {gpkg_path} for update")
+    for table, column in todo:
+        result = ds.ExecuteSQL(f"SELECT CreateSpatialIndex({_literal(table)}, {_literal(column)})")
+        if result is not None:
+            ds.ReleaseResultSet(result)
+    # Closing the dataset commits the index to the file
+    ds = None
+
+    indexed = {table for table, _, _, has_rtree in geometry_tables(gpkg_path) if has_rtree}
+    return [table for table, _ in todo if table in indexed]
+
+
+def bbox_filter(table, column, pk, xmin, ymin, xmax, ymax):
+    """
+    SQL filter selecting the rows whose R-tree box meets the rectangle.
+
+    Used as an OGR subset string it runs inside SQLite, so only the
+    matching rows are ever read.
+    """
+    return (
+        f"{_quote(pk)} IN (SELECT id FROM {_quote(rtree_name(table, column))} "
+        f"WHERE minx <= {xmax!r} AND maxx >= {xmin!r} "
+        f"AND miny <= {ymax!r} AND maxy >= {ymin!r})"
+    )
@@ -0,0 +1,106 @@
+"""
+Bulk loading of GeoPackage tables into the project
+"""
+
+import os
+import sqlite3
+
+from qgis.core import (
+    QgsDataProvider,
+    QgsProject,
+    QgsRectangle,
+    QgsVectorLayer
+)
+
+
+def read_gpkg_contents(gpkg_path):
+    """
+    Return (table_name, extent or None) for every feature and attribute
+    table registered in gpkg_contents.
+
+    The extents are the ones the writer stored, so nothing is scanned.
+    Raises sqlite3.DatabaseError if the file is not a GeoPackage.
+    """
+    db = sqlite3.connect(f"file:{gpkg_path}?mode=ro", uri=True)
+    try:
+        rows = db.execute(
+            "SELECT table_name, min_x, min_y, max_x, max_y FROM gpkg_contents "
+            "WHERE data_type IN ('features', 'attributes') ORDER BY table_name"
+        ).fetchall()
+    finally:
+        db.close()
+
+    return [
+        (name, QgsRectangle(*bounds) if None not in bounds else None)
+        for name, *bounds in rows
+    ]
+
+
+def open_table(gpkg_path, name, extent=None, lazy=False):
+    """
+    Create an OGR layer for one table without the costly provider probes.
+
+    When the file stores the table's extent the provider skips its extent
+    calculation at load; asked for it later, OGR reads the stored one.
+    Lazy also skips the feature count until something asks for it. Layers
+    on the same file share one OGR dataset handle.
+    """
+    flags = QgsDataProvider.ReadFlags()
+    if extent is not None:
+        flags |= QgsDataProvider.SkipGetExtent
+    if lazy:
+        flags |= QgsDataProvider.SkipFeatureCount
+
+    layer = QgsVectorLayer()
+    layer.setDataSource(
+        f"{gpkg_path}|layername={name}", name, "ogr", QgsDataProvider.ProviderOptions(), flags
+    )
+    return layer
+
+
+def load_gpkg_layers(gpkg_path, group_name=None, lazy=False, feedback=None, project=None):
+    """
+    Add every table of a GeoPackage to the project in one go.
+
+    All layers are registered with a single addMapLayers call and placed in
+    one layer tree group at the top of the tree. Files that are not
+    GeoPackages are added as a single layer. Returns the added layers.
+    """
+    project = project or QgsProject.instance()
+
+    try:
+        tables = read_gpkg_contents(gpkg_path)
+    except sqlite3.DatabaseError:
+        tables = None
+
+    if tables is None:
+        name = os.path.splitext(os.path.basename(gpkg_path))[0]
+        layers = [QgsVectorLayer(gpkg_path, name, "ogr")]
+    else:
+        layers = [open_table(gpkg_path, name, extent, lazy) for name, extent in tables]
+
+    valid = []
+    for layer in layers:
+        if layer.isValid():
+            valid.append(layer)
+        elif feedback:
+            feedback.reportError(f"Could not load layer: {layer.name()}")
+
+    if not valid:
+        return []
+
+    project.addMapLayers(valid, False)
+
+    group = project.layerTreeRoot().insertGroup(
+        0, group_name or os.path.splitext(os.path.basename(gpkg_path))[0]
+    )
+    for layer in valid:
+        group.addLayer(layer)
+    # A collapsed group keeps the legend from asking for symbology counts
+    if lazy:
+        group.setExpanded(False)
+
+    if feedback:
+        feedback.pushInfo(f"Loaded {len(valid)} layers" + (" (lazy)" if lazy else ""))
+
+    return valid
@@ -0,0 +1,217 @@
+"""
+Merge the tables of many GeoPackages into one with bulk SQLite writes
+"""
+
+import os
+import sqlite3
+
+from .ftp_utils import PART_SUFFIX
+
+GPKG_APPLICATION_ID = 0x47504B47
+# Metadata tables with one row set per user table, keyed by table_name
+TABLE_METADATA = (
+    "gpkg_contents", "gpkg_geometry_columns", "gpkg_extensions",
+    "gpkg_ogr_contents", "gpkg_data_columns"
+)
+BULK_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=OFF",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-262144",
+    "PRAGMA locking_mode=EXCLUSIVE",
+)
+
+
+def _quote(name):
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _fsync(path, flags=os.O_RDWR):
+    fd = os.open(path, flags)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class GpkgMerger:
+    """
+    Builds one GeoPackage from the feature and attribute tables of others.
+
+    Each source is ATTACHed and copied with INSERT ... SELECT in a single
+    transaction, so rows and geometry blobs never leave SQLite. The file
+    is written under a temporary name in WAL mode with syncs off. Attribute
+    indexes and triggers are created once in close(), after every row is
+    in; R-trees are filled straight from the sources' R-trees. close()
+    then moves the finished file over the target in one rename, so readers
+    only ever see the old or the complete new snapshot.
+    """
+
+    def __init__(self, target):
+        self.target = target
+        self.temp_path = target + PART_SUFFIX
+        self._remove_temp()
+
+        self.db = sqlite3.connect(self.temp_path, isolation_level=None)
+        self.db.execute("PRAGMA page_size=65536")
+        self.db.execute(f"PRAGMA application_id={GPKG_APPLICATION_ID}")
+        for pragma in BULK_PRAGMAS:
+            self.db.execute(pragma)
+
+        self.tables = []
+        self._deferred = []
+        self._user_version = None
+
+    # -------------------------------------------------------------------
+    # Helpers
+    # -------------------------------------------------------------------
+    def _remove_temp(self):
+        for suffix in ("", "-wal", "-shm", "-journal"):
+            if os.path.exists(self.temp_path + suffix):
+                os.remove(self.temp_path + suffix)
+
+    def _exists(self, schema, name):
+        return self.db.execute(
+            f"SELECT 1 FROM {schema}.sqlite_master WHERE type = 'table' AND name = ?", (name,)
+        ).fetchone() is not None
+
+    def _schema_sql(self, kind, name=None, table=None):
+        query = "SELECT sql FROM src.sqlite_master WHERE type = ? AND sql IS NOT NULL"
+        args = [kind]
+        if name is not None:
+            query += " AND name = ?"
+            args.append(name)
+        if table is not None:
+            query += " AND tbl_name = ?"
+            args.append(table)
+        return [row[0] for row in self.db.execute(query, args)]
+
+    def _columns(self, schema, table):
+        return [row[1] for row in self.db.execute(f"PRAGMA {schema}.table_info({_quote(table)})")]
+
+    def _rtrees(self, table):
+        if not self._exists("src", "gpkg_geometry_columns"):
+            return []
+        names = [
+            f"rtree_{table}_{row[0]}" for row in self.db.execute(
+                "SELECT column_name FROM src.gpkg_geometry_columns WHERE table_name = ?", (table,)
+            )
+        ]
+        return [name for name in names if self._exists("src", name)]
+
+    def _copy_rows(self, table, where="", args=(), ignore=False):
+        """INSERT ... SELECT the columns main and src have in common."""
+        columns = [c for c in self._columns("src", table) if c in set(self._columns("main", table))]
+        names = ", ".join(_quote(c) for c in columns)
+        verb = "INSERT OR IGNORE" if ignore else "INSERT"
+        self.db.execute(
+            f"{verb} INTO main.{_quote(table)} ({names}) SELECT {names} FROM src.{_quote(table)} {where}",
+            args
+        )
+
+    def _ensure_table(self, table):
+        """
+        Create a GeoPackage system table from the source's definition if
+        main lacks it; True when the source has the table.
+        """
+        if not self._exists("src", table):
+            return False
+        if not self._exists("main", table):
+            for sql in self._schema_sql("table", name=table):
+                self.db.execute(sql)
+        return True
+
+    # -------------------------------------------------------------------
+    # Merging
+    # -------------------------------------------------------------------
+    def add(self, source_path):
+        """Copy every feature and attribute table of a GeoPackage; return their names."""
+        self.db.execute("ATTACH DATABASE ? AS src", (source_path,))
+        try:
+            self.db.execute("BEGIN")
+            try:
+                copied = self._add_tables()
+                self.db.execute("COMMIT")
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+        finally:
+            self.db.execute("DETACH DATABASE src")
+
+        self.tables.extend(copied)
+        return copied
+
+    def _add_tables(self):
+        if self._user_version is None:
+            self._user_version = self.db.execute("PRAGMA src.user_version").fetchone()[0]
+
+        if not self._ensure_table("gpkg_spatial_ref_sys"):
+            raise ValueError("Not a GeoPackage: gpkg_spatial_ref_sys is missing")
+        self._copy_rows("gpkg_spatial_ref_sys", ignore=True)
+        metadata = [t for t in TABLE_METADATA if self._ensure_table(t)]
+
+        tables = [
+            row[0] for row in self.db.execute(
+                "SELECT table_name FROM src.gpkg_contents WHERE data_type IN ('features', 'attributes')"
+            )
+        ]
+
+        for table in tables:
+            if self._exists("main", table):
+                raise ValueError(f"Table {table} is already in the snapshot")
+
+            for sql in self._schema_sql("table", name=table):
+                self.db.execute(sql)
+            self.db.execute(f"INSERT INTO main.{_quote(table)} SELECT * FROM src.{_quote(table)}")
+
+            for meta in metadata:
+                self._copy_rows(meta, "WHERE table_name = ?", (table,))
+
+            # R-trees are virtual tables named rtree_<table>_<column>; fill them
+            # now from the source's tree instead of recomputing every envelope
+            for name in self._rtrees(table):
+                for sql in self._schema_sql("table", name=name):
+                    self.db.execute(sql)
+                self.db.execute(f"INSERT INTO main.{_quote(name)} SELECT * FROM src.{_quote(name)}")
+
+            # Indexes and triggers wait until every row is in
+            self._deferred.extend(self._schema_sql("index", table=table))
+            self._deferred.extend(self._schema_sql("trigger", table=table))
+
+        return tables
+
+    def close(self):
+        """Build the deferred indexes and triggers and swap the file into place."""
+        try:
+            self.db.execute("BEGIN")
+            for sql in self._deferred:
+                self.db.execute(sql)
+            if self._user_version is not None:
+                self.db.execute(f"PRAGMA user_version={int(self._user_version)}")
+            self.db.execute("COMMIT")
+
+            self.db.execute("PRAGMA locking_mode=NORMAL")
+            self.db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            # A single self-contained file, so the rename below is atomic
+            self.db.execute("PRAGMA journal_mode=DELETE")
+            self.db.execute("PRAGMA synchronous=FULL")
+        except BaseException:
+            self.abort()
+            raise
+        self.db.close()
+
+        # The rows were written with syncs off: they reach the disk before
+        # the rename does, and the rename before close() returns. Folders
+        # can only be synced on POSIX.
+        _fsync(self.temp_path)
+        os.replace(self.temp_path, self.target)
+        if os.name == "posix":
+            _fsync(os.path.dirname(os.path.abspath(self.target)), os.O_RDONLY)
+
+    def abort(self):
+        """Drop the half-built file; the target is left as it was."""
+        try:
+            self.db.close()
+        except sqlite3.Error:
+            pass
+        self._remove_temp()
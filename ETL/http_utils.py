@@ -0,0 +1,452 @@
+"""
+Shared HTTP/HTTPS download engine for the ETL and Datafordeler algorithms
+"""
+
+import base64
+import http.client
+import os
+import ssl
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import urljoin, urlsplit
+
+from .checksum import ChecksumMismatch, new_hasher, hash_file, verify
+from .ftp_utils import (
+    JOURNAL_SUFFIX, PART_SUFFIX, TailReader, TransferMonitor, _read_journal, _write_journal,
+    cancelable_sleep, contiguous_prefix, split_ranges
+)
+
+TIMEOUT = 60
+BLOCKSIZE = 256 * 1024
+SEGMENTS = 4
+MIN_SEGMENT = 8 * 1024 * 1024
+RETRIES = 4
+BACKOFF = 1.0
+MAX_REDIRECTS = 5
+IDLE_TIMEOUT = 30.0
+MAX_IDLE_PER_HOST = 8
+RETRY_STATUS = {429, 500, 502, 503, 504}
+REDIRECT_STATUS = {301, 302, 303, 307, 308}
+USER_AGENT = "KORTxyz-QGIS"
+
+HTTP_ERRORS = (http.client.HTTPException, OSError)
+
+
+class HTTPStatusError(OSError):
+    """Raised for a 4xx/5xx answer; 429 and 5xx gateway errors are retryable."""
+
+    def __init__(self, status, reason, url, retry_after=None):
+        super().__init__(f"HTTP {status} {reason}")
+        self.status = status
+        self.url = url
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self):
+        return self.status in RETRY_STATUS
+
+
+def _retry_after(value):
+    """Seconds from a Retry-After header (delta or HTTP date), or None."""
+    if not value:
+        return None
+    if value.strip().isdigit():
+        return int(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+# -------------------------------------------------------------------
+# Keep-alive connection pool
+# -------------------------------------------------------------------
+class HTTPPool:
+    """
+    Keeps idle keep-alive connections keyed by (scheme, host, port).
+
+    A connection only goes back to the pool when its response was read to
+    the end and the server did not ask to close it. Connections idle longer
+    than idle_timeout are dropped, since servers close them on their side.
+    """
+
+    def __init__(self, idle_timeout=IDLE_TIMEOUT, max_idle_per_host=MAX_IDLE_PER_HOST):
+        self.idle_timeout = idle_timeout
+        self.max_idle_per_host = max_idle_per_host
+        self._idle = {}
+        self._lock = threading.Lock()
+        self._context = ssl.create_default_context()
+
+    def open(self, key):
+        scheme, host, port = key
+        if scheme == "https":
+            return http.client.HTTPSConnection(host, port, timeout=TIMEOUT, context=self._context)
+        return http.client.HTTPConnection(host, port, timeout=TIMEOUT)
+
+    def acquire(self, key):
+        """Return (connection, reused) with an idle connection when there is one."""
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                if not idle:
+                    break
+                conn, last_used = idle.pop()
+            if time.monotonic() - last_used > self.idle_timeout:
+                conn.close()
+                continue
+            return conn, True
+        return self.open(key), False
+
+    def release(self, key, conn, reusable=True):
+        if reusable:
+            with self._lock:
+                idle = self._idle.setdefault(key, [])
+                if len(idle) < self.max_idle_per_host:
+                    idle.append((conn, time.monotonic()))
+                    return
+        conn.close()
+
+    def close_all(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn, _ in conns:
+                conn.close()
+
+
+HTTP_POOL = HTTPPool()
+
+
+def _send(conn, method, target, headers):
+    conn.request(method, target, headers=headers)
+    return conn.getresponse()
+
+
+@contextmanager
+def open_url(url, method="GET", headers=None, pool=None):
+    """
+    Yield (response, final_url) for a request on a pooled connection.
+
+    Redirects are followed. A 4xx/5xx answer raises HTTPStatusError; other
+    statuses (200, 206, 304) are left to the caller. The connection goes
+    back to the pool if the caller read the response to the end.
+    """
+    pool = pool or HTTP_POOL
+    headers = dict(headers or {}, **{"User-Agent": USER_AGENT})
+
+    for _ in range(MAX_REDIRECTS + 1):
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == "https" else 80))
+        target = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+
+        conn, reused = pool.acquire(key)
+        try:
+            resp = _send(conn, method, target, headers)
+        except HTTP_ERRORS:
+            conn.close()
+            if not reused:
+                raise
+            # The server dropped the idle connection; one fresh attempt
+            conn = pool.open(key)
+            try:
+                resp = _send(conn, method, target, headers)
+            except HTTP_ERRORS:
+                conn.close()
+                raise
+
+        if resp.status in REDIRECT_STATUS and resp.getheader("Location"):
+            resp.read()
+            pool.release(key, conn, not resp.will_close)
+            url = urljoin(url, resp.getheader("Location"))
+            continue
+
+        if resp.status >= 400:
+            resp.read()
+            pool.release(key, conn, not resp.will_close)
+            raise HTTPStatusError(resp.status, resp.reason, url, _retry_after(resp.getheader("Retry-After")))
+
+        try:
+            yield resp, url
+        except BaseException:
+            conn.close()
+            raise
+        pool.release(key, conn, resp.isclosed() and not resp.will_close)
+        return
+
+    raise HTTPStatusError(310, "Too many redirects", url)
+
+
+# -------------------------------------------------------------------
+# Retries
+# -------------------------------------------------------------------
+def retrying(call, retries=RETRIES, backoff=BACKOFF, feedback=None):
+    """
+    Run call() and retry it with exponential backoff on network errors,
+    429 and 5xx answers. A Retry-After header lengthens the wait.
+    """
+    attempt = 0
+    while True:
+        try:
+            return call()
+        except HTTP_ERRORS as e:
+            if isinstance(e, HTTPStatusError) and not e.retryable:
+                raise
+            attempt += 1
+            if attempt > retries:
+                raise
+            delay = backoff * 2 ** (attempt - 1)
+            if isinstance(e, HTTPStatusError) and e.retry_after is not None:
+                delay = max(delay, e.retry_after)
+            if feedback:
+                feedback.pushInfo(f"Request failed ({e}), retry {attempt}/{retries} in {delay:.0f}s")
+            cancelable_sleep(delay, feedback)
+
+
+# -------------------------------------------------------------------
+# Download
+# -------------------------------------------------------------------
+def validators(resp):
+    """Size, ETag, Last-Modified and server MD5 of the resource behind a 200/206 answer."""
+    if resp.status == 206:
+        total = (resp.getheader("Content-Range") or "").rpartition("/")[2]
+        size = int(total) if total.isdigit() else None
+        # Content-MD5 of a 206 covers the range; Azure also sends the blob's
+        md5 = resp.getheader("x-ms-blob-content-md5")
+    else:
+        length = resp.getheader("Content-Length")
+        size = int(length) if length and length.isdigit() else None
+        md5 = resp.getheader("Content-MD5") or resp.getheader("x-ms-blob-content-md5")
+
+    try:
+        md5 = base64.b64decode(md5).hex() if md5 else None
+    except ValueError:
+        md5 = None
+
+    return {
+        "etag": resp.getheader("ETag"),
+        "last_modified": resp.getheader("Last-Modified"),
+        "size": size,
+        "md5": md5,
+    }
+
+
+def _same_resource(journal, info):
+    return (
+        journal is not None
+        and journal.get("size") == info["size"]
+        and (info["etag"] or info["last_modified"])
+        and journal.get("etag") == info["etag"]
+        and journal.get("last_modified") == info["last_modified"]
+    )
+
+
+def _stream(resp, f, length, monitor, blocksize=BLOCKSIZE, progress=None, hasher=None):
+    """Copy up to length bytes (all if None) of resp into f; return the count."""
+    done = 0
+    while length is None or done < length:
+        block = resp.read(blocksize if length is None else min(blocksize, length - done))
+        if not block:
+            break
+        monitor.update(len(block))
+        if hasher is not None:
+            hasher.update(block)
+        f.write(block)
+        done += len(block)
+        if progress is not None:
+            # A tail reader on its own handle must see the bytes
+            f.flush()
+            progress(len(block))
+    return done
+
+
+def _fetch_range(url, part_path, segment, info, monitor, pool, blocksize, advanced=None):
+    """Fetch the missing tail of one [offset, length, done] segment in place."""
+    offset, length, done = segment
+    if done >= length:
+        return
+
+    headers = {"Range": f"bytes={offset + done}-{offset + length - 1}"}
+    # If-Range takes a strong ETag or a date; a changed file then answers 200
+    strong_etag = info["etag"] if info["etag"] and not info["etag"].startswith("W/") else None
+    if strong_etag or info["last_modified"]:
+        headers["If-Range"] = strong_etag or info["last_modified"]
+
+    with open_url(url, headers=headers, pool=pool) as (resp, _):
+        if resp.status != 206:
+            raise HTTPStatusError(412, "Resource changed while it was downloaded", url)
+
+        def progress(n):
+            segment[2] += n
+            if advanced is not None:
+                advanced()
+
+        with open(part_path, "r+b") as f:
+            f.seek(offset + done)
+            _stream(resp, f, length - done, monitor, blocksize, progress)
+
+    if segment[2] < length:
+        raise http.client.IncompleteRead(b"", length - segment[2])
+
+
+def http_download(url, local_path, feedback=None, segments=SEGMENTS, retries=RETRIES,
+                  backoff=BACKOFF, hash_name=None, blocksize=BLOCKSIZE, pool=None, consumer=None):
+    """
+    Download url to local_path through a .part file and a sidecar journal.
+
+    The first request asks for one byte to learn the size, validators and
+    whether the server honours Range. If it does, the file is fetched in up
+    to `segments` parallel ranges on pooled keep-alive connections, each
+    retried on its own with exponential backoff and resumed from the bytes
+    it already has. The journal records every range's progress, so a .part
+    file left by a canceled or failed run of the same resource (same size
+    and ETag/Last-Modified) is continued. A server without Range support
+    gets a single streamed GET.
+
+    When the server publishes an MD5 (Content-MD5, x-ms-blob-content-md5)
+    or hash_name is given, the file is hashed in order while it arrives
+    and checked. Returns the validators: etag, last_modified, size and
+    digest.
+
+    consumer(block), when given, is fed the file from the start while it
+    is still downloading, as far as the bytes on disk are contiguous. It
+    runs on its own thread and has been fed the whole file when this
+    returns; if it raises, feeding stops and its error is logged.
+    """
+    pool = pool or HTTP_POOL
+    part_path = local_path + PART_SUFFIX
+    journal_path = local_path + JOURNAL_SUFFIX
+
+    monitor = tail = hasher = None
+
+    def hash_for(info):
+        return hash_name or ("md5" if info["md5"] else None)
+
+    def single(resp, info):
+        """The server ignored Range: this 200 response is the whole file."""
+        nonlocal monitor, tail, hasher
+        monitor = TransferMonitor(feedback, info["size"])
+        # A retry starts over, and so does the digest
+        hasher = new_hasher(hash_for(info))
+        with open(part_path, "wb") as f:
+            progress = None
+            if consumer is not None:
+                if tail is None:
+                    tail = TailReader(part_path, consumer, blocksize=blocksize)
+                else:
+                    # A retry rewrites bytes the consumer has already had
+                    tail.abandon("download restarted")
+                written = [0]
+
+                def progress(n):
+                    written[0] += n
+                    tail.advance(written[0])
+
+            done = _stream(resp, f, None, monitor, blocksize, progress, hasher)
+        if info["size"] is not None and done != info["size"]:
+            raise http.client.IncompleteRead(b"", info["size"] - done)
+
+    def start():
+        headers = {"Range": "bytes=0-0"}
+        while True:
+            try:
+                with open_url(url, headers=headers, pool=pool) as (resp, final_url):
+                    info = validators(resp)
+                    if resp.status == 206 and info["size"] is not None:
+                        resp.read()
+                        return info, final_url
+                    single(resp, info)
+                    return info, None
+            except HTTPStatusError as e:
+                # An empty resource has no byte 0 to ask for
+                if e.status != 416 or "Range" not in headers:
+                    raise
+                headers = {}
+
+    try:
+        info, final_url = retrying(start, retries, backoff, feedback)
+        name = hash_for(info)
+
+        if final_url is not None:
+            journal = _read_journal(journal_path)
+            if _same_resource(journal, info) and os.path.exists(part_path):
+                ranges = journal["ranges"]
+                if feedback:
+                    feedback.pushInfo(f"Resuming {os.path.basename(local_path)} at "
+                                      f"{sum(done for _, _, done in ranges) / 1e6:.1f} MB")
+            else:
+                count = max(1, min(segments, info["size"] // MIN_SEGMENT))
+                ranges = [[offset, length, 0] for offset, length in split_ranges(info["size"], count)]
+                with open(part_path, "wb") as f:
+                    f.truncate(info["size"])
+
+            state = dict(info, ranges=ranges)
+            monitor = TransferMonitor(feedback, info["size"], sum(done for _, _, done in ranges))
+
+            # Ranges arrive out of order; the reader hashes and streams the
+            # file in order as far as it is contiguous on disk
+            advanced = None
+            if consumer is not None or name:
+                tail = TailReader(part_path, consumer, new_hasher(name), blocksize)
+                tail.advance(contiguous_prefix(ranges))
+
+                def advanced():
+                    tail.advance(contiguous_prefix(ranges))
+
+            def fetch(segment):
+                retrying(
+                    lambda: _fetch_range(final_url, part_path, segment, info, monitor, pool, blocksize, advanced),
+                    retries, backoff, feedback
+                )
+
+            try:
+                with ThreadPoolExecutor(max_workers=max(1, len(ranges))) as executor:
+                    futures = [executor.submit(fetch, segment) for segment in ranges]
+                    for future in futures:
+                        future.result()
+            except BaseException:
+                # Keep what arrived so the next run continues from there
+                _write_journal(journal_path, state)
+                raise
+    except BaseException:
+        if tail is not None:
+            tail.close(abort=True)
+        raise
+
+    if feedback and monitor:
+        feedback.pushInfo(f"Downloaded {monitor.summary()}")
+
+    if tail is not None:
+        tail.close()
+        if tail.error is not None and feedback:
+            feedback.pushInfo(f"Stopped reading {os.path.basename(local_path)} while it arrived: {tail.error}")
+
+    digest = None
+    if name:
+        if final_url is None:
+            digest = hasher.hexdigest()
+        elif tail.fed == info["size"]:
+            digest = tail.hasher.hexdigest()
+        else:
+            # The in-order read failed; fall back to one pass over the file
+            digest = hash_file(part_path, new_hasher(name)).hexdigest()
+        try:
+            verify(name, digest, info["md5"] if name == "md5" else None, url.split("?")[0])
+        except ChecksumMismatch:
+            os.remove(part_path)
+            if os.path.exists(journal_path):
+                os.remove(journal_path)
+            raise
+
+    os.replace(part_path, local_path)
+    if os.path.exists(journal_path):
+        os.remove(journal_path)
+
+    return {
+        "etag": info["etag"],
+        "last_modified": info["last_modified"],
+        "size": os.path.getsize(local_path),
+        "digest": digest,
+    }
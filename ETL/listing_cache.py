@@ -0,0 +1,146 @@
+"""
+Cache of remote FTP directory listings
+"""
+
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+from .ftp_utils import list_remote
+
+DEFAULT_TTL = 60
+DB_PATH = os.path.join(tempfile.gettempdir(), "kortxyz", "ftp_listings.sqlite")
+
+
+def listing_key(scheme, host, port, user):
+    return f"{scheme}://{user}@{host}:{port}"
+
+
+class ListingCache:
+    """
+    Directory listings keyed by (server, path) with a time-to-live.
+
+    Listings are kept in memory and, when a db_path is given, also in a
+    small SQLite file with one row per entry (type, size, modify) so they
+    survive the QGIS session.
+    """
+
+    def __init__(self):
+        self._memory = {}
+        self._lock = threading.Lock()
+
+    # -------------------------------------------------------------------
+    # SQLite persistence
+    # -------------------------------------------------------------------
+    @staticmethod
+    @contextmanager
+    def _connect(db_path):
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        db = sqlite3.connect(db_path, timeout=30)
+        try:
+            with db:
+                db.executescript("""
+                    CREATE TABLE IF NOT EXISTS listings (
+                        server TEXT, path TEXT, fetched REAL,
+                        PRIMARY KEY (server, path)
+                    );
+                    CREATE TABLE IF NOT EXISTS entries (
+                        server TEXT, path TEXT, name TEXT, facts TEXT,
+                        PRIMARY KEY (server, path, name)
+                    );
+                """)
+                yield db
+        finally:
+            db.close()
+
+    def _load(self, db_path, server, path):
+        with self._connect(db_path) as db:
+            row = db.execute(
+                "SELECT fetched FROM listings WHERE server = ? AND path = ?", (server, path)
+            ).fetchone()
+            if row is None:
+                return None
+            entries = [
+                (name, json.loads(facts))
+                for name, facts in db.execute(
+                    "SELECT name, facts FROM entries WHERE server = ? AND path = ? ORDER BY rowid",
+                    (server, path)
+                )
+            ]
+        return row[0], entries
+
+    def _store(self, db_path, server, path, fetched, entries):
+        with self._connect(db_path) as db:
+            db.execute("DELETE FROM entries WHERE server = ? AND path = ?", (server, path))
+            db.execute(
+                "INSERT OR REPLACE INTO listings VALUES (?, ?, ?)", (server, path, fetched)
+            )
+            db.executemany(
+                "INSERT INTO entries VALUES (?, ?, ?, ?)",
+                [(server, path, name, json.dumps(facts)) for name, facts in entries]
+            )
+
+    # -------------------------------------------------------------------
+    # Cache API
+    # -------------------------------------------------------------------
+    def get(self, server, path, ttl=DEFAULT_TTL, db_path=None):
+        """Return a cached listing younger than ttl seconds, or None."""
+        now = time.time()
+
+        with self._lock:
+            hit = self._memory.get((server, path))
+        if hit is None and db_path and os.path.exists(db_path):
+            hit = self._load(db_path, server, path)
+            if hit is not None:
+                with self._lock:
+                    self._memory[(server, path)] = hit
+
+        if hit is not None and now - hit[0] <= ttl:
+            return hit[1]
+        return None
+
+    def put(self, server, path, entries, db_path=None):
+        fetched = time.time()
+        with self._lock:
+            self._memory[(server, path)] = (fetched, entries)
+        if db_path:
+            self._store(db_path, server, path, fetched, entries)
+
+    def invalidate(self, server=None, path=None, db_path=None):
+        """Drop cached listings for a server, one path on it, or everything."""
+        with self._lock:
+            for cached_server, cached_path in list(self._memory):
+                if server in (None, cached_server) and path in (None, cached_path):
+                    del self._memory[(cached_server, cached_path)]
+
+        if db_path and os.path.exists(db_path):
+            where, args = [], []
+            if server is not None:
+                where.append("server = ?")
+                args.append(server)
+            if path is not None:
+                where.append("path = ?")
+                args.append(path)
+            clause = (" WHERE " + " AND ".join(where)) if where else ""
+            with self._connect(db_path) as db:
+                db.execute("DELETE FROM listings" + clause, args)
+                db.execute("DELETE FROM entries" + clause, args)
+
+    def lister(self, server, ttl=DEFAULT_TTL, db_path=None):
+        """Return a list_remote-compatible callable that goes through the cache."""
+        def listing(ftp, path):
+            if ttl <= 0:
+                return list_remote(ftp, path)
+            entries = self.get(server, path, ttl, db_path)
+            if entries is None:
+                entries = list_remote(ftp, path)
+                self.put(server, path, entries, db_path)
+            return entries
+        return listing
+
+
+LISTING_CACHE = ListingCache()
@@ -6,25 +6,383 @@ With QGIS : 34000
 """
 
 import os
+import posixpath
+import re
+import struct
+import threading
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from fnmatch import fnmatchcase
+from functools import lru_cache
 
+from osgeo import gdal
 from qgis.core import (
     QgsProcessing,
     QgsProcessingAlgorithm,
+    QgsProcessingParameterBoolean,
     QgsProcessingParameterFile,
     QgsProcessingParameterFeatureSink,
+    QgsProcessingParameterNumber,
+    QgsProcessingParameterString,
     QgsProcessingOutputVariant,
     QgsProcessingUtils,
     QgsProcessingException,
-    QgsZipUtils,
 )
 
+from .ftp_utils import PART_SUFFIX, TransferCanceled, TransferMonitor
+from .extract_cache import EXTRACTION_CACHE, DEFAULT_MAX_MB, archive_fingerprint
+
+CHUNK_SIZE = 1024 * 1024
+
+
+@lru_cache(maxsize=1)
+def gdal_extensions():
+    """File extensions (".gml", ".shp", ...) claimed by any GDAL/OGR driver."""
+    extensions = set()
+    for i in range(gdal.GetDriverCount()):
+        ext = gdal.GetDriver(i).GetMetadataItem(gdal.DMD_EXTENSIONS)
+        if ext:
+            extensions.update("." + e.lower() for e in ext.split())
+    return extensions
+
+
+def list_members(zip_path):
+    """File members of an archive, read from the central directory only."""
+    with zipfile.ZipFile(zip_path) as zf:
+        return [info for info in zf.infolist() if not info.is_dir()]
+
+
+def select_members(members, pattern=None, regex=False):
+    """
+    Keep members whose name matches a pattern.
+
+    A glob is matched case-insensitively against both the full member name
+    and its base name, so "*.gml" also finds "data/x.gml". A regex is
+    searched in the full member name.
+    """
+    if not pattern:
+        return members
+    if regex:
+        expr = re.compile(pattern)
+        return [m for m in members if expr.search(m.filename)]
+
+    pattern = pattern.lower()
+    return [
+        m for m in members
+        if fnmatchcase(m.filename.lower(), pattern)
+        or fnmatchcase(posixpath.basename(m.filename).lower(), pattern)
+    ]
+
+
+def describe_members(members):
+    return [
+        {
+            "name": m.filename,
+            "size": m.file_size,
+            "compressed_size": m.compress_size,
+            "ratio": round(m.file_size / m.compress_size, 2) if m.compress_size else None,
+        }
+        for m in members
+    ]
+
+
+def vsizip_paths(zip_path, names):
+    """
+    /vsizip/ paths for the GDAL-readable members among names.
+
+    Nothing is extracted; GDAL reads the members straight from the zip.
+    Shapefile companions (.dbf, .prj, ...) are left out since GDAL
+    finds them next to the .shp.
+    """
+    readable = gdal_extensions()
+    shapefiles = {os.path.splitext(n)[0] for n in names if n.lower().endswith(".shp")}
+    archive = os.path.abspath(zip_path).replace("\\", "/")
+
+    paths = []
+    for name in names:
+        base, ext = os.path.splitext(name)
+        ext = ext.lower()
+        if ext not in readable or (ext != ".shp" and base in shapefiles):
+            continue
+        paths.append(f"/vsizip/{archive}/{name}")
+    return paths
+
+
+# -------------------------------------------------------------------
+# Extraction engine
+# -------------------------------------------------------------------
+def member_target(dest_folder, name):
+    """Local path for a member, with absolute and ".." parts dropped like ZipFile.extract."""
+    parts = [p for p in name.replace("\\", "/").split("/") if p not in ("", ".", "..")]
+    return os.path.join(dest_folder, *parts)
+
+
+def extract_parallel(zip_path, members, dest_folder, workers=4, chunk_size=CHUNK_SIZE, feedback=None):
+    """
+    Extract members across a thread pool, return their local paths in member order.
+
+    Every worker has its own handle on the archive and streams each member
+    through chunk_size blocks into a .part file, so memory does not grow
+    with member size. zlib releases the GIL while inflating, so threads
+    scale across cores. Progress is reported by uncompressed bytes and
+    TransferCanceled is raised between chunks once the feedback is canceled.
+    """
+    monitor = TransferMonitor(feedback, sum(m.file_size for m in members))
+    local = threading.local()
+    handles = []
+    lock = threading.Lock()
+
+    def archive():
+        zf = getattr(local, "zf", None)
+        if zf is None:
+            zf = local.zf = zipfile.ZipFile(zip_path)
+            with lock:
+                handles.append(zf)
+        return zf
+
+    def extract(info):
+        target = member_target(dest_folder, info.filename)
+        part_path = target + PART_SUFFIX
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            with archive().open(info) as src, open(part_path, "wb") as dst:
+                while True:
+                    block = src.read(chunk_size)
+                    if not block:
+                        break
+                    monitor.update(len(block))
+                    dst.write(block)
+        except BaseException as e:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            # zipfile reports encrypted members, unknown methods and
+            # truncated data with these; callers handle BadZipFile
+            if isinstance(e, (RuntimeError, NotImplementedError, EOFError)):
+                raise zipfile.BadZipFile(f"{info.filename}: {e}") from e
+            raise
+        os.replace(part_path, target)
+        return target
+
+    # Largest members first, so a huge member does not start last
+    order = sorted(range(len(members)), key=lambda i: -members[i].file_size)
+    paths = [None] * len(members)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            futures = {pool.submit(extract, members[i]): i for i in order}
+            try:
+                for future in as_completed(futures):
+                    paths[futures[future]] = future.result()
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+    finally:
+        for zf in handles:
+            zf.close()
+
+    monitor.report()
+    return paths
+
+
+# -------------------------------------------------------------------
+# Streaming extraction
+# -------------------------------------------------------------------
+LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+LOCAL_SIGNATURE = b"PK\x03\x04"
+DESCRIPTOR_SIGNATURE = b"PK\x07\x08"
+
+
+class StreamExtractor:
+    """
+    Extracts members from the bytes of an archive while they arrive.
+
+    feed() takes the archive in order, from the first byte, and walks the
+    local file headers, inflating each member into a .part file under
+    dest_folder. A member is renamed into place once its CRC and size
+    check out and is then listed in `extracted` (name -> (crc, size, path)).
+    The archive is still read from its central directory afterwards:
+    whatever could not be streamed (encrypted members, unknown methods,
+    stored members with a data descriptor) is left to extract_parallel.
+    """
+
+    def __init__(self, dest_folder, chunk_size=CHUNK_SIZE):
+        self.dest_folder = dest_folder
+        self.chunk_size = chunk_size
+        self.extracted = {}
+        self.error = None
+        self.finished = False
+        self._buffer = bytearray()
+        self._member = None
+        self._descriptor = None
+
+    def feed(self, data):
+        if self.finished or self.error is not None:
+            return
+        self._buffer += data
+        try:
+            self._drain()
+        except (OSError, ValueError, zlib.error) as e:
+            self.error = e
+            self._discard()
+
+    def close(self):
+        """Drop a half-written member, e.g. after the download failed."""
+        self._discard()
+
+    # -------------------------------------------------------------------
+    # Parsing
+    # -------------------------------------------------------------------
+    def _drain(self):
+        while not self.finished:
+            if self._descriptor is not None:
+                if not self._read_descriptor():
+                    return
+            elif self._member is None:
+                if not self._read_header():
+                    return
+            elif not self._read_data():
+                return
+
+    def _read_header(self):
+        buf = self._buffer
+        if len(buf) < 4:
+            return False
+        if buf[:4] != LOCAL_SIGNATURE:
+            # Central directory: every member has been seen
+            self.finished = True
+            return False
+        if len(buf) < LOCAL_HEADER.size:
+            return False
+
+        (_, _, flags, method, _, _, crc, csize, usize, name_len, extra_len) = LOCAL_HEADER.unpack_from(buf)
+        end = LOCAL_HEADER.size + name_len + extra_len
+        if len(buf) < end:
+            return False
+
+        raw_name = bytes(buf[LOCAL_HEADER.size:LOCAL_HEADER.size + name_len])
+        name = raw_name.decode("utf-8" if flags & 0x800 else "cp437")
+        extra = bytes(buf[LOCAL_HEADER.size + name_len:end])
+        del buf[:end]
+
+        zip64 = False
+        pos = 0
+        while pos + 4 <= len(extra):
+            tag, size = struct.unpack_from("<HH", extra, pos)
+            if tag == 0x0001 and size >= 16:
+                usize, csize = struct.unpack_from("<QQ", extra, pos + 4)
+                zip64 = True
+            pos += 4 + size
+
+        if flags & 0x1:
+            raise ValueError(f"{name} is encrypted")
+        if method not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            raise ValueError(f"{name} uses compression method {method}")
+        if method == zipfile.ZIP_STORED and flags & 0x8:
+            raise ValueError(f"{name} is stored with a data descriptor")
+
+        member = {
+            "name": name, "method": method, "flags": flags, "zip64": zip64,
+            "crc": crc, "csize": csize, "usize": usize,
+            "remaining": csize, "running_crc": 0, "written": 0,
+            "decompressor": zlib.decompressobj(-15) if method == zipfile.ZIP_DEFLATED else None,
+            "target": None, "file": None,
+        }
+        if not name.endswith("/"):
+            member["target"] = member_target(self.dest_folder, name)
+            os.makedirs(os.path.dirname(member["target"]), exist_ok=True)
+            member["file"] = open(member["target"] + PART_SUFFIX, "wb")
+        self._member = member
+        return True
+
+    def _write(self, block):
+        member = self._member
+        if block and member["file"] is not None:
+            member["file"].write(block)
+        member["running_crc"] = zlib.crc32(block, member["running_crc"])
+        member["written"] += len(block)
+
+    def _read_data(self):
+        member = self._member
+        buf = self._buffer
+
+        if member["decompressor"] is None:
+            take = min(member["remaining"], len(buf))
+            self._write(bytes(buf[:take]))
+            del buf[:take]
+            member["remaining"] -= take
+            if member["remaining"]:
+                return False
+        else:
+            d = member["decompressor"]
+            data = bytes(buf)
+            del buf[:]
+            while True:
+                out = d.decompress(data, self.chunk_size)
+                self._write(out)
+                data = d.unconsumed_tail
+                if d.eof or (not data and len(out) < self.chunk_size):
+                    break
+            if not d.eof:
+                return False
+            buf[:0] = d.unused_data
+
+        if member["flags"] & 0x8:
+            self._descriptor = member
+            return True
+        self._finish(member["crc"], member["usize"])
+        return True
+
+    def _read_descriptor(self):
+        buf = self._buffer
+        size_format = "<LQQ" if self._descriptor["zip64"] else "<LLL"
+        length = struct.calcsize(size_format)
+        offset = 4 if buf[:4] == DESCRIPTOR_SIGNATURE else 0
+        if len(buf) < offset + length:
+            return False
+        crc, _, usize = struct.unpack_from(size_format, buf, offset)
+        del buf[:offset + length]
+        self._descriptor = None
+        self._finish(crc, usize)
+        return True
+
+    def _finish(self, crc, usize):
+        member = self._member
+        self._member = None
+        if member["file"] is None:
+            return
+        member["file"].close()
+        part_path = member["target"] + PART_SUFFIX
+        if member["running_crc"] != crc or member["written"] != usize:
+            os.remove(part_path)
+            raise ValueError(f"{member['name']} failed its CRC check")
+        os.replace(part_path, member["target"])
+        self.extracted[member["name"]] = (crc, usize, member["target"])
+
+    def _discard(self):
+        member, self._member = self._member, None
+        if member and member["file"] is not None:
+            member["file"].close()
+            if os.path.exists(member["target"] + PART_SUFFIX):
+                os.remove(member["target"] + PART_SUFFIX)
+
 
 class Unzipper(QgsProcessingAlgorithm):
 
     PARAM_ZIP = "ZIPFILE"
     PARAM_DEST = "DIST"
+    PARAM_VIRTUAL = "VIRTUAL"
+    PARAM_PATTERN = "PATTERN"
+    PARAM_REGEX = "REGEX"
+    PARAM_FIRST_ONLY = "FIRST_ONLY"
+    PARAM_LIST_ONLY = "LIST_ONLY"
+    PARAM_WORKERS = "WORKERS"
+    PARAM_CACHE = "CACHE"
+    PARAM_CACHE_MAX = "CACHE_MAX_MB"
     OUT_FILES = "DISTFILES"
     OUT_FIRST = "FIRSTFILE"
+    OUT_MEMBERS = "MEMBERS"
 
     def initAlgorithm(self, config=None):
 
@@ -48,6 +406,83 @@ class Unzipper(QgsProcessingAlgorithm):
             )
         )
 
+        # Read in place instead of extracting
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.PARAM_VIRTUAL,
+                "Read members in place (/vsizip/ paths, no extraction)",
+                defaultValue=False,
+            )
+        )
+
+        # Member selection
+        self.addParameter(
+            QgsProcessingParameterString(
+                self.PARAM_PATTERN,
+                "Only members matching (glob, e.g. *.gml)",
+                optional=True,
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.PARAM_REGEX,
+                "Pattern is a regular expression",
+                defaultValue=False,
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.PARAM_FIRST_ONLY,
+                "Only the first (matching) member",
+                defaultValue=False,
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.PARAM_LIST_ONLY,
+                "List members only (no extraction)",
+                defaultValue=False,
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.PARAM_WORKERS,
+                "Parallel extraction threads",
+                type=QgsProcessingParameterNumber.Integer,
+                defaultValue=4,
+                minValue=1,
+                maxValue=64,
+            )
+        )
+
+        # Extraction cache
+        self.addParameter(
+            QgsProcessingParameterBoolean(
+                self.PARAM_CACHE,
+                "Reuse earlier extractions of the same archive (ignores destination)",
+                defaultValue=False,
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.PARAM_CACHE_MAX,
+                "Extraction cache size cap (MB)",
+                type=QgsProcessingParameterNumber.Integer,
+                defaultValue=DEFAULT_MAX_MB,
+                minValue=0,
+            )
+        )
+
+        # Output: member names, sizes and compression ratios
+        self.addOutput(
+            QgsProcessingOutputVariant(self.OUT_MEMBERS, "Archive members")
+        )
+
         # Output: list of files
         self.addOutput(
             QgsProcessingOutputVariant(self.OUT_FILES, "List of unzipped files")
@@ -60,26 +495,81 @@ class Unzipper(QgsProcessingAlgorithm):
 
         # --- Resolve inputs ---
         zip_path = self.parameterAsFile(parameters, self.PARAM_ZIP, context)
+        virtual = self.parameterAsBoolean(parameters, self.PARAM_VIRTUAL, context)
+        pattern = self.parameterAsString(parameters, self.PARAM_PATTERN, context).strip()
+        regex = self.parameterAsBoolean(parameters, self.PARAM_REGEX, context)
+        first_only = self.parameterAsBoolean(parameters, self.PARAM_FIRST_ONLY, context)
+        list_only = self.parameterAsBoolean(parameters, self.PARAM_LIST_ONLY, context)
+        workers = self.parameterAsInt(parameters, self.PARAM_WORKERS, context)
+        use_cache = self.parameterAsBoolean(parameters, self.PARAM_CACHE, context)
+        cache_max = self.parameterAsInt(parameters, self.PARAM_CACHE_MAX, context) * 1024 * 1024
+
+        # --- Read the central directory ---
+        try:
+            all_members = list_members(zip_path)
+            members = select_members(all_members, pattern, regex)
+        except (OSError, zipfile.BadZipFile) as e:
+            raise QgsProcessingException(f"Failed to read zip file: {zip_path} ({e})")
+        except re.error as e:
+            raise QgsProcessingException(f"Invalid regular expression: {pattern} ({e})")
+
+        if list_only:
+            listing = describe_members(members)
+            for m in listing:
+                feedback.pushInfo(f"{m['name']}: {m['size']} bytes, ratio {m['ratio']}")
+            return {self.OUT_MEMBERS: listing}
+
+        # --- Virtual: hand GDAL paths inside the archive ---
+        if virtual:
+            file_list = vsizip_paths(zip_path, [m.filename for m in members])
+            if first_only:
+                file_list = file_list[:1]
+
+            if not file_list:
+                raise QgsProcessingException("Zip file contains no matching GDAL-readable files.")
 
-        dest_folder = self.parameterAsString(parameters, self.PARAM_DEST, context)
-        if not dest_folder:
-            dest_folder = QgsProcessingUtils.tempFolder()
+            feedback.pushInfo(f"Reading {len(file_list)} files in place")
+            return {self.OUT_FILES: file_list, self.OUT_FIRST: file_list[0]}
+
+        if first_only:
+            members = members[:1]
+
+        if not members:
+            raise QgsProcessingException("Zip file contains no matching files.")
+
+        if use_cache:
+            fingerprint = archive_fingerprint(zip_path, all_members)
+            dest_folder = EXTRACTION_CACHE.entry(fingerprint)
+        else:
+            dest_folder = self.parameterAsString(parameters, self.PARAM_DEST, context)
+            if not dest_folder:
+                dest_folder = QgsProcessingUtils.tempFolder()
 
         # Ensure the directory exists
         os.makedirs(dest_folder, exist_ok=True)
 
-        # --- Unzip ---
-        # QgsZipUtils.unzip returns (ok, list_of_files)
-        ok, file_list = QgsZipUtils.unzip(zip_path, dest_folder)
-        
-        feedback.pushInfo(f"willLoadLayerOnCompletion: {context.willLoadLayerOnCompletion(file_list[0])}")
-        feedback.pushInfo(f"project: {context.flags()}")
+        file_list = [member_target(dest_folder, m.filename) for m in members]
+        todo = EXTRACTION_CACHE.missing(fingerprint, members, file_list) if use_cache else members
+        if use_cache and len(todo) < len(members):
+            feedback.pushInfo(f"Reusing {len(members) - len(todo)} cached files from {dest_folder}")
 
-        if not ok:
-            raise QgsProcessingException("Failed to unzip file: {}".format(zip_path))
+        # --- Unzip ---
+        if todo:
+            feedback.pushInfo(f"Extracting {len(todo)} files with {workers} threads")
+            try:
+                extract_parallel(zip_path, todo, dest_folder, workers, feedback=feedback)
+            except TransferCanceled:
+                feedback.pushInfo("Extraction canceled")
+                return {}
+            except (OSError, zipfile.BadZipFile, zlib.error) as e:
+                raise QgsProcessingException(f"Failed to unzip file: {zip_path} ({e})")
 
-        if not file_list:
-            raise QgsProcessingException("Zip file contains no files.")
+        if use_cache:
+            EXTRACTION_CACHE.record(fingerprint, todo, [member_target(dest_folder, m.filename) for m in todo])
+            # The paths go out in DISTFILES, so a later run must not evict them
+            EXTRACTION_CACHE.pin(fingerprint)
+            for evicted in EXTRACTION_CACHE.evict(cache_max, keep=fingerprint):
+                feedback.pushInfo(f"Evicted cached extraction {evicted}")
 
         # --- Build outputs ---
         results = {self.OUT_FILES: file_list, self.OUT_FIRST: file_list[0]}
@@ -0,0 +1,376 @@
+"""
+Zip files
+Name : Zipper
+Group : ETL
+With QGIS : 34000
+"""
+
+import os
+import struct
+import time
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from qgis.core import (
+    QgsProcessing,
+    QgsProcessingAlgorithm,
+    QgsProcessingParameterEnum,
+    QgsProcessingParameterFile,
+    QgsProcessingParameterFileDestination,
+    QgsProcessingParameterMultipleLayers,
+    QgsProcessingParameterNumber,
+    QgsProcessingException,
+)
+
+from .ftp_utils import PART_SUFFIX, TransferCanceled, TransferMonitor
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ZIP_STORED = 0
+ZIP_DEFLATED = 8
+ZIP_ZSTANDARD = 93
+
+CHUNK_SIZE = 4 * 1024 * 1024
+ZIP64_LIMIT = (1 << 31) - 1
+DEFLATE_WINDOW = 32 * 1024
+
+
+# -------------------------------------------------------------------
+# Chunk compression
+# -------------------------------------------------------------------
+def compress_chunk(data, method, level, last, zdict=None):
+    """
+    Compress one independent chunk of a member.
+
+    Deflate chunks end on a full flush (the last one on Z_FINISH), so the
+    chunks of a member concatenate into one valid deflate stream; zdict,
+    the tail of the previous chunk, keeps the ratio close to a single
+    stream. Zstandard chunks are separate frames, which decoders read back
+    to back.
+    """
+    if method == ZIP_DEFLATED:
+        if zdict:
+            c = zlib.compressobj(level, zlib.DEFLATED, -15, zdict=zdict)
+        else:
+            c = zlib.compressobj(level, zlib.DEFLATED, -15)
+        return c.compress(data) + c.flush(zlib.Z_FINISH if last else zlib.Z_FULL_FLUSH)
+    if method == ZIP_ZSTANDARD:
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    return data
+
+
+# -------------------------------------------------------------------
+# Streaming zip writer
+# -------------------------------------------------------------------
+def _dos_datetime(mtime):
+    t = time.localtime(mtime)
+    if t.tm_year < 1980:
+        return 0, (1 << 5) | 1
+    return (
+        (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2),
+        ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday,
+    )
+
+
+class ZipStreamWriter:
+    """
+    Writes a zip archive front to back without seeking.
+
+    Sizes and CRCs follow each member in a data descriptor, so the output
+    can be any writable stream. Members that may pass 2 GiB and archives
+    with large offsets or many entries use Zip64 records.
+    """
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.offset = 0
+        self.entries = []
+        self._current = None
+
+    def _write(self, data):
+        self.fileobj.write(data)
+        self.offset += len(data)
+
+    def start(self, arcname, method, mtime, size_hint):
+        name = arcname.encode("utf-8")
+        zip64 = size_hint * 1.05 > ZIP64_LIMIT
+        version = 63 if method == ZIP_ZSTANDARD else 45 if zip64 else 20
+        dostime, dosdate = _dos_datetime(mtime)
+        extra = struct.pack("<HHQQ", 1, 16, 0, 0) if zip64 else b""
+        sizes = 0xFFFFFFFF if zip64 else 0
+
+        self._current = {
+            "name": name, "method": method, "version": version, "zip64": zip64,
+            "time": dostime, "date": dosdate, "offset": self.offset,
+        }
+        self._write(struct.pack(
+            "<IHHHHHIIIHH", 0x04034B50, version, 0x0808, method, dostime, dosdate,
+            0, sizes, sizes, len(name), len(extra)
+        ) + name + extra)
+
+    def write(self, data):
+        self._write(data)
+
+    def finish(self, crc, size, compressed_size):
+        entry = self._current
+        if not entry["zip64"] and max(size, compressed_size) > ZIP64_LIMIT:
+            raise OverflowError(f"{entry['name'].decode()} grew past 2 GiB without Zip64")
+        fmt = "<IIQQ" if entry["zip64"] else "<IIII"
+        self._write(struct.pack(fmt, 0x08074B50, crc, compressed_size, size))
+        entry.update(crc=crc, size=size, compressed_size=compressed_size)
+        self.entries.append(entry)
+        self._current = None
+
+    def close(self):
+        cd_offset = self.offset
+        for e in self.entries:
+            extra_values = []
+            size, csize, offset = e["size"], e["compressed_size"], e["offset"]
+            if size > ZIP64_LIMIT:
+                extra_values.append(size)
+                size = 0xFFFFFFFF
+            if csize > ZIP64_LIMIT:
+                extra_values.append(csize)
+                csize = 0xFFFFFFFF
+            if offset > ZIP64_LIMIT:
+                extra_values.append(offset)
+                offset = 0xFFFFFFFF
+            extra = b""
+            if extra_values:
+                extra = struct.pack(f"<HH{len(extra_values)}Q", 1, 8 * len(extra_values), *extra_values)
+            version = max(e["version"], 45) if extra else e["version"]
+
+            self._write(struct.pack(
+                "<IHHHHHHIIIHHHHHII", 0x02014B50, (3 << 8) | version, version, 0x0808,
+                e["method"], e["time"], e["date"], e["crc"], csize, size,
+                len(e["name"]), len(extra), 0, 0, 0, 0o100644 << 16, offset
+            ) + e["name"] + extra)
+
+        cd_size = self.offset - cd_offset
+        count = len(self.entries)
+
+        if count >= 0xFFFF or cd_offset > ZIP64_LIMIT or cd_size > ZIP64_LIMIT:
+            zip64_offset = self.offset
+            self._write(struct.pack(
+                "<IQHHIIQQQQ", 0x06064B50, 44, 45, 45, 0, 0, count, count, cd_size, cd_offset
+            ))
+            self._write(struct.pack("<IIQI", 0x07064B50, 0, zip64_offset, 1))
+            count = min(count, 0xFFFF)
+            cd_size = min(cd_size, 0xFFFFFFFF)
+            cd_offset = min(cd_offset, 0xFFFFFFFF)
+
+        self._write(struct.pack("<IHHHHIIH", 0x06054B50, 0, 0, count, count, cd_size, cd_offset, 0))
+
+
+# -------------------------------------------------------------------
+# Parallel pipeline
+# -------------------------------------------------------------------
+def _read_chunks(files, chunk_size):
+    """Yield (index, data, first, last) for every chunk of every file, in order."""
+    for index, (path, _) in enumerate(files):
+        with open(path, "rb") as f:
+            data, first = f.read(chunk_size), True
+            while True:
+                following = f.read(chunk_size)
+                yield index, data, first, not following
+                if not following:
+                    break
+                data, first = following, False
+
+
+def zip_files(files, output, method=ZIP_DEFLATED, level=6, workers=4,
+              chunk_size=CHUNK_SIZE, feedback=None):
+    """
+    Write [(path, arcname)] into a zip file at output.
+
+    Chunks of every member are compressed on a thread pool (zlib and
+    zstandard release the GIL) while this thread reads ahead and writes
+    finished chunks in order. At most 2 * workers chunks are in flight,
+    so memory stays flat however large the archive. The archive is
+    written to a .part file and moved into place when complete.
+    """
+    if method == ZIP_ZSTANDARD and zstandard is None:
+        raise RuntimeError("Zstandard compression needs the 'zstandard' Python package")
+
+    sizes = [os.path.getsize(path) for path, _ in files]
+    monitor = TransferMonitor(feedback, sum(sizes))
+    part_path = output + PART_SUFFIX
+    pending = deque()
+    crcs = [0] * len(files)
+    written = [0] * len(files)
+
+    def drain(writer, limit):
+        while len(pending) > limit:
+            index, size, first, last, future = pending.popleft()
+            data = future.result()
+            if first:
+                path, arcname = files[index]
+                writer.start(arcname, method, os.path.getmtime(path), sizes[index])
+            writer.write(data)
+            written[index] += len(data)
+            monitor.update(size)
+            if last:
+                writer.finish(crcs[index], sizes[index], written[index])
+
+    try:
+        with open(part_path, "wb") as f, ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            writer = ZipStreamWriter(f)
+            previous = {}
+            for index, data, first, last in _read_chunks(files, chunk_size):
+                crcs[index] = zlib.crc32(data, crcs[index])
+                zdict = previous.pop(index, None)
+                future = pool.submit(compress_chunk, data, method, level, last, zdict)
+                if method == ZIP_DEFLATED and not last:
+                    previous[index] = data[-DEFLATE_WINDOW:]
+                pending.append((index, len(data), first, last, future))
+                drain(writer, 2 * max(1, workers))
+            drain(writer, 0)
+            writer.close()
+    except BaseException:
+        for *_, future in pending:
+            future.cancel()
+        if os.path.exists(part_path):
+            os.remove(part_path)
+        raise
+
+    os.replace(part_path, output)
+    monitor.report()
+    return output
+
+
+# -------------------------------------------------------------------
+# Processing Algorithm
+# -------------------------------------------------------------------
+class Zipper(QgsProcessingAlgorithm):
+
+    PARAM_FILES = "FILES"
+    PARAM_FOLDER = "FOLDER"
+    PARAM_METHOD = "METHOD"
+    PARAM_LEVEL = "LEVEL"
+    PARAM_WORKERS = "WORKERS"
+    OUT_ZIP = "OUTPUT"
+
+    METHOD_OPTIONS = ["Store (no compression)", "Deflate", "Zstandard"]
+    METHODS = [ZIP_STORED, ZIP_DEFLATED, ZIP_ZSTANDARD]
+
+    def initAlgorithm(self, config=None):
+
+        # Files and/or a folder to package
+        self.addParameter(
+            QgsProcessingParameterMultipleLayers(
+                self.PARAM_FILES,
+                "Files to be zipped",
+                layerType=QgsProcessing.TypeFile,
+                optional=True,
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterFile(
+                self.PARAM_FOLDER,
+                "Folder to be zipped (recursively)",
+                behavior=QgsProcessingParameterFile.Folder,
+                optional=True,
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterEnum(
+                self.PARAM_METHOD,
+                "Compression",
+                options=self.METHOD_OPTIONS,
+                defaultValue=1,
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.PARAM_LEVEL,
+                "Compression level (deflate 1-9, zstandard 1-22)",
+                type=QgsProcessingParameterNumber.Integer,
+                defaultValue=6,
+                minValue=1,
+                maxValue=22,
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterNumber(
+                self.PARAM_WORKERS,
+                "Parallel compression threads",
+                type=QgsProcessingParameterNumber.Integer,
+                defaultValue=os.cpu_count() or 4,
+                minValue=1,
+                maxValue=128,
+            )
+        )
+
+        self.addParameter(
+            QgsProcessingParameterFileDestination(
+                self.OUT_ZIP,
+                "Zip file",
+                fileFilter="ZIP files (*.zip)",
+            )
+        )
+
+    def processAlgorithm(self, parameters, context, feedback):
+
+        # --- Resolve inputs ---
+        paths = self.parameterAsFileList(parameters, self.PARAM_FILES, context)
+        folder = self.parameterAsString(parameters, self.PARAM_FOLDER, context)
+        method = self.METHODS[self.parameterAsEnum(parameters, self.PARAM_METHOD, context)]
+        level = self.parameterAsInt(parameters, self.PARAM_LEVEL, context)
+        workers = self.parameterAsInt(parameters, self.PARAM_WORKERS, context)
+        output = self.parameterAsFileOutput(parameters, self.OUT_ZIP, context)
+
+        if method == ZIP_DEFLATED:
+            level = min(level, 9)
+
+        files = [(path, os.path.basename(path)) for path in paths]
+        if folder:
+            for root, _, names in os.walk(folder):
+                for name in sorted(names):
+                    path = os.path.join(root, name)
+                    files.append((path, os.path.relpath(path, folder).replace(os.sep, "/")))
+
+        if not files:
+            raise QgsProcessingException("No files to zip.")
+
+        arcnames = [arcname for _, arcname in files]
+        duplicates = {a for a in arcnames if arcnames.count(a) > 1}
+        if duplicates:
+            raise QgsProcessingException(f"Duplicate names in archive: {', '.join(sorted(duplicates))}")
+
+        # --- Zip ---
+        feedback.pushInfo(f"Zipping {len(files)} files with {workers} threads")
+        try:
+            zip_files(files, output, method, level, workers, feedback=feedback)
+        except TransferCanceled:
+            feedback.pushInfo("Zipping canceled")
+            return {}
+        except (OSError, RuntimeError, OverflowError) as e:
+            raise QgsProcessingException(f"Failed to write zip file: {output} ({e})")
+
+        return {self.OUT_ZIP: output}
+
+    def name(self):
+        return "Zipper"
+
+    def displayName(self):
+        return "Zipper"
+
+    def group(self):
+        return "ETL"
+
+    def groupId(self):
+        return "ETL"
+
+    def shortHelpString(self):
+        return "Zip files, compressing in parallel"
+
+    def createInstance(self):
+        return Zipper()
@@ -47,6 +47,7 @@ from qgis.PyQt.QtCore import QUrl
 
 # --- Local import ---
 from .kortxyz_provider import KORTxyzProvider
+from .ETL.ftp_pool import FTP_POOL
 
 # --- Ensure module path ---
 cmd_folder = os.path.split(inspect.getfile(inspect.currentframe()))[0]
@@ -153,3 +154,6 @@ class KORTxyzPlugin:
         if self.provider:
             reg.removeProvider(self.provider)
             self.provider = None
+
+        # Close pooled FTP sessions
+        FTP_POOL.clear()
@@ -3,12 +3,16 @@ from qgis.PyQt.QtGui import QIcon
 import os
 
 from .ETL.ftp_caller import FTPcaller
+from .ETL.ftp_mirror import FTPmirror
+from .ETL.ftp_uploader import FTPuploader
 from .ETL.unzipper import Unzipper
+from .ETL.zipper import Zipper
 
 from .Datafordeler.DAGI import DAGI
 from .Datafordeler.GeoDK import GeoDK
 from .Datafordeler.MAT2 import MAT2
 from .Datafordeler.Stednavne import Stednavne
+from .Datafordeler.RegisterSnapshot import RegisterSnapshot
 
 
 class KORTxyzProvider(QgsProcessingProvider):
@@ -18,12 +22,16 @@ class KORTxyzProvider(QgsProcessingProvider):
 
     def loadAlgorithms(self):
         self.addAlgorithm(FTPcaller())
+        self.addAlgorithm(FTPmirror())
+        self.addAlgorithm(FTPuploader())
         self.addAlgorithm(Unzipper())
+        self.addAlgorithm(Zipper())
 
         self.addAlgorithm(DAGI())
         self.addAlgorithm(GeoDK())
         self.addAlgorithm(MAT2())
         self.addAlgorithm(Stednavne())
+        self.addAlgorithm(RegisterSnapshot())
 
     def id(self):
         return 'KORTxyz'
@@ -0,0 +1,341 @@
+# coding=utf-8
+"""FTP/FTPS throughput benchmark for the FTPcaller transfer paths.
+
+Starts a plain FTP and an implicit FTPS server (self-signed certificate)
+on loopback, serves synthetic files and times the download paths that
+FTPcaller uses: single stream, segmented, and batch with both the
+threaded and the asyncio engine. Connection setup is timed with and
+without the session pool. Results are written as JSON so runs from
+different plugin versions can be compared.
+
+Needs pyftpdlib and pyOpenSSL, but not QGIS::
+
+    pip install pyftpdlib pyopenssl
+    python test/benchmark_ftp.py --sizes 1K,1M,100M,2G --output bench.json
+
+This is not a unit test and is not collected by the test runner.
+"""
+
+import argparse
+import configparser
+import datetime
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from functools import partial
+
+PLUGIN_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+sys.path.insert(0, PLUGIN_DIR)
+
+from ETL.ftp_utils import (  # noqa: E402
+    open_ftp,
+    download_file,
+    download_many,
+    download_segmented,
+    TransferMonitor
+)
+from ETL.ftp_pool import FTPPool  # noqa: E402
+from ETL.ftp_async import download_many_async  # noqa: E402
+
+CHUNK = 1024 * 1024
+UNITS = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+
+
+def parse_size(text):
+    text = text.strip().upper().rstrip("B")
+    if text[-1:] in UNITS:
+        return int(float(text[:-1]) * UNITS[text[-1]])
+    return int(text)
+
+
+def max_rss_mb():
+    """Peak resident set size of this process, where the platform reports it."""
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return round(rss / (1e6 if sys.platform == "darwin" else 1e3), 2)
+
+
+def plugin_version():
+    parser = configparser.ConfigParser()
+    parser.read(os.path.join(PLUGIN_DIR, "metadata.txt"))
+    return parser.get("general", "version", fallback="unknown")
+
+
+# -------------------------------------------------------------------
+# Fixtures: certificate, synthetic files, servers
+# -------------------------------------------------------------------
+def make_certificate(folder):
+    """Write a self-signed localhost certificate and key, return (cert, key)."""
+    from cryptography import x509
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import rsa
+    from cryptography.x509.oid import NameOID
+
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .sign(key, hashes.SHA256())
+    )
+
+    cert_path = os.path.join(folder, "cert.pem")
+    key_path = os.path.join(folder, "key.pem")
+    with open(cert_path, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, "wb") as f:
+        f.write(key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.TraditionalOpenSSL,
+            serialization.NoEncryption()
+        ))
+    return cert_path, key_path
+
+
+def make_files(root, sizes, batch_count, batch_size):
+    """Create one file per size plus a folder of small files for batch runs."""
+    block = os.urandom(CHUNK)
+    names = {}
+    for size in sizes:
+        name = f"file_{size}.bin"
+        with open(os.path.join(root, name), "wb") as f:
+            remaining = size
+            while remaining:
+                n = min(CHUNK, remaining)
+                f.write(block[:n])
+                remaining -= n
+        names[size] = "/" + name
+
+    os.makedirs(os.path.join(root, "batch"), exist_ok=True)
+    for i in range(batch_count):
+        with open(os.path.join(root, "batch", f"part_{i:05d}.bin"), "wb") as f:
+            f.write(os.urandom(batch_size))
+    return names
+
+
+def start_servers(root, cert_path, key_path):
+    """Start plain FTP and implicit FTPS servers on loopback, return ports and servers."""
+    from pyftpdlib.authorizers import DummyAuthorizer
+    from pyftpdlib.handlers import FTPHandler, TLS_FTPHandler
+    from pyftpdlib.ioloop import IOLoop
+    from pyftpdlib.log import config_logging
+    from pyftpdlib.servers import ThreadedFTPServer
+
+    class ImplicitTLSHandler(TLS_FTPHandler):
+        """Starts TLS before the greeting and protects data channels by default."""
+
+        def handle(self):
+            self._pbsz = True
+            self._prot = True
+            self.secure_connection(self.ssl_context)
+
+        def handle_ssl_established(self):
+            TLS_FTPHandler.handle(self)
+
+    config_logging(level=logging.WARNING)
+
+    authorizer = DummyAuthorizer()
+    authorizer.add_user("bench", "bench", root, perm="elr")
+
+    plain = type("PlainHandler", (FTPHandler,), {"authorizer": authorizer})
+    implicit = type("Implicit", (ImplicitTLSHandler,), {
+        "authorizer": authorizer, "certfile": cert_path, "keyfile": key_path
+    })
+
+    # Each server needs its own IO loop when both run in background threads
+    servers = {
+        "ftp": ThreadedFTPServer(("127.0.0.1", 0), plain, ioloop=IOLoop()),
+        "ftps": ThreadedFTPServer(("127.0.0.1", 0), implicit, ioloop=IOLoop()),
+    }
+    for server in servers.values():
+        server.max_cons = 1024
+        threading.Thread(
+            target=server.serve_forever, kwargs={"handle_exit": False}, daemon=True
+        ).start()
+
+    ports = {scheme: server.socket.getsockname()[1] for scheme, server in servers.items()}
+    return ports, list(servers.values())
+
+
+# -------------------------------------------------------------------
+# Measurements
+# -------------------------------------------------------------------
+def measure(fn, trace_memory):
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    fn()
+    seconds = time.perf_counter() - start
+    peak = None
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return seconds, peak
+
+
+def row(scheme, mode, size, files, seconds, peak, **extra):
+    total = size * files
+    result = {
+        "scheme": scheme,
+        "mode": mode,
+        "file_size": size,
+        "files": files,
+        "bytes": total,
+        "seconds": round(seconds, 4),
+        "mb_per_s": round(total / seconds / 1e6, 2) if seconds else None,
+        "peak_python_mb": round(peak / 1e6, 2) if peak is not None else None,
+    }
+    result.update(extra)
+    return result
+
+
+def bench_connect(scheme, port, rounds):
+    """Average cost of a fresh login versus borrowing from the pool."""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        open_ftp(scheme, "127.0.0.1", port, "bench", "bench").quit()
+    fresh = (time.perf_counter() - start) / rounds
+
+    pool = FTPPool()
+    pool.release(pool.acquire(scheme, "127.0.0.1", port, "bench", "bench"))
+    start = time.perf_counter()
+    for _ in range(rounds):
+        pool.release(pool.acquire(scheme, "127.0.0.1", port, "bench", "bench"))
+    pooled = (time.perf_counter() - start) / rounds
+    pool.clear()
+
+    return {
+        "scheme": scheme,
+        "fresh_login_ms": round(fresh * 1000, 3),
+        "pooled_acquire_ms": round(pooled * 1000, 3),
+    }
+
+
+def run(args):
+    sizes = [parse_size(s) for s in args.sizes.split(",")]
+    workdir = tempfile.mkdtemp(prefix="kortxyz_bench_")
+    serve_root = os.path.join(workdir, "serve")
+    out_root = os.path.join(workdir, "out")
+    os.makedirs(serve_root)
+    os.makedirs(out_root)
+
+    try:
+        cert_path, key_path = make_certificate(workdir)
+        names = make_files(serve_root, sizes, args.batch_files, parse_size(args.batch_size))
+        ports, servers = start_servers(serve_root, cert_path, key_path)
+        blocksize = parse_size(args.blocksize)
+        batch_size = parse_size(args.batch_size)
+        results, connect = [], []
+
+        for scheme in args.schemes.split(","):
+            port = ports[scheme]
+            pool = FTPPool()
+            key = (scheme, "127.0.0.1", port, "bench", "bench")
+            connect.append(bench_connect(scheme, port, args.connect_rounds))
+
+            for size in sizes:
+                remote = names[size]
+                local = os.path.join(out_root, os.path.basename(remote))
+
+                def single():
+                    with pool.connection(*key) as ftp:
+                        download_file(ftp, remote, local, blocksize, TransferMonitor())
+
+                seconds, peak = measure(single, args.memory)
+                results.append(row(scheme, "single", size, 1, seconds, peak))
+                print(results[-1], file=sys.stderr)
+
+                def segmented():
+                    download_segmented(
+                        partial(pool.acquire, *key), remote, size, local,
+                        args.segments, blocksize, TransferMonitor()
+                    )
+
+                seconds, peak = measure(segmented, args.memory)
+                results.append(row(scheme, "segmented", size, 1, seconds, peak, segments=args.segments))
+                print(results[-1], file=sys.stderr)
+
+            jobs = [
+                (f"/batch/part_{i:05d}.bin", os.path.join(out_root, "batch", f"part_{i:05d}.bin"))
+                for i in range(args.batch_files)
+            ]
+
+            def batch_threads():
+                download_many(partial(pool.connection, *key), jobs, args.workers, blocksize)
+
+            seconds, peak = measure(batch_threads, args.memory)
+            results.append(row(scheme, "batch-threads", batch_size, len(jobs), seconds, peak, workers=args.workers))
+            print(results[-1], file=sys.stderr)
+
+            def batch_async():
+                download_many_async(*key, jobs, concurrency=args.workers, blocksize=blocksize)
+
+            seconds, peak = measure(batch_async, args.memory)
+            results.append(row(scheme, "batch-asyncio", batch_size, len(jobs), seconds, peak, workers=args.workers))
+            print(results[-1], file=sys.stderr)
+
+            pool.clear()
+
+        for server in servers:
+            server.close_all()
+
+        return {
+            "plugin_version": plugin_version(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "blocksize": blocksize,
+            "max_rss_mb": max_rss_mb(),
+            "connect": connect,
+            "results": results,
+        }
+
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default="1K,1M,100M", help="comma separated file sizes, e.g. 1K,1M,4G")
+    parser.add_argument("--schemes", default="ftp,ftps", help="ftp, ftps or both")
+    parser.add_argument("--segments", type=int, default=4)
+    parser.add_argument("--workers", type=int, default=16, help="connections in batch mode")
+    parser.add_argument("--batch-files", type=int, default=200)
+    parser.add_argument("--batch-size", default="16K")
+    parser.add_argument("--blocksize", default="256K")
+    parser.add_argument("--connect-rounds", type=int, default=20)
+    parser.add_argument("--no-memory", dest="memory", action="store_false",
+                        help="skip tracemalloc peak measurement")
+    parser.add_argument("--keep", action="store_true", help="keep the temporary files")
+    parser.add_argument("--output", help="write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    report = run(args)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
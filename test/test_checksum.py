@@ -0,0 +1,65 @@
+# coding=utf-8
+"""Tests for the download checksum helpers."""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+from ETL.checksum import ChecksumMismatch, hash_file, new_hasher, parse_checksum, verify
+
+MD5 = "d41d8cd98f00b204e9800998ecf8427e"
+SHA256 = "e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855"
+
+
+class TestParseChecksum(unittest.TestCase):
+    """Test reading digests out of checksum files."""
+
+    def test_bare_digest(self):
+        self.assertEqual(parse_checksum(MD5 + "\n"), MD5)
+        self.assertEqual(parse_checksum(SHA256.upper()), SHA256)
+
+    def test_md5sum_line(self):
+        self.assertEqual(parse_checksum(f"{MD5}  data.zip\n"), MD5)
+        self.assertEqual(parse_checksum(f"{MD5} *data.zip\n"), MD5)
+
+    def test_line_naming_the_file_wins(self):
+        text = f"{MD5}  other.zip\n{'a' * 32}  data.zip\n"
+        self.assertEqual(parse_checksum(text, "data.zip"), "a" * 32)
+        self.assertEqual(parse_checksum(text, "missing.zip"), MD5)
+
+    def test_no_digest(self):
+        self.assertIsNone(parse_checksum("not found\n"))
+        self.assertIsNone(parse_checksum(""))
+
+
+class TestHashing(unittest.TestCase):
+    """Test hashing files and verifying digests."""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_hash_file_prefix(self):
+        data = os.urandom(3000)
+        path = os.path.join(self.folder, "x.bin")
+        with open(path, "wb") as f:
+            f.write(data)
+
+        self.assertEqual(hash_file(path, new_hasher("md5"), blocksize=1000).hexdigest(),
+                         hashlib.md5(data).hexdigest())
+        self.assertEqual(hash_file(path, new_hasher("sha256"), 1234, blocksize=1000).hexdigest(),
+                         hashlib.sha256(data[:1234]).hexdigest())
+
+    def test_verify(self):
+        verify("md5", MD5, MD5.upper(), "x")
+        verify("md5", MD5, None, "x")
+        with self.assertRaises(ChecksumMismatch):
+            verify("md5", MD5, "0" * 32, "x")
+
+
+if __name__ == '__main__':
+    unittest.main()
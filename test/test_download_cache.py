@@ -0,0 +1,149 @@
+# coding=utf-8
+"""Tests for the persistent Datafordeler download cache."""
+
+import importlib
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+# The Datafordeler modules import ETL relative to the plugin package
+PLUGIN_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(PLUGIN_FOLDER))
+PLUGIN = os.path.basename(PLUGIN_FOLDER)
+download_cache = importlib.import_module(f"{PLUGIN}.Datafordeler.download_cache")
+http_utils = importlib.import_module(f"{PLUGIN}.ETL.http_utils")
+
+
+class ValidatorHandler(BaseHTTPRequestHandler):
+    """Answers HEAD with a fixed status and GET with a 304 or the file."""
+
+    protocol_version = "HTTP/1.1"
+    head_status = 304
+    get_status = 304
+    etag = '"v1"'
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def answer(self, status, body=b""):
+        self.send_response(status)
+        self.send_header("ETag", self.etag)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        return body
+
+    def do_HEAD(self):
+        self.requests.append("HEAD")
+        self.answer(self.head_status)
+
+    def do_GET(self):
+        self.requests.append("GET")
+        body = self.answer(self.get_status, b"x" * 10 if self.get_status == 200 else b"")
+        self.wfile.write(body)
+
+
+class TestDownloadCache(unittest.TestCase):
+    """Test revalidation of cached downloads against a local server."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), ValidatorHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f"http://127.0.0.1:{cls.server.server_port}/x.zip"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.cache = download_cache.DownloadCache(self.folder)
+        self.downloads = []
+        ValidatorHandler.head_status = ValidatorHandler.get_status = 304
+        ValidatorHandler.etag = '"v1"'
+        ValidatorHandler.requests = []
+        self.fetch()
+        self.downloads.clear()
+        ValidatorHandler.requests.clear()
+
+    def tearDown(self):
+        http_utils.HTTP_POOL.close_all()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def download(self, url, local_path, feedback):
+        self.downloads.append(url)
+        with open(local_path, "wb") as f:
+            f.write(b"x" * 10)
+        return {"etag": '"v1"', "size": 10}
+
+    def fetch(self, feedback=None):
+        return self.cache.fetch(self.url, "DAR", "Adresse", "current", feedback=feedback, download=self.download)
+
+    def test_not_modified_uses_the_cache(self):
+        self.fetch()
+        self.assertEqual(self.downloads, [])
+        self.assertEqual(ValidatorHandler.requests, ["HEAD"])
+
+    def test_head_refused_asks_with_get(self):
+        ValidatorHandler.head_status = 405
+        self.fetch()
+        self.assertEqual(self.downloads, [])
+        self.assertEqual(ValidatorHandler.requests, ["HEAD", "GET"])
+
+        ValidatorHandler.get_status = 200
+        ValidatorHandler.etag = '"v2"'
+        self.fetch()
+        self.assertEqual(self.downloads, [self.url])
+
+    def test_gone_is_fatal(self):
+        ValidatorHandler.head_status = 404
+        with self.assertRaises(download_cache.HTTPStatusError):
+            self.fetch()
+        self.assertEqual(self.downloads, [])
+
+    def test_server_down_uses_the_cache(self):
+        ValidatorHandler.head_status = 503
+        feedback = mock.Mock()
+        self.fetch(feedback)
+        self.assertEqual(self.downloads, [])
+        feedback.reportError.assert_called_once()
+
+
+
+class TestDownloadCacheEviction(unittest.TestCase):
+    """Test the size cap of the download cache."""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.cache = download_cache.DownloadCache(self.folder)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def add(self, key, last_used, size=100):
+        os.makedirs(self.cache.entry(key))
+        self.cache._write_meta(key, {"last_used": last_used, "size": size})
+
+    def test_least_recently_used_go_first(self):
+        self.add("old", 1)
+        self.add("mid", 2)
+        self.add("new", 3)
+        self.assertEqual(self.cache.evict(150, keep="old"), ["mid", "new"])
+        self.assertEqual(os.listdir(self.folder), ["old"])
+
+    def test_download_in_progress_is_left_alone(self):
+        os.makedirs(self.cache.entry("running"))
+        self.add("done", 1)
+        self.assertEqual(self.cache.evict(0), ["done"])
+        self.assertEqual(os.listdir(self.folder), ["running"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+# coding=utf-8
+"""Tests for the extraction cache."""
+
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+from ETL.extract_cache import ExtractionCache
+
+
+class TestExtractionCache(unittest.TestCase):
+    """Test which cached members are trusted."""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.cache = ExtractionCache(os.path.join(self.folder, "unzip"))
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def extract(self, fingerprint, name, data):
+        """Write a member into an entry and record it; return (member, path)."""
+        member = zipfile.ZipInfo(name)
+        member.file_size = len(data)
+        path = os.path.join(self.cache.entry(fingerprint), name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+        self.cache.record(fingerprint, [member], [path])
+        return member, path
+
+    def test_recorded_member_is_reused(self):
+        member, path = self.extract("a", "x.gpkg", b"x" * 100)
+        self.assertEqual(self.cache.missing("a", [member], [path]), [])
+
+    def test_edit_of_same_size_is_noticed(self):
+        member, path = self.extract("a", "x.gpkg", b"x" * 100)
+        st = os.stat(path)
+        with open(path, "r+b") as f:
+            f.write(b"edited")
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000_000))
+
+        self.assertEqual(os.path.getsize(path), 100)
+        self.assertEqual(self.cache.missing("a", [member], [path]), [member])
+
+    def test_adopted_member_is_reused(self):
+        member, path = self.extract("a", "x.gpkg", b"x" * 100)
+        with open(path, "ab") as f:
+            f.write(b"index")
+        self.cache.adopt("a", "x.gpkg", path)
+        self.assertEqual(self.cache.missing("a", [member], [path]), [])
+
+    def test_missing_file(self):
+        member, path = self.extract("a", "x.gpkg", b"x" * 100)
+        os.remove(path)
+        self.assertEqual(self.cache.missing("a", [member], [path]), [member])
+
+    def test_owns(self):
+        self.assertTrue(self.cache.owns(os.path.join(self.cache.entry("a"), "x.gpkg")))
+        self.assertFalse(self.cache.owns(os.path.join(self.folder, "unzip2", "x.gpkg")))
+        self.assertFalse(self.cache.owns(os.path.join(self.folder, "x.gpkg")))
+
+
+class TestExtractionCacheEviction(unittest.TestCase):
+    """Test the size cap of the extraction cache."""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.cache = ExtractionCache(os.path.join(self.folder, "unzip"))
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def add(self, fingerprint, last_used, size=100):
+        os.makedirs(self.cache.entry(fingerprint))
+        self.cache._write_manifest(fingerprint, {"members": {"x.gpkg": size}, "last_used": last_used})
+
+    def test_least_recently_used_go_first(self):
+        self.add("old", 1)
+        self.add("mid", 2)
+        self.add("new", 3)
+        self.assertEqual(self.cache.evict(150), ["old", "mid"])
+        self.assertEqual(os.listdir(self.cache.folder), ["new"])
+
+    def test_kept_and_pinned_entries_stay(self):
+        self.add("old", 1)
+        self.add("mid", 2)
+        self.add("new", 3)
+        self.cache.pin("mid")
+        self.assertEqual(self.cache.evict(0, keep="old"), ["new"])
+        self.assertEqual(sorted(os.listdir(self.cache.folder)), ["mid", "old"])
+
+    def test_adopted_size_counts(self):
+        self.add("old", 1)
+        self.add("new", 2)
+        manifest = self.cache._read_manifest("new")
+        manifest["adopted"] = {"x.gpkg": 1000}
+        self.cache._write_manifest("new", manifest)
+        self.assertEqual(self.cache.evict(500), ["old", "new"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+# coding=utf-8
+"""Tests for the asyncio FTP transfer engine."""
+
+import hashlib
+import importlib.util
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from ETL.ftp_async import download_many_async
+
+HAVE_SERVER = importlib.util.find_spec("pyftpdlib") is not None
+HAVE_TLS = HAVE_SERVER and all(importlib.util.find_spec(m) for m in ("cryptography", "OpenSSL"))
+
+
+@unittest.skipUnless(HAVE_SERVER, "needs pyftpdlib")
+class TestAsyncDownload(unittest.TestCase):
+    """Test download_many_async against local FTP and explicit FTPS servers."""
+
+    @classmethod
+    def setUpClass(cls):
+        from pyftpdlib.authorizers import DummyAuthorizer
+        from pyftpdlib.handlers import FTPHandler
+        from pyftpdlib.servers import ThreadedFTPServer
+
+        cls.folder = tempfile.mkdtemp()
+        cls.root = os.path.join(cls.folder, "root")
+        os.makedirs(cls.root)
+        cls.contents = {f"f{i}.bin": os.urandom(1000 * i + 1) for i in range(6)}
+        for name, data in cls.contents.items():
+            with open(os.path.join(cls.root, name), "wb") as f:
+                f.write(data)
+            with open(os.path.join(cls.root, name + ".sha256"), "w") as f:
+                f.write(f"{hashlib.sha256(data).hexdigest()}  {name}\n")
+
+        authorizer = DummyAuthorizer()
+        authorizer.add_user("u", "p", cls.root, perm="elr")
+        cls.servers = []
+        cls.ports = {}
+
+        handlers = {"ftp": type("Handler", (FTPHandler,), {"authorizer": authorizer})}
+        if HAVE_TLS:
+            from pyftpdlib.handlers import TLS_FTPHandler
+            sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+            from benchmark_ftp import make_certificate
+
+            cert_path, key_path = make_certificate(cls.folder)
+            handlers["ftpes"] = type("TLSHandler", (TLS_FTPHandler,), {
+                "authorizer": authorizer, "certfile": cert_path, "keyfile": key_path,
+                "tls_control_required": True, "tls_data_required": True
+            })
+
+        for scheme, handler in handlers.items():
+            server = ThreadedFTPServer(("127.0.0.1", 0), handler)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            cls.servers.append(server)
+            cls.ports[scheme] = server.address[1]
+
+    @classmethod
+    def tearDownClass(cls):
+        for server in cls.servers:
+            server.close_all()
+        shutil.rmtree(cls.folder, ignore_errors=True)
+
+    def setUp(self):
+        self.out = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.out, ignore_errors=True)
+
+    def jobs(self, names):
+        return [(f"/{name}", os.path.join(self.out, name)) for name in names]
+
+    def download(self, scheme, jobs, **kwargs):
+        return download_many_async(scheme, "127.0.0.1", self.ports[scheme], "u", "p", jobs, **kwargs)
+
+    def check(self, scheme):
+        statuses = self.download(scheme, self.jobs(self.contents), concurrency=3, hash_name="sha256")
+        self.assertEqual([s["status"] for s in statuses], ["ok"] * len(self.contents))
+        for name, data in self.contents.items():
+            with open(os.path.join(self.out, name), "rb") as f:
+                self.assertEqual(f.read(), data)
+        self.assertEqual(
+            [s["digest"] for s in statuses], [hashlib.sha256(d).hexdigest() for d in self.contents.values()]
+        )
+
+    def test_plain_ftp(self):
+        self.check("ftp")
+
+    @unittest.skipUnless(HAVE_TLS, "needs cryptography and pyopenssl")
+    def test_explicit_tls(self):
+        self.check("ftpes")
+
+    def test_missing_file_fails_alone(self):
+        feedback = mock.Mock()
+        feedback.isCanceled.return_value = False
+        statuses = self.download("ftp", self.jobs(["f1.bin", "nope.bin", "f2.bin"]), concurrency=1,
+                                 feedback=feedback)
+        self.assertEqual([s["status"] for s in statuses], ["ok", "failed", "ok"])
+        self.assertFalse(os.path.exists(os.path.join(self.out, "nope.bin")))
+        self.assertFalse(os.path.exists(os.path.join(self.out, "nope.bin.part")))
+        feedback.reportError.assert_called_once()
+
+    def write_root(self, name, text):
+        with open(os.path.join(self.root, name), "w") as f:
+            f.write(text)
+
+    def test_checksum_mismatch_removes_the_file(self):
+        with open(os.path.join(self.root, "f3.bin.sha256")) as f:
+            good = f.read()
+        self.addCleanup(self.write_root, "f3.bin.sha256", good)
+        self.write_root("f3.bin.sha256", "0" * 64 + "  f3.bin\n")
+
+        statuses = self.download("ftp", self.jobs(["f3.bin"]), hash_name="sha256")
+        self.assertEqual(statuses[0]["status"], "failed")
+        self.assertFalse(os.path.exists(os.path.join(self.out, "f3.bin")))
+
+    def test_canceled(self):
+        feedback = mock.Mock()
+        feedback.isCanceled.return_value = True
+        statuses = self.download("ftp", self.jobs(self.contents), feedback=feedback)
+        self.assertEqual({s["status"] for s in statuses}, {"canceled"})
+        self.assertEqual(os.listdir(self.out), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+# coding=utf-8
+"""Tests for the change detection of the FTP mirror."""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from ETL.ftp_mirror import MANIFEST_NAME, is_changed, read_manifest, write_manifest
+
+
+class TestChangeDetection(unittest.TestCase):
+    """Test which remote files the mirror fetches again."""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.local_path = os.path.join(self.folder, "a.zip")
+        with open(self.local_path, "wb") as f:
+            f.write(b"abc")
+        self.entry = {"size": 3, "modify": "20240101000000"}
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_unchanged_file_is_skipped(self):
+        self.assertFalse(is_changed(self.entry, dict(self.entry, type="file"), self.local_path))
+
+    def test_new_file(self):
+        self.assertTrue(is_changed(None, self.entry, self.local_path))
+
+    def test_deleted_local_copy(self):
+        os.remove(self.local_path)
+        self.assertTrue(is_changed(self.entry, self.entry, self.local_path))
+
+    def test_size_or_modify_changed(self):
+        self.assertTrue(is_changed(self.entry, dict(self.entry, size=4), self.local_path))
+        self.assertTrue(is_changed(self.entry, dict(self.entry, modify="20240102000000"), self.local_path))
+
+    def test_no_facts_always_fetches(self):
+        entry = {"size": None, "modify": None}
+        self.assertTrue(is_changed(entry, entry, self.local_path))
+
+    def test_manifest_round_trip(self):
+        self.assertEqual(read_manifest(self.folder), {})
+        write_manifest(self.folder, {"a.zip": self.entry})
+        self.assertEqual(read_manifest(self.folder), {"a.zip": self.entry})
+        self.assertFalse(os.path.exists(os.path.join(self.folder, MANIFEST_NAME + ".tmp")))
+
+    def test_broken_manifest_reads_empty(self):
+        with open(os.path.join(self.folder, MANIFEST_NAME), "w") as f:
+            f.write("{not json")
+        self.assertEqual(read_manifest(self.folder), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
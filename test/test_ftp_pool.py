@@ -0,0 +1,150 @@
+# coding=utf-8
+"""Tests for the pool of FTP sessions."""
+
+import importlib.util
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+from ftplib import error_temp
+from unittest import mock
+
+from ETL import ftp_pool
+from ETL.ftp_pool import FTPPool
+
+HAVE_SERVER = all(importlib.util.find_spec(m) for m in ("pyftpdlib", "cryptography", "OpenSSL"))
+
+
+class FakeSession:
+    def __init__(self):
+        self.sock = object()
+        self.commands = []
+        self.closed = False
+
+    def voidcmd(self, cmd):
+        self.commands.append(cmd)
+
+    def close(self):
+        self.closed = True
+        self.sock = None
+
+    def quit(self):
+        self.close()
+
+
+class TestFTPPool(unittest.TestCase):
+    """Test reuse, health checks and limits of the pool."""
+
+    def setUp(self):
+        patcher = mock.patch.object(ftp_pool, "open_ftp", side_effect=lambda *a, **k: FakeSession())
+        self.open_ftp = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pool = FTPPool(idle_timeout=60, max_idle_per_key=1)
+        self.key = ("ftp", "h", 21, "u", "p")
+
+    def test_released_session_is_reused(self):
+        ftp = self.pool.acquire(*self.key)
+        self.pool.release(ftp)
+        self.assertIs(self.pool.acquire(*self.key), ftp)
+        self.assertEqual(self.open_ftp.call_count, 1)
+
+    def test_sessions_are_kept_per_key(self):
+        ftp = self.pool.acquire(*self.key)
+        self.pool.release(ftp)
+        self.assertIsNot(self.pool.acquire("ftp", "h", 21, "other", "p"), ftp)
+
+    def test_unusable_session_is_closed(self):
+        ftp = self.pool.acquire(*self.key)
+        self.pool.release(ftp, reusable=False)
+        self.assertTrue(ftp.closed)
+        self.assertIsNot(self.pool.acquire(*self.key), ftp)
+
+    def test_idle_limit(self):
+        first, second = self.pool.acquire(*self.key), self.pool.acquire(*self.key)
+        self.pool.release(first)
+        self.pool.release(second)
+        self.assertTrue(second.closed)
+        self.assertFalse(first.closed)
+
+    def test_stale_sessions_are_probed_or_dropped(self):
+        ftp = self.pool.acquire(*self.key)
+        self.pool.release(ftp)
+        with mock.patch.object(ftp_pool.time, "monotonic", return_value=ftp_pool.time.monotonic() + 10):
+            self.assertIs(self.pool.acquire(*self.key), ftp)
+        self.assertEqual(ftp.commands, ["NOOP"])
+
+        ftp.voidcmd = mock.Mock(side_effect=error_temp("421 Timeout"))
+        self.pool.release(ftp)
+        with mock.patch.object(ftp_pool.time, "monotonic", return_value=ftp_pool.time.monotonic() + 10):
+            self.assertIsNot(self.pool.acquire(*self.key), ftp)
+        self.assertTrue(ftp.closed)
+
+        ftp = self.pool.acquire(*self.key)
+        self.pool.release(ftp)
+        with mock.patch.object(ftp_pool.time, "monotonic", return_value=ftp_pool.time.monotonic() + 120):
+            self.assertIsNot(self.pool.acquire(*self.key), ftp)
+        self.assertTrue(ftp.closed)
+
+    def test_connection_drops_the_session_on_error(self):
+        with self.assertRaises(RuntimeError):
+            with self.pool.connection(*self.key) as ftp:
+                raise RuntimeError("transfer failed")
+        self.assertTrue(ftp.closed)
+
+
+@unittest.skipUnless(HAVE_SERVER, "needs pyftpdlib, cryptography and pyopenssl")
+class TestTLSSessions(unittest.TestCase):
+    """Test TLS session reuse against a local explicit FTPS server."""
+
+    @classmethod
+    def setUpClass(cls):
+        from pyftpdlib.authorizers import DummyAuthorizer
+        from pyftpdlib.handlers import TLS_FTPHandler
+        from pyftpdlib.servers import ThreadedFTPServer
+
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        from benchmark_ftp import make_certificate
+
+        cls.folder = tempfile.mkdtemp()
+        cert_path, key_path = make_certificate(cls.folder)
+        with open(os.path.join(cls.folder, "x.bin"), "wb") as f:
+            f.write(b"x" * 10000)
+
+        authorizer = DummyAuthorizer()
+        authorizer.add_user("u", "p", cls.folder, perm="elr")
+        handler = type("Handler", (TLS_FTPHandler,), {
+            "authorizer": authorizer, "certfile": cert_path, "keyfile": key_path, "tls_data_required": True
+        })
+        cls.server = ThreadedFTPServer(("127.0.0.1", 0), handler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.close_all()
+        shutil.rmtree(cls.folder, ignore_errors=True)
+
+    def test_explicit_tls_resumes_sessions(self):
+        pool = FTPPool()
+        key = ("ftpes", "127.0.0.1", self.server.address[1], "u", "p")
+        ftp = pool.open(*key)
+        try:
+            conn, _ = ftp.ntransfercmd("RETR x.bin")
+            self.assertTrue(conn.session_reused)
+            while conn.recv(8192):
+                pass
+            conn.close()
+            ftp.voidresp()
+        finally:
+            ftp.close()
+
+        ftp = pool.open(*key)
+        try:
+            self.assertTrue(ftp.sock.session_reused)
+        finally:
+            ftp.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,286 @@
+# coding=utf-8
+"""Tests for the shared FTP transfer helpers."""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from ftplib import error_perm
+from unittest import mock
+
+from ETL import ftp_utils
+from ETL.ftp_utils import (
+    TransferCanceled, contiguous_prefix, download_resumable, download_segmented, expand_remote, ftp_url,
+    list_remote, local_paths, parse_ftp_url, probe_remote, split_ranges, upload_file, walk_remote
+)
+
+
+class FakeData:
+    """Data connection that serves bytes from an offset in small pieces."""
+
+    def __init__(self, data):
+        self.data = data
+
+    def recv(self, n):
+        block, self.data = self.data[:min(n, 1000)], self.data[min(n, 1000):]
+        return block
+
+    def close(self):
+        pass
+
+
+class FakeFTP:
+    def __init__(self, data):
+        self.data = data
+
+    def transfercmd(self, cmd, rest=None):
+        return FakeData(self.data[rest or 0:])
+
+    def close(self):
+        pass
+
+
+class CommandFTP:
+    """Server holding files in memory that records the commands it gets."""
+
+    def __init__(self, files=None, overwrite=True, folders=()):
+        self.files = dict(files or {})
+        self.folders = set(folders)
+        self.overwrite = overwrite
+        self.commands = []
+        self.cwd_path = "/"
+
+    def mlsd(self, path, facts=()):
+        self.commands.append(f"MLSD {path}")
+        raise error_perm("500 MLSD not understood")
+
+    def nlst(self, path):
+        self.commands.append(f"NLST {path}")
+        prefix = path.rstrip("/") + "/"
+        return sorted(
+            {p[len(prefix):].split("/")[0] for p in list(self.files) + list(self.folders) if p.startswith(prefix)}
+        )
+
+    def pwd(self):
+        return self.cwd_path
+
+    def cwd(self, path):
+        self.commands.append(f"CWD {path}")
+        if path not in self.folders and path != "/":
+            raise error_perm("550 Not a directory")
+        self.cwd_path = path
+
+    def sendcmd(self, cmd):
+        self.commands.append(cmd)
+        if cmd.startswith("MDTM "):
+            return "213 20240101000000"
+        return "211-Features:\n REST STREAM\n211 End"
+
+    def voidcmd(self, cmd):
+        self.commands.append(cmd)
+
+    def size(self, path):
+        self.commands.append(f"SIZE {path}")
+        if path not in self.files:
+            raise error_perm("550 No such file")
+        return len(self.files[path])
+
+    def retrbinary(self, cmd, callback, blocksize=8192, rest=None):
+        self.commands.append(cmd)
+        path = cmd.split(" ", 1)[1]
+        if path not in self.files:
+            raise error_perm("550 No such file")
+        callback(self.files[path])
+
+    def storbinary(self, cmd, f, blocksize=8192, callback=None, rest=None):
+        self.commands.append(cmd if rest is None else f"REST {rest} {cmd}")
+        verb, path = cmd.split(" ", 1)
+        data = f.read()
+        if verb == "APPE":
+            self.files[path] = self.files.get(path, b"") + data
+        else:
+            self.files[path] = self.files.get(path, b"")[:rest or 0] + data
+
+    def rename(self, source, target):
+        self.commands.append(f"RNTO {target}")
+        if target in self.files and not self.overwrite:
+            raise error_perm("550 File exists")
+        self.files[target] = self.files.pop(source)
+
+    def delete(self, path):
+        self.commands.append(f"DELE {path}")
+        if path not in self.files:
+            raise error_perm("550 No such file")
+        del self.files[path]
+
+
+class TestUrls(unittest.TestCase):
+    """Test URL parsing and local file names."""
+
+    def test_ports(self):
+        self.assertEqual(parse_ftp_url("ftps://h/a/b.zip"), ("ftps", "h", 990, "/a/b.zip"))
+        self.assertEqual(parse_ftp_url("ftp://h:2121/a"), ("ftp", "h", 2121, "/a"))
+        self.assertEqual(ftp_url("ftp", "h", 21, "/a"), "ftp://h/a")
+        self.assertEqual(ftp_url("ftps", "h", 2121, "/a"), "ftps://h:2121/a")
+        self.assertEqual(ftp_url(*parse_ftp_url("ftp://[::1]:2121/a")), "ftp://[::1]:2121/a")
+
+    def test_local_paths_keep_folders_apart(self):
+        folder = os.path.join("tmp", "out")
+        self.assertEqual(
+            local_paths(["/a/x.zip", "/b/x.zip", "/a/c/y.zip"], folder),
+            [os.path.join(folder, "a", "x.zip"), os.path.join(folder, "b", "x.zip"),
+             os.path.join(folder, "a", "c", "y.zip")]
+        )
+        self.assertEqual(
+            local_paths(["/d/x.zip", "/d/y.zip"], folder),
+            [os.path.join(folder, "x.zip"), os.path.join(folder, "y.zip")]
+        )
+        self.assertEqual(local_paths([], folder), [])
+
+
+class TestRanges(unittest.TestCase):
+    """Test the range bookkeeping."""
+
+    def test_split_ranges_cover_the_file(self):
+        for size, segments in [(10, 3), (1, 4), (100, 1), (7, 7), (8, 3)]:
+            ranges = split_ranges(size, segments)
+            self.assertLessEqual(len(ranges), segments)
+            self.assertEqual(sum(length for _, length in ranges), size)
+            self.assertEqual([offset for offset, _ in ranges],
+                             [sum(length for _, length in ranges[:i]) for i in range(len(ranges))])
+
+    def test_split_ranges_empty(self):
+        self.assertEqual(split_ranges(0, 4), [])
+
+    def test_contiguous_prefix(self):
+        self.assertEqual(contiguous_prefix([[0, 10, 10], [10, 10, 4], [20, 10, 10]]), 14)
+        self.assertEqual(contiguous_prefix([[0, 10, 3], [10, 10, 10]]), 3)
+        self.assertEqual(contiguous_prefix([[0, 10, 10], [10, 10, 10]]), 20)
+
+
+class TestSegmentedDownload(unittest.TestCase):
+    """Test download_segmented against a fake server."""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_digest_without_second_pass(self):
+        data = os.urandom(300 * 1024 + 7)
+        local_path = os.path.join(self.folder, "x.bin")
+
+        with mock.patch.object(ftp_utils, "hash_file", side_effect=AssertionError("file read twice")):
+            digest = download_segmented(
+                lambda: FakeFTP(data), "/x.bin", len(data), local_path, 4, blocksize=4096, hash_name="sha256"
+            )
+
+        with open(local_path, "rb") as f:
+            self.assertEqual(f.read(), data)
+        self.assertEqual(digest, hashlib.sha256(data).hexdigest())
+
+    def test_failed_download_leaves_no_file(self):
+        data = b"abc" * 1000
+        local_path = os.path.join(self.folder, "x.bin")
+
+        def connect():
+            ftp = FakeFTP(data)
+            ftp.transfercmd = mock.Mock(side_effect=EOFError("connection lost"))
+            return ftp
+
+        with self.assertRaises(EOFError):
+            download_segmented(connect, "/x.bin", len(data), local_path, 3)
+        self.assertFalse(os.path.exists(local_path))
+
+    def test_no_digest_without_hash(self):
+        data = b"abc" * 1000
+        local_path = os.path.join(self.folder, "x.bin")
+        self.assertIsNone(download_segmented(lambda: FakeFTP(data), "/x.bin", len(data), local_path, 3))
+
+
+class TestCommands(unittest.TestCase):
+    """Test the commands sent for listings, uploads and retries."""
+
+    def nlst_server(self):
+        return CommandFTP({"/data/a.zip": b"abc", "/data/sub/b.zip": b"b"}, folders={"/data", "/data/sub"})
+
+    def test_nlst_fallback_is_one_listing(self):
+        ftp = self.nlst_server()
+        self.assertEqual(list_remote(ftp, "/data"), [
+            ("a.zip", {"type": "unknown", "size": None, "modify": None}),
+            ("sub", {"type": "unknown", "size": None, "modify": None}),
+        ])
+        self.assertEqual(ftp.commands, ["MLSD /data", "NLST /data", "TYPE I"])
+
+    def test_probe_remote(self):
+        self.assertEqual(probe_remote(self.nlst_server(), "/data"), [
+            ("a.zip", {"type": "file", "size": 3, "modify": "20240101000000"}),
+            ("sub", {"type": "dir", "size": None, "modify": None}),
+        ])
+
+    def test_walk_and_glob_skip_folders(self):
+        ftp = self.nlst_server()
+        self.assertEqual([p for p, _ in walk_remote(ftp, "/data")], ["/data/a.zip", "/data/sub/b.zip"])
+        self.assertEqual(expand_remote(ftp, ["/data/*"]), ["/data/a.zip"])
+
+    def upload(self, ftp, data=b"abcdef"):
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder, True)
+        local_path = os.path.join(folder, "x.zip")
+        with open(local_path, "wb") as f:
+            f.write(data)
+        upload_file(ftp, local_path, "/up/x.zip")
+        self.assertEqual(ftp.files, {"/up/x.zip": data})
+        return local_path
+
+    def test_upload_renames_over_the_old_file(self):
+        ftp = CommandFTP({"/up/x.zip": b"old"})
+        self.upload(ftp)
+        self.assertNotIn("DELE /up/x.zip", ftp.commands)
+
+    def test_upload_deletes_only_when_refused(self):
+        ftp = CommandFTP({"/up/x.zip": b"old"}, overwrite=False)
+        self.upload(ftp)
+        self.assertIn("DELE /up/x.zip", ftp.commands)
+        self.assertEqual(ftp.commands.count("RNTO /up/x.zip"), 2)
+
+    def test_upload_restarts_a_foreign_part_file(self):
+        # A .part left by an upload of another version, without a journal
+        ftp = CommandFTP({"/up/x.zip.part": b"OLDOLD"})
+        self.upload(ftp, b"new content")
+        self.assertIn("STOR /up/x.zip.part", ftp.commands)
+
+    def test_upload_resumes_its_own_part_file(self):
+        ftp = CommandFTP()
+        local_path = self.upload(ftp, b"new content")
+        stat = os.stat(local_path)
+        journal = json.dumps({"size": stat.st_size, "mtime": stat.st_mtime_ns}).encode()
+
+        ftp = CommandFTP({"/up/x.zip.part": b"new ", "/up/x.zip.part.json": journal})
+        with open(local_path, "rb") as f:
+            data = f.read()
+        upload_file(ftp, local_path, "/up/x.zip")
+        self.assertEqual(ftp.files, {"/up/x.zip": data})
+        self.assertIn("REST 4 STOR /up/x.zip.part", ftp.commands)
+
+    def test_cancel_during_backoff(self):
+        feedback = mock.Mock()
+        feedback.isCanceled.side_effect = [False, True]
+
+        def connect():
+            raise EOFError("connection lost")
+
+        with mock.patch.object(ftp_utils.time, "sleep") as sleep:
+            with self.assertRaises(TransferCanceled):
+                download_resumable(
+                    connect, "/x.zip", os.path.join(tempfile.gettempdir(), "x.zip"),
+                    retries=3, backoff=60, feedback=feedback
+                )
+        self.assertEqual(sleep.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
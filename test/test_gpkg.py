@@ -0,0 +1,170 @@
+# coding=utf-8
+"""Tests for the GeoPackage merge and R-tree helpers."""
+
+import os
+import shutil
+import sqlite3
+import struct
+import tempfile
+import unittest
+
+from ETL.gpkg_index import bbox_filter, geometry_table, geometry_tables
+from ETL.gpkg_merge import GpkgMerger
+
+
+def point_blob(x, y):
+    """A GeoPackage point geometry blob without envelope."""
+    return b"GP\x00\x01" + struct.pack("<i", 25832) + struct.pack("<BIdd", 1, 1, x, y)
+
+
+def make_gpkg(path, tables, rtree=True):
+    """A minimal GeoPackage with one point table per {name: [(x, y)]}."""
+    db = sqlite3.connect(path)
+    db.executescript("""
+        PRAGMA application_id=1196444487;
+        PRAGMA user_version=10400;
+        CREATE TABLE gpkg_spatial_ref_sys (
+            srs_name TEXT NOT NULL, srs_id INTEGER NOT NULL PRIMARY KEY, organization TEXT NOT NULL,
+            organization_coordsys_id INTEGER NOT NULL, definition TEXT NOT NULL, description TEXT
+        );
+        INSERT INTO gpkg_spatial_ref_sys VALUES ('ETRS89 / UTM zone 32N', 25832, 'EPSG', 25832, 'PROJCS[]', NULL);
+        CREATE TABLE gpkg_contents (
+            table_name TEXT NOT NULL PRIMARY KEY, data_type TEXT NOT NULL, identifier TEXT UNIQUE,
+            description TEXT DEFAULT '', last_change DATETIME, min_x DOUBLE, min_y DOUBLE,
+            max_x DOUBLE, max_y DOUBLE, srs_id INTEGER
+        );
+        CREATE TABLE gpkg_geometry_columns (
+            table_name TEXT NOT NULL, column_name TEXT NOT NULL, geometry_type_name TEXT NOT NULL,
+            srs_id INTEGER NOT NULL, z TINYINT NOT NULL, m TINYINT NOT NULL,
+            PRIMARY KEY (table_name, column_name)
+        );
+    """)
+    for table, points in tables.items():
+        db.execute(f'CREATE TABLE "{table}" (fid INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, geom POINT, kode INTEGER)')
+        db.execute(f'CREATE INDEX "{table}_kode_idx" ON "{table}"(kode)')
+        db.execute(
+            "INSERT INTO gpkg_contents (table_name, data_type, identifier, srs_id) VALUES (?, 'features', ?, 25832)",
+            (table, table)
+        )
+        db.execute("INSERT INTO gpkg_geometry_columns VALUES (?, 'geom', 'POINT', 25832, 0, 0)", (table,))
+        db.executemany(
+            f'INSERT INTO "{table}" VALUES (?, ?, ?)',
+            [(i, point_blob(x, y), i % 3) for i, (x, y) in enumerate(points, 1)]
+        )
+        if rtree:
+            db.execute(f'CREATE VIRTUAL TABLE "rtree_{table}_geom" USING rtree(id, minx, maxx, miny, maxy)')
+            db.executemany(
+                f'INSERT INTO "rtree_{table}_geom" VALUES (?, ?, ?, ?, ?)',
+                [(i, x, x, y, y) for i, (x, y) in enumerate(points, 1)]
+            )
+    db.commit()
+    db.close()
+
+
+class GpkgTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def path(self, name):
+        return os.path.join(self.folder, name)
+
+
+class TestGpkgIndex(GpkgTestCase):
+    """Test reading feature tables and filtering on their R-trees."""
+
+    def test_geometry_tables(self):
+        make_gpkg(self.path("a.gpkg"), {"Skov": [(1, 1)]})
+        make_gpkg(self.path("b.gpkg"), {"Soe": [(1, 1)]}, rtree=False)
+
+        self.assertEqual(geometry_tables(self.path("a.gpkg")), [("Skov", "geom", "fid", True)])
+        self.assertEqual(geometry_table(self.path("b.gpkg"), "soe"), ("Soe", "geom", "fid", False))
+        self.assertIsNone(geometry_table(self.path("b.gpkg"), "Skov"))
+
+    def test_not_a_geopackage(self):
+        with open(self.path("x.gpkg"), "wb") as f:
+            f.write(b"not sqlite" * 100)
+        with self.assertRaises(sqlite3.DatabaseError):
+            geometry_tables(self.path("x.gpkg"))
+
+    def test_bbox_filter(self):
+        points = [(x, y) for x in range(10) for y in range(10)]
+        make_gpkg(self.path("a.gpkg"), {"Skov": points})
+
+        where = bbox_filter("Skov", "geom", "fid", 2.5, 3, 4.5, 3.5)
+        db = sqlite3.connect(self.path("a.gpkg"))
+        try:
+            fids = [row[0] for row in db.execute(f'SELECT fid FROM "Skov" WHERE {where} ORDER BY fid')]
+        finally:
+            db.close()
+
+        self.assertEqual([points[fid - 1] for fid in fids], [(3, 3), (4, 3)])
+
+
+class TestGpkgMerger(GpkgTestCase):
+    """Test merging GeoPackages into one snapshot."""
+
+    def test_merge(self):
+        make_gpkg(self.path("a.gpkg"), {"Skov": [(1, 2), (3, 4)]})
+        make_gpkg(self.path("b.gpkg"), {"Soe": [(5, 6)]}, rtree=False)
+        target = self.path("merged.gpkg")
+
+        merger = GpkgMerger(target)
+        self.assertEqual(merger.add(self.path("a.gpkg")), ["Skov"])
+        self.assertEqual(merger.add(self.path("b.gpkg")), ["Soe"])
+        self.assertFalse(os.path.exists(target))
+        merger.close()
+
+        self.assertFalse(os.path.exists(target + ".part"))
+        db = sqlite3.connect(target)
+        try:
+            self.assertEqual(db.execute("PRAGMA application_id").fetchone()[0], 0x47504B47)
+            self.assertEqual(db.execute("PRAGMA user_version").fetchone()[0], 10400)
+            self.assertEqual(db.execute("PRAGMA journal_mode").fetchone()[0], "delete")
+            self.assertEqual(db.execute('SELECT count(*) FROM "Skov"').fetchone()[0], 2)
+            self.assertEqual(db.execute('SELECT geom FROM "Soe"').fetchone()[0], point_blob(5, 6))
+            self.assertEqual(db.execute('SELECT count(*) FROM "rtree_Skov_geom"').fetchone()[0], 2)
+            self.assertEqual(
+                [row[0] for row in db.execute("SELECT table_name FROM gpkg_contents ORDER BY table_name")],
+                ["Skov", "Soe"]
+            )
+            self.assertEqual(db.execute("SELECT count(*) FROM gpkg_spatial_ref_sys").fetchone()[0], 1)
+            self.assertEqual(
+                db.execute("SELECT count(*) FROM sqlite_master WHERE type = 'index' AND name LIKE '%_kode_idx'")
+                .fetchone()[0],
+                2
+            )
+        finally:
+            db.close()
+        self.assertEqual(geometry_table(target, "Skov"), ("Skov", "geom", "fid", True))
+
+    def test_duplicate_table(self):
+        make_gpkg(self.path("a.gpkg"), {"Skov": [(1, 2)]})
+        make_gpkg(self.path("b.gpkg"), {"Skov": [(3, 4)]})
+
+        merger = GpkgMerger(self.path("merged.gpkg"))
+        merger.add(self.path("a.gpkg"))
+        with self.assertRaises(ValueError):
+            merger.add(self.path("b.gpkg"))
+        merger.abort()
+
+    def test_abort_keeps_target(self):
+        target = self.path("merged.gpkg")
+        with open(target, "wb") as f:
+            f.write(b"old snapshot")
+        make_gpkg(self.path("a.gpkg"), {"Skov": [(1, 2)]})
+
+        merger = GpkgMerger(target)
+        merger.add(self.path("a.gpkg"))
+        merger.abort()
+
+        with open(target, "rb") as f:
+            self.assertEqual(f.read(), b"old snapshot")
+        self.assertEqual([n for n in os.listdir(self.folder) if n.startswith("merged.gpkg.part")], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+# coding=utf-8
+"""Tests for the segmented HTTP download engine."""
+
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from ETL import http_utils
+from ETL.http_utils import HTTPPool, http_download
+from ETL.unzipper import StreamExtractor
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """Serves one file with Range support, slowly, so ranges overlap."""
+
+    protocol_version = "HTTP/1.1"
+    data = b""
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        data = self.data
+        match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range") or "")
+        if match:
+            start = int(match.group(1))
+            end = int(match.group(2)) if match.group(2) else len(data) - 1
+            body = data[start:end + 1]
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+        else:
+            body = data
+            self.send_response(200)
+        self.send_header("ETag", '"v1"')
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        for i in range(0, len(body), 16 * 1024):
+            self.wfile.write(body[i:i + 16 * 1024])
+            time.sleep(0.001)
+
+
+class TestHttpDownload(unittest.TestCase):
+    """Test http_download against a local Range server."""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = f"http://127.0.0.1:{cls.server.server_port}/x.zip"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.pool = HTTPPool()
+
+    def tearDown(self):
+        self.pool.close_all()
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def serve_zip(self, size):
+        payload = os.urandom(size)
+        path = os.path.join(self.folder, "src.zip")
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+            z.writestr("x.gpkg", payload)
+        with open(path, "rb") as f:
+            RangeHandler.data = f.read()
+        return payload
+
+    def test_stream_multi_segment_download(self):
+        """The consumer gets the file in order across segment boundaries."""
+        payload = self.serve_zip(2 * 1024 * 1024)
+        streamed = bytearray()
+        extractor = StreamExtractor(os.path.join(self.folder, "out"))
+
+        def consumer(block):
+            streamed.extend(block)
+            extractor.feed(block)
+
+        # Blocks smaller than a read buffer make a reader that reads ahead
+        # pick up preallocated zeros at the segment boundaries
+        local_path = os.path.join(self.folder, "x.zip")
+        with mock.patch.object(http_utils, "MIN_SEGMENT", 256 * 1024):
+            http_download(
+                self.url, local_path, segments=4, pool=self.pool, consumer=consumer, blocksize=5000
+            )
+        extractor.close()
+
+        with open(local_path, "rb") as f:
+            self.assertEqual(bytes(streamed), f.read())
+        self.assertIsNone(extractor.error)
+        crc, size, path = extractor.extracted["x.gpkg"]
+        with open(path, "rb") as f:
+            self.assertEqual(f.read(), payload)
+
+
+    def test_digest_of_segmented_download(self):
+        """The digest matches the file when the ranges arrive out of order."""
+        self.serve_zip(1024 * 1024)
+
+        local_path = os.path.join(self.folder, "x.zip")
+        with mock.patch.object(http_utils, "MIN_SEGMENT", 128 * 1024):
+            # The digest comes from the in-order read, not a second pass
+            with mock.patch.object(http_utils, "hash_file", side_effect=AssertionError("file read twice")):
+                info = http_download(self.url, local_path, segments=4, pool=self.pool, hash_name="sha256")
+
+        self.assertEqual(info["digest"], hashlib.sha256(RangeHandler.data).hexdigest())
+
+
+if __name__ == '__main__':
+    unittest.main()
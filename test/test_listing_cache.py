@@ -0,0 +1,77 @@
+# coding=utf-8
+"""Tests for the FTP directory listing cache."""
+
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from ETL import listing_cache
+from ETL.listing_cache import ListingCache, listing_key
+
+SERVER = listing_key("ftp", "example.com", 21, "anonymous")
+ENTRIES = [("a.zip", {"type": "file", "size": 10, "modify": "20240101000000"})]
+
+
+class TestListingCache(unittest.TestCase):
+    """Test the listing time-to-live, persistence and invalidation."""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.folder, "listings.sqlite")
+        self.cache = ListingCache()
+        self.now = 1000.0
+        patcher = mock.patch.object(listing_cache.time, "time", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def test_ttl(self):
+        self.cache.put(SERVER, "/data", ENTRIES)
+        self.now += 60
+        self.assertEqual(self.cache.get(SERVER, "/data", ttl=60), ENTRIES)
+        self.now += 1
+        self.assertIsNone(self.cache.get(SERVER, "/data", ttl=60))
+        self.assertIsNone(self.cache.get(SERVER, "/other", ttl=60))
+
+    def test_persisted_across_sessions(self):
+        self.cache.put(SERVER, "/data", ENTRIES, db_path=self.db_path)
+        self.now += 30
+        self.assertEqual(ListingCache().get(SERVER, "/data", ttl=60, db_path=self.db_path), ENTRIES)
+        self.assertIsNone(ListingCache().get(SERVER, "/data", ttl=10, db_path=self.db_path))
+
+    def test_invalidate(self):
+        other = listing_key("ftp", "example.org", 21, "anonymous")
+        for server in (SERVER, other):
+            self.cache.put(server, "/data", ENTRIES, db_path=self.db_path)
+            self.cache.put(server, "/more", ENTRIES, db_path=self.db_path)
+
+        self.cache.invalidate(SERVER, "/data", db_path=self.db_path)
+        self.assertIsNone(self.cache.get(SERVER, "/data", db_path=self.db_path))
+        self.assertIsNotNone(self.cache.get(SERVER, "/more", db_path=self.db_path))
+
+        self.cache.invalidate(SERVER, db_path=self.db_path)
+        self.assertIsNone(ListingCache().get(SERVER, "/more", db_path=self.db_path))
+        self.assertIsNotNone(ListingCache().get(other, "/more", db_path=self.db_path))
+
+    def test_lister(self):
+        with mock.patch.object(listing_cache, "list_remote", return_value=ENTRIES) as list_remote:
+            lister = self.cache.lister(SERVER, ttl=60)
+            lister(None, "/data")
+            lister(None, "/data")
+            self.assertEqual(list_remote.call_count, 1)
+            self.now += 61
+            self.assertEqual(lister(None, "/data"), ENTRIES)
+            self.assertEqual(list_remote.call_count, 2)
+
+            # No TTL: every call lists
+            uncached = self.cache.lister(SERVER, ttl=0)
+            uncached(None, "/data")
+            self.assertEqual(list_remote.call_count, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+# coding=utf-8
+"""Tests for member selection and the extraction engines."""
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import zipfile
+
+from ETL.unzipper import StreamExtractor, extract_parallel, list_members, select_members
+
+
+class Unseekable(io.RawIOBase):
+    """Write-only stream, so ZipFile falls back to data descriptors."""
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.data += b
+        return len(b)
+
+
+def make_zip(members, seekable=True):
+    """Zip bytes holding {name: (data, compression)}."""
+    out = io.BytesIO() if seekable else Unseekable()
+    with zipfile.ZipFile(out, "w") as z:
+        for name, (data, compression) in members.items():
+            z.writestr(name, data, compression)
+    return out.getvalue() if seekable else bytes(out.data)
+
+
+class TestSelectMembers(unittest.TestCase):
+    """Test picking members by glob or regex."""
+
+    def setUp(self):
+        self.members = [zipfile.ZipInfo(n) for n in ("a.gml", "data/B.GML", "data/b.xsd", "readme.txt")]
+
+    def names(self, *args, **kwargs):
+        return [m.filename for m in select_members(self.members, *args, **kwargs)]
+
+    def test_glob_matches_base_name_case_insensitively(self):
+        self.assertEqual(self.names("*.gml"), ["a.gml", "data/B.GML"])
+        self.assertEqual(self.names("data/*"), ["data/B.GML", "data/b.xsd"])
+
+    def test_regex_searches_full_name(self):
+        self.assertEqual(self.names(r"^data/.*\.xsd$", regex=True), ["data/b.xsd"])
+        self.assertEqual(self.names(r"\.GML", regex=True), ["data/B.GML"])
+
+    def test_no_pattern_keeps_all(self):
+        self.assertEqual(self.names(None), [m.filename for m in self.members])
+
+
+class TestStreamExtractor(unittest.TestCase):
+    """Test extracting an archive from its bytes as they arrive."""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.members = {
+            "x.gpkg": (os.urandom(50000) + bytes(200000), zipfile.ZIP_DEFLATED),
+            "sub/y.txt": (b"hello " * 1000, zipfile.ZIP_STORED),
+            "empty.txt": (b"", zipfile.ZIP_DEFLATED),
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def stream(self, data, piece=777):
+        extractor = StreamExtractor(self.folder, chunk_size=4096)
+        for i in range(0, len(data), piece):
+            extractor.feed(data[i:i + piece])
+        extractor.close()
+        return extractor
+
+    def check_extracted(self, extractor, names):
+        self.assertIsNone(extractor.error)
+        self.assertEqual(sorted(extractor.extracted), sorted(names))
+        for name in names:
+            _, size, path = extractor.extracted[name]
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), self.members[name][0])
+            self.assertEqual(size, len(self.members[name][0]))
+
+    def test_stream_in_small_pieces(self):
+        extractor = self.stream(make_zip(self.members))
+        self.assertTrue(extractor.finished)
+        self.check_extracted(extractor, list(self.members))
+
+    def test_data_descriptors(self):
+        del self.members["sub/y.txt"]
+        extractor = self.stream(make_zip(self.members, seekable=False))
+        self.check_extracted(extractor, list(self.members))
+
+    def test_stored_member_with_descriptor_is_left_over(self):
+        extractor = self.stream(make_zip(self.members, seekable=False))
+        self.assertIsInstance(extractor.error, ValueError)
+        self.assertNotIn("sub/y.txt", extractor.extracted)
+        leftovers = [n for _, _, files in os.walk(self.folder) for n in files if n.endswith(".part")]
+        self.assertEqual(leftovers, [])
+
+    def test_corrupt_member_fails_crc(self):
+        data = bytearray(make_zip({"a.txt": (b"abc" * 100, zipfile.ZIP_STORED)}))
+        data[60] ^= 0xFF
+        extractor = self.stream(bytes(data))
+        self.assertIsInstance(extractor.error, ValueError)
+        self.assertEqual(extractor.extracted, {})
+
+
+class TestExtractParallel(unittest.TestCase):
+    """Test the thread pool extraction."""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def write_zip(self, data):
+        path = os.path.join(self.folder, "a.zip")
+        with open(path, "wb") as f:
+            f.write(data)
+        return path
+
+    def test_extract_in_member_order(self):
+        members = {f"d/{i}.bin": (os.urandom(1000 * i), zipfile.ZIP_DEFLATED) for i in range(1, 6)}
+        zip_path = self.write_zip(make_zip(members))
+
+        infos = list_members(zip_path)
+        paths = extract_parallel(zip_path, infos, os.path.join(self.folder, "out"), workers=3, chunk_size=512)
+
+        for info, path in zip(infos, paths):
+            with open(path, "rb") as f:
+                self.assertEqual(f.read(), members[info.filename][0])
+
+    def test_unreadable_member_is_bad_zip(self):
+        # Mark the member as encrypted in both headers; zipfile cannot read it
+        data = bytearray(make_zip({"x.txt": (b"secret", zipfile.ZIP_STORED)}))
+        data[6] |= 0x1
+        data[data.index(b"PK\x01\x02") + 8] |= 0x1
+        zip_path = self.write_zip(bytes(data))
+
+        with self.assertRaises(zipfile.BadZipFile):
+            extract_parallel(zip_path, list_members(zip_path), os.path.join(self.folder, "out"))
+        self.assertFalse(os.path.exists(os.path.join(self.folder, "out", "x.txt.part")))
+
+
+if __name__ == '__main__':
+    unittest.main()
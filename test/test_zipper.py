@@ -0,0 +1,122 @@
+# coding=utf-8
+"""Tests for the streaming parallel zip writer."""
+
+import io
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+import zipfile
+from unittest import mock
+
+from ETL import zipper
+from ETL.zipper import ZIP_DEFLATED, ZIP_STORED, ZIP_ZSTANDARD, ZipStreamWriter, zip_files
+
+
+class TestZipFiles(unittest.TestCase):
+    """Test that archives written by zip_files() read back intact."""
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+    def make_files(self):
+        contents = {
+            "a.gpkg": os.urandom(50 * 1024) + b"a" * 200 * 1024,
+            "sub/b.txt": b"line\n" * 10000,
+            "empty.txt": b"",
+        }
+        files = []
+        for arcname, data in contents.items():
+            path = os.path.join(self.folder, arcname.replace("/", "_"))
+            with open(path, "wb") as f:
+                f.write(data)
+            files.append((path, arcname))
+        return files, contents
+
+    def round_trip(self, method):
+        files, contents = self.make_files()
+        output = os.path.join(self.folder, "out.zip")
+        zip_files(files, output, method=method, workers=3, chunk_size=16 * 1024)
+
+        self.assertFalse(os.path.exists(output + zipper.PART_SUFFIX))
+        with zipfile.ZipFile(output) as z:
+            self.assertIsNone(z.testzip())
+            self.assertEqual(z.namelist(), list(contents))
+            for name, data in contents.items():
+                self.assertEqual(z.read(name), data)
+
+    def test_deflate_round_trip(self):
+        self.round_trip(ZIP_DEFLATED)
+
+    def test_stored_round_trip(self):
+        self.round_trip(ZIP_STORED)
+
+    @unittest.skipUnless(zipper.zstandard, "needs the zstandard package")
+    def test_zstandard_members(self):
+        files, contents = self.make_files()
+        output = os.path.join(self.folder, "out.zip")
+        zip_files(files, output, method=ZIP_ZSTANDARD, workers=3, chunk_size=16 * 1024)
+
+        with open(output, "rb") as f, zipfile.ZipFile(output) as z:
+            for info in z.infolist():
+                self.assertEqual(info.compress_type, ZIP_ZSTANDARD)
+                # The chunks are separate frames after the local header
+                f.seek(info.header_offset + 26)
+                name_length, extra_length = struct.unpack("<HH", f.read(4))
+                f.seek(name_length + extra_length, os.SEEK_CUR)
+                frames = io.BytesIO(f.read(info.compress_size))
+                reader = zipper.zstandard.ZstdDecompressor().stream_reader(frames, read_across_frames=True)
+                self.assertEqual(reader.read(), contents[info.filename])
+
+    def test_failed_write_leaves_no_part_file(self):
+        files, _ = self.make_files()
+        output = os.path.join(self.folder, "out.zip")
+        with mock.patch.object(zipper, "compress_chunk", side_effect=MemoryError):
+            with self.assertRaises(MemoryError):
+                zip_files(files, output)
+        self.assertFalse(os.path.exists(output))
+        self.assertFalse(os.path.exists(output + zipper.PART_SUFFIX))
+
+
+class TestZip64(unittest.TestCase):
+    """Test the Zip64 records, with the limit lowered so the archive stays small."""
+
+    def write(self, members):
+        out = io.BytesIO()
+        writer = ZipStreamWriter(out)
+        for name, data in members:
+            writer.start(name, ZIP_STORED, 0, len(data))
+            writer.write(data)
+            writer.finish(zipfile.crc32(data), len(data), len(data))
+        writer.close()
+        return out
+
+    def test_large_members_and_offsets(self):
+        members = [("a.bin", os.urandom(3000)), ("b.bin", os.urandom(3000)), ("c.bin", b"small")]
+        with mock.patch.object(zipper, "ZIP64_LIMIT", 1000):
+            out = self.write(members)
+
+        data = out.getvalue()
+        self.assertIn(struct.pack("<I", 0x06064B50), data)
+        with zipfile.ZipFile(out) as z:
+            self.assertIsNone(z.testzip())
+            self.assertEqual([(i.filename, z.read(i)) for i in z.infolist()], members)
+
+    def test_small_archive_has_no_zip64_records(self):
+        data = self.write([("a.bin", b"abc")]).getvalue()
+        self.assertNotIn(struct.pack("<I", 0x06064B50), data)
+
+    def test_member_growing_past_the_limit(self):
+        writer = ZipStreamWriter(io.BytesIO())
+        with mock.patch.object(zipper, "ZIP64_LIMIT", 1000):
+            writer.start("a.bin", ZIP_DEFLATED, 0, 10)
+            with self.assertRaises(OverflowError):
+                writer.finish(0, 5000, 5000)
+
+
+if __name__ == '__main__':
+    unittest.main()